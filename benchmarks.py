@@ -0,0 +1,893 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the hot paths of the KI-Assistent.
+
+Runs fully offline. Usage:
+    python benchmarks.py                 # run all benchmarks
+    python benchmarks.py keyword_matcher # run selected benchmarks
+    python benchmarks.py --json results.json hot_paths
+    python benchmarks.py --compare baseline.json hot_paths
+
+Every benchmark prints a table and returns a flat dict of metrics; --json
+writes them together with the git commit, --compare prints the change of
+each metric against an earlier --json file.
+"""
+
+import os
+import sys
+import time
+import random
+import string
+import subprocess
+import json
+import argparse
+import platform
+import datetime
+import itertools
+
+from main import SimpleResponseGenerator
+
+
+SAMPLE_MESSAGES = [
+    "Hallo, wie geht es dir?",
+    "Kannst du mir etwas über Python erzählen?",
+    "Wie spät ist es eigentlich gerade?",
+    "Ich möchte gern wissen, was künstliche Intelligenz ist",
+    "Erzähl mir bitte eine Geschichte über einen Drachen und eine Prinzessin",
+    "Das ist eine sehr lange Nachricht ohne ein einziges bekanntes Stichwort, "
+    "die nur dazu dient, den ungünstigsten Fall eines vollständigen Durchlaufs zu messen",
+]
+
+
+def _time_per_call(func, inputs, repeat):
+    """Returns the mean wall time per call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            func(item)
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(inputs)) * 1e6
+
+
+def _naive_lookup(generator, user_text):
+    """The former per-keyword substring scan, kept as a baseline."""
+    user_text_lower = user_text.lower()
+    for category, keywords in generator.keywords.items():
+        for keyword in keywords:
+            if keyword in user_text_lower:
+                return category
+    for topic in generator.extended_responses:
+        if topic in user_text_lower:
+            return topic
+    return None
+
+
+def _matcher_lookup(generator, user_text):
+    """Lookup through the compiled matcher."""
+    return generator.matcher.best_match(user_text.lower())
+
+
+def bench_keyword_matcher(repeat=200):
+    """Per-message lookup cost as the keyword tables grow."""
+    rng = random.Random(42)
+    print("keyword_matcher: mean cost per message (µs)")
+    print(f"{'keywords':>10} {'naive':>12} {'matcher':>12}")
+    results = {}
+    for extra in (0, 100, 1000, 5000, 20000):
+        generator = SimpleResponseGenerator()
+        generator.keywords["synthetic"] = [
+            "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 14)))
+            for _ in range(extra)
+        ]
+        generator.build_matcher()
+        total = len(generator.matcher)
+        # Sanity check: both lookups must agree on every message
+        for message in SAMPLE_MESSAGES:
+            hit = _matcher_lookup(generator, message)
+            expected = _naive_lookup(generator, message)
+            assert (hit.payload[1] if hit else None) == expected, message
+        naive = _time_per_call(lambda m: _naive_lookup(generator, m), SAMPLE_MESSAGES, repeat)
+        matcher = _time_per_call(lambda m: _matcher_lookup(generator, m), SAMPLE_MESSAGES, repeat)
+        print(f"{total:>10} {naive:>12.1f} {matcher:>12.1f}")
+        results[f"naive_us_{extra}"] = naive
+        results[f"matcher_us_{extra}"] = matcher
+    return results
+
+
+# Runs in a fresh interpreter so module caches don't hide the import cost
+STARTUP_SCRIPT = """
+import main
+if main.GUI_AVAILABLE:
+    app = main.QApplication([])
+    window = main.KI_Assistent()
+    window.show()
+    main.QTimer.singleShot(0, app.quit)
+    app.exec_()
+    window.close()
+print(main.IMPORT_SECONDS, main.log_startup_timing("benchmark"))
+"""
+
+
+def bench_startup(repeat=5):
+    """Import time and time to interactive of a fresh process."""
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    imports, interactive = [], []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], env=env, check=True,
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.split()
+        imports.append(float(output[-2]))
+        interactive.append(float(output[-1]))
+    print("startup: best of", repeat, "runs (ms)")
+    print(f"{'import':>22} {min(imports) * 1000:>8.1f}")
+    print(f"{'time to interactive':>22} {min(interactive) * 1000:>8.1f}")
+    return {"import_ms": min(imports) * 1000, "interactive_ms": min(interactive) * 1000}
+
+
+def build_tiny_model(torch_dtype=None, seed=0, num_layers=4, hidden_size=256, checkpoint=True):
+    """
+    Builds a small randomly initialised GPT-NeoX (the pythia architecture) so
+    the model benchmarks need no downloads. If KI_BENCH_MODEL names a local
+    checkpoint, that is loaded instead for real numbers (unless checkpoint is False).
+    """
+    import torch
+    import main
+    main._import_transformers()
+    from transformers import AutoModelForCausalLM, GPTNeoXConfig
+
+    torch_dtype = torch_dtype or torch.float32
+    if checkpoint and os.environ.get("KI_BENCH_MODEL"):
+        return AutoModelForCausalLM.from_pretrained(
+            os.environ["KI_BENCH_MODEL"], torch_dtype=torch_dtype, local_files_only=True
+        ).eval()
+    torch.manual_seed(seed)
+    config = GPTNeoXConfig(
+        vocab_size=2048, hidden_size=hidden_size, num_hidden_layers=num_layers,
+        num_attention_heads=4, intermediate_size=hidden_size * 4, max_position_embeddings=1024
+    )
+    return AutoModelForCausalLM.from_config(config, torch_dtype=torch_dtype).eval()
+
+
+def build_tiny_tokenizer():
+    """Trains a byte-level BPE tokenizer on the assistant's own texts."""
+    import main
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import AutoTokenizer, PreTrainedTokenizerFast
+
+    if os.environ.get("KI_BENCH_MODEL"):
+        return AutoTokenizer.from_pretrained(os.environ["KI_BENCH_MODEL"], local_files_only=True)
+    simple = main.SimpleResponseGenerator()
+    corpus = [main.TransformerResponseGenerator.SYSTEM_PROMPT, *SAMPLE_MESSAGES]
+    corpus += [template.source for templates in simple.responses.values() for template in templates]
+    corpus += list(simple.extended_responses.values())
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=2000, special_tokens=["<|endoftext|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    ))
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|endoftext|>")
+
+
+def build_tiny_generator(**model_kwargs):
+    """A TransformerResponseGenerator around the tiny model and tokenizer."""
+    import main
+    return main.TransformerResponseGenerator(
+        model=build_tiny_model(**model_kwargs), tokenizer=build_tiny_tokenizer()
+    )
+
+
+PRECISION_SCRIPT = """
+import sys, json, time, resource
+import torch
+import main
+from benchmarks import build_tiny_model
+main._import_transformers()
+precision = main.resolve_cpu_precision(sys.argv[1])
+model = build_tiny_model(torch.bfloat16 if precision == "bfloat16" else torch.float32)
+if precision == "int8":
+    model = main.quantize_linear_layers(model)
+torch.manual_seed(1)
+input_ids = torch.randint(0, 2000, (1, 48))
+new_tokens = int(sys.argv[2])
+with torch.no_grad():
+    model.generate(input_ids, max_new_tokens=4, do_sample=False)  # warm-up
+    start = time.perf_counter()
+    output = model.generate(input_ids, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False)
+    elapsed = time.perf_counter() - start
+print(json.dumps({
+    "precision": precision,
+    "tokens_per_sec": new_tokens / elapsed,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "tokens": output[0, input_ids.shape[1]:].tolist()
+}))
+"""
+
+
+def _run_torch_script(script, *args):
+    """Runs a torch benchmark script in a fresh process and parses its JSON output."""
+    output = subprocess.run(
+        [sys.executable, "-c", script, *map(str, args)], check=True,
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_precision(new_tokens=64):
+    """Tokens/sec, peak RSS and greedy output agreement per CPU precision."""
+    import main
+    if not main.TRANSFORMERS_AVAILABLE:
+        print("precision: skipped, torch/transformers not installed")
+        return {}
+    results = [_run_torch_script(PRECISION_SCRIPT, precision, new_tokens) for precision in main.CPU_PRECISIONS]
+    baseline = results[0]["tokens"]
+    print("precision: greedy decoding of", new_tokens, "tokens on CPU")
+    print(f"{'requested':>10} {'used':>10} {'tokens/s':>10} {'peak RSS MB':>12} {'agreement':>10}")
+    metrics = {}
+    for requested, result in zip(main.CPU_PRECISIONS, results):
+        agreement = sum(a == b for a, b in zip(baseline, result["tokens"])) / len(baseline)
+        print(f"{requested:>10} {result['precision']:>10} {result['tokens_per_sec']:>10.1f} "
+              f"{result['peak_rss_mb']:>12.0f} {agreement:>10.0%}")
+        metrics[f"tokens_per_sec_{requested}"] = result["tokens_per_sec"]
+        metrics[f"peak_rss_mb_{requested}"] = result["peak_rss_mb"]
+        metrics[f"agreement_{requested}"] = agreement
+    return metrics
+
+
+def _percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _run_requesters(generate, requesters, requests_per_requester):
+    """Runs concurrent requester threads; returns (requests/s, latencies in s)."""
+    import threading
+    latencies = []
+    lock = threading.Lock()
+
+    def requester(index):
+        for number in range(requests_per_requester):
+            start = time.perf_counter()
+            generate(SAMPLE_MESSAGES[(index + number) % len(SAMPLE_MESSAGES)])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=requester, args=(index,)) for index in range(requesters)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) / (time.perf_counter() - start), latencies
+
+
+def bench_batching(requests_per_requester=4, max_new_tokens=32):
+    """Throughput and latency with and without the micro-batching scheduler."""
+    import threading
+    import main
+    if not main.TRANSFORMERS_AVAILABLE:
+        print("batching: skipped, torch/transformers not installed")
+        return {}
+    generator = build_tiny_generator()
+    generator.max_length = max_new_tokens
+
+    # Baseline: every request runs alone; the lock stands in for the
+    # serialization concurrent callers get on shared weights
+    model_lock = threading.Lock()
+
+    def unbatched(text):
+        with model_lock:
+            return generator.generate_batch([text])[0]
+
+    print("batching: tiny model,", max_new_tokens, "new tokens per request")
+    print(f"{'requesters':>10} {'mode':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'batches':>8}")
+    metrics = {}
+    for requesters in (1, 4, 16):
+        scheduler = main.BatchScheduler(generator, max_batch_size=16)
+        for mode, generate in (("single", unbatched), ("batched", scheduler.generate_response)):
+            throughput, latencies = _run_requesters(generate, requesters, requests_per_requester)
+            batches = scheduler.batches if mode == "batched" else len(latencies)
+            print(f"{requesters:>10} {mode:>10} {throughput:>8.2f} {_percentile(latencies, 0.5) * 1000:>8.0f} "
+                  f"{_percentile(latencies, 0.95) * 1000:>8.0f} {batches:>8}")
+            metrics[f"{mode}_req_per_sec_{requesters}"] = throughput
+            metrics[f"{mode}_p95_ms_{requesters}"] = _percentile(latencies, 0.95) * 1000
+        scheduler.close()
+    return metrics
+
+
+def _chat_window(main):
+    """A KI_Assistent that doesn't start the model loader."""
+    # Measure the chat display only, not the model warm-up
+    transformers_available = main.TRANSFORMERS_AVAILABLE
+    main.TRANSFORMERS_AVAILABLE = False
+    try:
+        return main.KI_Assistent()
+    finally:
+        main.TRANSFORMERS_AVAILABLE = transformers_available
+
+
+def bench_chat_render(messages_per_step=200):
+    """Per-message GUI rendering cost as the scrollback grows (offscreen Qt)."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import main
+    if not main.GUI_AVAILABLE:
+        print("chat_render: skipped, PyQt5 not installed")
+        return {}
+    app = main.QApplication.instance() or main.QApplication([])
+    window = _chat_window(main)
+    print("chat_render: mean cost per user message + placeholder + answer (µs)")
+    print(f"{'scrollback':>10} {'cost':>10}")
+    metrics = {}
+    for step in range(5):
+        scrollback = window.chat_display.document().blockCount()
+        start = time.perf_counter()
+        for number in range(messages_per_step):
+            window.add_user_message(SAMPLE_MESSAGES[number % len(SAMPLE_MESSAGES)])
+            window.add_system_message("Ich denke nach...", temp=True, request_id=number)
+            window.on_response_ready(number, SAMPLE_MESSAGES[-1])
+        elapsed = time.perf_counter() - start
+        print(f"{scrollback:>10} {elapsed / messages_per_step * 1e6:>10.0f}")
+        metrics[f"cost_us_step_{step}"] = elapsed / messages_per_step * 1e6
+        # Grow the scrollback cheaply between measurements
+        for number in range(2000):
+            window.add_assistant_message(SAMPLE_MESSAGES[number % len(SAMPLE_MESSAGES)])
+    window.close()
+    app.processEvents()
+    return metrics
+
+
+SCROLLBACK_SCRIPT = """
+import os, sys, json, resource
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+import main
+from benchmarks import SAMPLE_MESSAGES
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Measure the chat display only, not the model warm-up
+main.TRANSFORMERS_AVAILABLE = False
+app = main.QApplication([])
+window = main.KI_Assistent()
+samples = []
+total, step = int(sys.argv[1]), int(sys.argv[2])
+for number in range(total):
+    if number % 2:
+        window.add_assistant_message(SAMPLE_MESSAGES[number % len(SAMPLE_MESSAGES)] * 3)
+    else:
+        window.add_user_message(SAMPLE_MESSAGES[number % len(SAMPLE_MESSAGES)])
+    if (number + 1) % step == 0:
+        app.processEvents()
+        samples.append(rss_mb())
+window.close()
+print(json.dumps(samples))
+"""
+
+
+def bench_scrollback_memory(total=10000, step=1000):
+    """RSS while the GUI receives 10k messages, with and without the display cap."""
+    import main
+    if not main.GUI_AVAILABLE:
+        print("scrollback_memory: skipped, PyQt5 not installed")
+        return {}
+    runs = {}
+    for label, cap in (("capped", str(main.GUI_MAX_MESSAGES)), ("uncapped", str(10 ** 9))):
+        env = dict(os.environ, QT_QPA_PLATFORM="offscreen", KI_ASSISTENT_MAX_MESSAGES=cap,
+                   KI_ASSISTENT_MAX_HISTORY=cap)
+        output = subprocess.run(
+            [sys.executable, "-c", SCROLLBACK_SCRIPT, str(total), str(step)], env=env, check=True,
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout
+        runs[label] = json.loads(output.strip().splitlines()[-1])
+    print("scrollback_memory: RSS in MB after n messages")
+    print(f"{'messages':>10} {'capped':>10} {'uncapped':>10}")
+    for index, (capped, uncapped) in enumerate(zip(runs["capped"], runs["uncapped"])):
+        print(f"{(index + 1) * step:>10} {capped:>10.1f} {uncapped:>10.1f}")
+    return {"capped_rss_mb": runs["capped"][-1], "uncapped_rss_mb": runs["uncapped"][-1]}
+
+
+def bench_transcript_search(sizes=(1000, 10000, 100000), queries=("python", "drach", "intelligenz prinz")):
+    """Insert and search latency of the transcript store as it grows."""
+    import tempfile
+    from main import TranscriptStore
+    print("transcript_search: write-behind insert and full-text search")
+    print(f"{'messages':>10} {'insert/s':>12} {'search ms':>10}")
+    metrics = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            store = TranscriptStore(os.path.join(directory, "transcripts.db"))
+            start = time.perf_counter()
+            for number in range(size):
+                role = "assistant" if number % 2 else "user"
+                store.record(f"session-{number // 50}", role, SAMPLE_MESSAGES[number % len(SAMPLE_MESSAGES)])
+            store.flush()
+            insert_rate = size / (time.perf_counter() - start)
+            search_ms = _time_per_call(lambda query: store.search(query, limit=10), queries, 20) / 1000
+            store.close()
+        print(f"{size:>10} {insert_rate:>12.0f} {search_ms:>10.2f}")
+        metrics[f"insert_per_sec_{size}"] = insert_rate
+        metrics[f"search_ms_{size}"] = search_ms
+    return metrics
+
+
+HOT_PATH_INPUTS = SAMPLE_MESSAGES + [
+    "öffne notepad",
+    "gehe zu www.python.org",
+    "suche nach wetter in berlin",
+    "verlauf python",
+    "hilfe",
+]
+
+RAW_GENERATIONS = [
+    "Python ist eine Programmiersprache. Python ist eine Programmiersprache. Sie ist beliebt",
+    "Das Wetter ist heute schön. In English: The weather is nice today.",
+    "Künstliche Intelligenz bezeichnet Systeme, die lernen. Sie lernen aus Daten. Sie lernen aus Daten.",
+    " ".join(SAMPLE_MESSAGES) * 3,
+]
+
+
+def bench_hot_paths(repeat=2000):
+    """Mean cost of the per-message text paths that run without a model (µs)."""
+    import main
+    simple = main.SimpleResponseGenerator()
+    # The post-processing is plain string work and needs no loaded model
+    transformer = object.__new__(main.TransformerResponseGenerator)
+    cases = [
+        ("parse_command", main.parse_command, HOT_PATH_INPUTS),
+        ("clean_response", main.clean_response, RAW_GENERATIONS),
+        ("simple_generate_response", simple.generate_response, HOT_PATH_INPUTS),
+        ("post_process_response", transformer._post_process_response, RAW_GENERATIONS),
+    ]
+    print("hot_paths: mean cost per call (µs)")
+    metrics = {}
+    for name, func, inputs in cases:
+        metrics[f"{name}_us"] = _time_per_call(func, inputs, repeat)
+        print(f"{name:>26} {metrics[name + '_us']:>10.2f}")
+    return metrics
+
+
+def bench_gui_messages(count=500):
+    """Cost of appending messages and clearing placeholders (offscreen Qt, µs)."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    import main
+    if not main.GUI_AVAILABLE:
+        print("gui_messages: skipped, PyQt5 not installed")
+        return {}
+    app = main.QApplication.instance() or main.QApplication([])
+    window = _chat_window(main)
+    metrics = {}
+
+    start = time.perf_counter()
+    for number in range(count):
+        window.add_user_message(SAMPLE_MESSAGES[number % len(SAMPLE_MESSAGES)])
+    metrics["add_user_message_us"] = (time.perf_counter() - start) / count * 1e6
+
+    start = time.perf_counter()
+    for number in range(count):
+        window.add_assistant_message(SAMPLE_MESSAGES[number % len(SAMPLE_MESSAGES)] * 3)
+    metrics["add_assistant_message_us"] = (time.perf_counter() - start) / count * 1e6
+
+    start = time.perf_counter()
+    for number in range(count):
+        window.add_system_message("Ich denke nach...", temp=True, request_id=number)
+    metrics["add_temp_message_us"] = (time.perf_counter() - start) / count * 1e6
+
+    start = time.perf_counter()
+    window.remove_temp_messages()
+    metrics["remove_temp_messages_us"] = (time.perf_counter() - start) / count * 1e6
+
+    window.close()
+    app.processEvents()
+    print("gui_messages: mean cost per message (µs)")
+    for name, value in metrics.items():
+        print(f"{name[:-3]:>26} {value:>10.1f}")
+    return metrics
+
+
+def bench_generation(repeat=5, max_new_tokens=32):
+    """End-to-end generate_response on the tiny random model."""
+    import main
+    if not main.TRANSFORMERS_AVAILABLE:
+        print("generation: skipped, torch/transformers not installed")
+        return {}
+    import torch
+    generator = build_tiny_generator()
+    generator.max_length = max_new_tokens
+    # Random weights rarely hit EOS or a stop string, so every run decodes
+    # about the same number of tokens
+    generator.deadline_ms = 0
+    generator.generate_response(SAMPLE_MESSAGES[0])  # warm-up, fills the prefix cache
+    torch.manual_seed(0)
+    latencies, tokens = [], 0
+    for number in range(repeat):
+        start = time.perf_counter()
+        response = generator.generate_response(SAMPLE_MESSAGES[number % len(SAMPLE_MESSAGES)])
+        latencies.append(time.perf_counter() - start)
+        tokens += len(generator.tokenizer(response).input_ids)
+    metrics = {
+        "p50_ms": _percentile(latencies, 0.5) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "prefill_ms": (generator.last_prefill_seconds or 0) * 1000,
+        "tokens_per_sec": tokens / sum(latencies),
+    }
+    print("generation: tiny model,", max_new_tokens, "new tokens per request")
+    for name, value in metrics.items():
+        print(f"{name:>26} {value:>10.1f}")
+    return metrics
+
+
+# Labelled inputs for the intent benchmark: keyword category or topic, or
+# None where no rule answer should fire (misspellings and substring traps included)
+INTENT_CASES = [
+    ("Hallo!", "greeting"), ("hi", "greeting"), ("hey du", "greeting"), ("Moin moin", "greeting"),
+    ("halo", "greeting"), ("Servus zusammen", "greeting"), ("Guten Tag", "greeting"),
+    ("Tschüss", "farewell"), ("tschüs", "farewell"), ("Auf Wiedersehen!", "farewell"),
+    ("bis bald", "farewell"), ("ciao bella", "farewell"),
+    ("Danke!", "thanks"), ("vielen dank dafür", "thanks"), ("dankee", "thanks"), ("Dankeschön", "thanks"),
+    ("Wie ist das Wetter?", "weather"), ("wettr heute?", "weather"), ("regnet es draußen", "weather"),
+    ("Welche Temperatur haben wir", "weather"),
+    ("Wie spät ist es?", "time"), ("uhrzeit bitte", "time"), ("wie viel uhr ist es", "time"), ("wie spaet", "time"),
+    ("Welches Datum ist heute", "date"), ("welcher tag ist heute", "date"), ("zeig mir den kalender", "date"),
+    ("Was kannst du?", "capabilities"), ("was kanst du", "capabilities"),
+    ("Welche Funktionen hast du", "capabilities"), ("Was machst du so", "capabilities"),
+    ("Kannst du mir etwas über Python erzählen?", "python"), ("hilf mir bei python", "python"),
+    ("Pyton Frage", "python"), ("Was ist künstliche Intelligenz", "künstliche intelligenz"),
+    ("erzähl was über computer", "computer"), ("Wie funktioniert das Internet", "internet"),
+    ("Ich mag Musik", "musik"), ("Tipps für die Gesundheit", "gesundheit"),
+    ("nichts", None), ("ich hab hier was", None), ("Was ist KI?", None), ("schifffahrt", None),
+    ("Erzähl mir eine Geschichte über einen Drachen", None), ("Mein Hund heißt Bello", None),
+    ("am besten", None), ("Wie lernen Kinder am besten?", None), ("Was ist der beste Tag?", None),
+]
+
+
+def bench_intents(repeat=200):
+    """
+    Accuracy and per-message cost of the substring matcher, the intent
+    classifier and both together as classify_intent() runs them.
+    """
+    import main
+    if not main.NUMPY_AVAILABLE:
+        print("intents: skipped, numpy not installed")
+        return {}
+    generator = SimpleResponseGenerator()
+    classifier = generator.classifier
+    texts = [text for text, _ in INTENT_CASES]
+
+    def matcher_intent(text):
+        match = generator.matcher.best_match(text.lower())
+        return match.payload[1] if match else None
+
+    def classifier_intent(text):
+        intent, _ = classifier.classify(text, generator.intent_min_score)
+        return intent[1] if intent else None
+
+    def two_pass_intent(text):
+        intent = generator.match_intent(text)
+        return intent[1] if intent else None
+
+    batch_intents = [
+        intent[1] if intent else None
+        for intent, _ in classifier.classify_batch(texts, generator.intent_min_score)
+    ]
+    start = time.perf_counter()
+    for _ in range(repeat // 10):
+        classifier.classify_batch(texts, generator.intent_min_score)
+    batch_us = (time.perf_counter() - start) / (repeat // 10) / len(texts) * 1e6
+
+    metrics = {}
+    print(f"intents: {len(INTENT_CASES)} labelled inputs")
+    print(f"{'method':>12} {'accuracy':>9} {'µs/msg':>8}")
+    for name, predict in (
+        ("matcher", matcher_intent), ("classifier", classifier_intent), ("two_pass", two_pass_intent)
+    ):
+        accuracy = sum(predict(text) == label for text, label in INTENT_CASES) / len(INTENT_CASES)
+        per_call = _time_per_call(predict, texts, repeat // 10)
+        print(f"{name:>12} {accuracy:>9.1%} {per_call:>8.1f}")
+        metrics[f"{name}_accuracy"] = accuracy
+        metrics[f"{name}_us"] = per_call
+    batch_accuracy = sum(
+        predicted == label for predicted, (_, label) in zip(batch_intents, INTENT_CASES)
+    ) / len(INTENT_CASES)
+    print(f"{'batch':>12} {batch_accuracy:>9.1%} {batch_us:>8.1f}")
+    metrics["batch_us"] = batch_us
+    return metrics
+
+
+def bench_cascade(max_new_tokens=32):
+    """Share of messages the cascade answers without the model, and the time that saves."""
+    import main
+    if not main.TRANSFORMERS_AVAILABLE:
+        print("cascade: skipped, torch/transformers not installed")
+        return {}
+    generator = build_tiny_generator()
+    generator.max_length = max_new_tokens
+    generator.deadline_ms = 0
+    router = main.CascadeRouter(generator)
+    texts = [text for text, _ in INTENT_CASES] + SAMPLE_MESSAGES
+    generator.generate_response(texts[0])  # warm-up
+
+    start = time.perf_counter()
+    for text in texts:
+        generator.generate_response(text)
+    model_only = time.perf_counter() - start
+    start = time.perf_counter()
+    for text in texts:
+        router.generate_response(text)
+    cascaded = time.perf_counter() - start
+
+    # How often a rule answer was right, on the labelled inputs
+    labelled = [
+        (router.rules.classify_intent(text), label) for text, label in INTENT_CASES
+    ]
+    rule_answers = [
+        (intent, label) for (intent, confidence), label in labelled if confidence >= router.min_confidence
+    ]
+    precision = sum(intent[1] == label for intent, label in rule_answers) / len(rule_answers)
+
+    stats = router.stats.stats()
+    metrics = {
+        "rules_hit_rate": stats["rules"]["hit_rate"],
+        "rules_precision": precision,
+        "rules_mean_ms": stats["rules"]["mean_ms"],
+        "model_mean_ms": stats["model"]["mean_ms"],
+        "model_only_seconds": model_only,
+        "cascade_seconds": cascaded,
+    }
+    print(f"cascade: {len(texts)} messages, min confidence {router.min_confidence}")
+    for name, value in metrics.items():
+        print(f"{name:>26} {value:>10.3f}")
+    return metrics
+
+
+def build_tiny_model_pair(matched=True, num_layers=12, hidden_size=768, draft_layers=1, damping=0.05):
+    """
+    A main model and a draft model with the same vocabulary.
+
+    A matched draft is the first draft_layers layers of the main model; the
+    main model's later layers are damped so they only nudge its output, like
+    a bigger model that mostly agrees with a small one. An unmatched draft is
+    initialised independently. Always built locally, KI_BENCH_MODEL is ignored.
+    """
+    import copy
+    import torch
+    from transformers import AutoModelForCausalLM
+    main_model = build_tiny_model(num_layers=num_layers, hidden_size=hidden_size, checkpoint=False)
+    with torch.no_grad():
+        for layer in main_model.gpt_neox.layers[draft_layers:]:
+            for projection in (layer.attention.dense, layer.mlp.dense_4h_to_h):
+                projection.weight.mul_(damping)
+                projection.bias.zero_()
+    if not matched:
+        return main_model, build_tiny_model(seed=1, num_layers=draft_layers, hidden_size=hidden_size, checkpoint=False)
+    config = copy.deepcopy(main_model.config)
+    config.num_hidden_layers = draft_layers
+    draft_model = AutoModelForCausalLM.from_config(config).eval()
+    draft_model.load_state_dict(main_model.state_dict(), strict=False)
+    return main_model, draft_model
+
+
+def bench_speculative(max_new_tokens=64, rounds=1):
+    """Tokens/sec with and without a draft model, and the draft acceptance rate."""
+    import main
+    if not main.TRANSFORMERS_AVAILABLE:
+        print("speculative: skipped, torch/transformers not installed")
+        return {}
+    import torch
+    tokenizer = build_tiny_tokenizer()
+    print(f"speculative: 12-layer main model, 1-layer draft, {max_new_tokens} new tokens per request")
+    print(f"{'pair':>10} {'plain tok/s':>12} {'assisted tok/s':>15} {'speedup':>8} {'acceptance':>11} {'fallbacks':>10}")
+    metrics = {}
+    for pair in ("matched", "unmatched"):
+        main_model, draft_model = build_tiny_model_pair(matched=pair == "matched")
+        generator = main.TransformerResponseGenerator(model=main_model, tokenizer=tokenizer)
+        generator.max_length = max_new_tokens
+        generator.deadline_ms = 0
+        # Random weights: let every request run to max_new_tokens
+        generator.stop_strings = ()
+        rates = {}
+        for mode, draft in (("plain", None), ("assisted", draft_model)):
+            generator.set_draft_model(draft)
+            generator.generate_response(SAMPLE_MESSAGES[0])  # warm-up, fills the prefix cache
+            torch.manual_seed(0)
+            tokens, elapsed = 0, 0.0
+            for text in SAMPLE_MESSAGES * rounds:
+                start = time.perf_counter()
+                generator.generate_response(text)
+                elapsed += time.perf_counter() - start
+                tokens += generator.last_generated_tokens
+            rates[mode] = tokens / elapsed
+        stats = generator.speculation.stats()
+        speedup = rates["assisted"] / rates["plain"]
+        print(f"{pair:>10} {rates['plain']:>12.1f} {rates['assisted']:>15.1f} {speedup:>7.2f}x "
+              f"{stats['overall_acceptance']:>11.1%} {stats['fallbacks']:>10}")
+        metrics.update({
+            f"{pair}_plain_tokens_per_sec": rates["plain"],
+            f"{pair}_assisted_tokens_per_sec": rates["assisted"],
+            f"{pair}_acceptance": stats["overall_acceptance"],
+            f"{pair}_fallbacks": stats["fallbacks"],
+        })
+    return metrics
+
+
+def tiny_replica_generator(max_new_tokens=32):
+    """Replica factory for the scaling benchmark; runs in the replica process."""
+    generator = build_tiny_generator()
+    generator.max_length = max_new_tokens
+    # Random weights rarely hit EOS or a stop string, so every request
+    # decodes about the same number of tokens
+    generator.deadline_ms = 0
+    return generator
+
+
+def bench_replicas(requests_per_requester=3):
+    """Throughput of the replica process pool for every replica/thread split of the CPUs."""
+    import main
+    if not main.TRANSFORMERS_AVAILABLE:
+        print("replicas: skipped, torch/transformers not installed")
+        return {}
+    cpus = main.available_cpus()
+    layouts = []
+    replicas = 1
+    while replicas <= len(cpus):
+        threads = len(cpus) // replicas
+        layouts.append((replicas, threads))
+        if threads > 1:
+            # Same replicas with half the threads, to show the thread scaling
+            layouts.append((replicas, threads // 2))
+        replicas *= 2
+    print(f"replicas: {len(cpus)} CPUs, tiny model, two concurrent requesters per replica")
+    print(f"{'replicas':>9} {'threads':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    metrics = {}
+    for replicas, threads in layouts:
+        pool = main.ReplicaPool(replicas, threads, factory=tiny_replica_generator)
+        if not pool.wait_ready():
+            pool.close()
+            print(f"{replicas:>9} {threads:>8}   replicas failed to load")
+            continue
+        pool.generate_response(SAMPLE_MESSAGES[0])  # warm-up
+        throughput, latencies = _run_requesters(pool.generate_response, replicas * 2, requests_per_requester)
+        pool.close()
+        p50, p95 = _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.95) * 1000
+        print(f"{replicas:>9} {threads:>8} {throughput:>8.2f} {p50:>9.1f} {p95:>9.1f}")
+        metrics[f"requests_per_sec_{replicas}x{threads}"] = throughput
+        metrics[f"p50_ms_{replicas}x{threads}"] = p50
+    return metrics
+
+
+def _current_rss_mb():
+    """Resident set size of this process (Linux), or 0 elsewhere."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return 0.0
+
+
+def _synthetic_snippets(count, words_per_snippet=40, seed=0):
+    """German-looking snippets over a Zipf-distributed vocabulary."""
+    rng = random.Random(seed)
+    syllables = ["ka", "ter", "lin", "mo", "ber", "schu", "ni", "gen", "wal", "dor", "rei", "fan"]
+    vocabulary = sorted({"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(30000)})
+    cumulative = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for number in range(count):
+        words = rng.choices(vocabulary, cum_weights=cumulative, k=words_per_snippet)
+        yield f"Eintrag {number}", " ".join(words)
+
+
+def bench_knowledge(sizes=(1000, 100000), repeat=200):
+    """Build time, size, load time, RSS and BM25 lookup latency of the knowledge index."""
+    import tempfile
+    from main import KnowledgeIndex
+    queries = [*SAMPLE_MESSAGES, "katerlin moschu", "bergenwal", "Was sind Pythons?"]
+    print("knowledge: on-disk BM25 index, memory-mapped")
+    print(f"{'snippets':>10} {'build s':>8} {'size MB':>8} {'load ms':>8} {'rss MB':>7} {'p50 ms':>7} {'p99 ms':>7}")
+    metrics = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "knowledge.idx")
+            start = time.perf_counter()
+            KnowledgeIndex.build(_synthetic_snippets(size), path).close()
+            build_seconds = time.perf_counter() - start
+            size_mb = os.path.getsize(path) / 2**20
+            rss_before = _current_rss_mb()
+            start = time.perf_counter()
+            index = KnowledgeIndex.open(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            latencies = []
+            for number in range(repeat):
+                start = time.perf_counter()
+                index.search(queries[number % len(queries)])
+                latencies.append(time.perf_counter() - start)
+            rss_delta = _current_rss_mb() - rss_before
+            index.close()
+        p50, p99 = _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.99) * 1000
+        print(f"{size:>10} {build_seconds:>8.1f} {size_mb:>8.1f} {load_ms:>8.2f} {rss_delta:>7.1f} {p50:>7.3f} {p99:>7.3f}")
+        metrics.update({
+            f"build_seconds_{size}": build_seconds,
+            f"size_mb_{size}": size_mb,
+            f"load_ms_{size}": load_ms,
+            f"rss_mb_{size}": rss_delta,
+            f"lookup_p50_ms_{size}": p50,
+            f"lookup_p99_ms_{size}": p99,
+        })
+    return metrics
+
+
+def _git_commit():
+    """Current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline, results):
+    """Prints the relative change of every metric present in both runs."""
+    print(f"comparison with {baseline.get('commit') or 'baseline'}")
+    print(f"{'metric':>48} {'before':>12} {'after':>12} {'change':>8}")
+    for name, metrics in results.items():
+        before_metrics = baseline.get("results", {}).get(name, {})
+        for metric, after in metrics.items():
+            before = before_metrics.get(metric)
+            if not isinstance(before, (int, float)) or not isinstance(after, (int, float)):
+                continue
+            change = f"{(after - before) / before:+.1%}" if before else "n/a"
+            print(f"{name + '.' + metric:>48} {before:>12.2f} {after:>12.2f} {change:>8}")
+
+
+BENCHMARKS = {
+    "keyword_matcher": bench_keyword_matcher,
+    "startup": bench_startup,
+    "precision": bench_precision,
+    "batching": bench_batching,
+    "chat_render": bench_chat_render,
+    "scrollback_memory": bench_scrollback_memory,
+    "transcript_search": bench_transcript_search,
+    "hot_paths": bench_hot_paths,
+    "gui_messages": bench_gui_messages,
+    "generation": bench_generation,
+    "knowledge": bench_knowledge,
+    "intents": bench_intents,
+    "cascade": bench_cascade,
+    "speculative": bench_speculative,
+    "replicas": bench_replicas,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the KI-Assistent")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--json", metavar="PATH", help="Write the results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="Compare with an earlier --json file")
+    options = parser.parse_args()
+    unknown = [name for name in options.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    results = {}
+    for name in options.names or list(BENCHMARKS):
+        results[name] = BENCHMARKS[name]() or {}
+        print()
+
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as output:
+            json.dump({
+                "commit": _git_commit(),
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            }, output, indent=2)
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as baseline:
+            compare_results(json.load(baseline), results)
@@ -5,48 +5,279 @@ und optimierten Antworten für eine natürliche und nahtlose Kommunikation.
 Completely free of charge - no external APIs required.
 """
 
+import time
+
+# Reference point for the import-time and time-to-interactive measurements
+STARTUP_TIME = time.perf_counter()
+
 import sys
 import os
 import logging
-import time
+import logging.handlers
 import datetime
 import webbrowser
 import random
 import re
 import threading
-from collections import deque
+import importlib.util
+import copy
+import queue
+import json
+import signal
+import asyncio
+import argparse
+import functools
+import string
+import tempfile
+import sqlite3
+import atexit
+import uuid
+import math
+import mmap
+import struct
+import hashlib
+import itertools
+import contextvars
+import multiprocessing
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import deque, namedtuple, OrderedDict
+from collections.abc import MutableMapping
 
 try:
-    # Try to import PyQt5 for GUI version
+    # Try to import PyQt5 for GUI version (only the modules that are used)
     from PyQt5.QtWidgets import (
         QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QTextEdit, QLineEdit,
-        QPushButton, QWidget, QLabel, QScrollArea, QSplitter, QFrame, QToolBar,
-        QAction, QStatusBar, QMenu, QMessageBox, QDialog, QComboBox, QCheckBox,
-        QSpinBox, QTabWidget
+        QPushButton, QWidget, QLabel, QToolBar, QAction, QStatusBar, QDialog,
+        QComboBox, QCheckBox, QSpinBox, QTabWidget
     )
     from PyQt5.QtCore import QThread, pyqtSignal, QTimer, Qt, QSize
-    from PyQt5.QtGui import QIcon, QPixmap, QTextCursor, QColor, QFont, QPalette
-    from PyQt5.QtSvg import QSvgWidget
+    from PyQt5.QtGui import QTextCursor, QFont, QColor, QTextBlockFormat, QTextCharFormat, QTextFormat
     GUI_AVAILABLE = True
 except ImportError:
     # If PyQt5 is not available, we'll use the CLI version
     GUI_AVAILABLE = False
 
-try:
-    # Try to import transformers for better responses if available
-    import torch
-    from transformers import AutoModelForCausalLM, AutoTokenizer
-    TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    TRANSFORMERS_AVAILABLE = False
+# torch and transformers take seconds to import, so only check that they are
+# installed here; _import_transformers() loads them on first use
+TRANSFORMERS_AVAILABLE = (
+    importlib.util.find_spec("torch") is not None
+    and importlib.util.find_spec("transformers") is not None
+)
+torch = None
+AutoModelForCausalLM = AutoTokenizer = None
 
-# Configure logging
-logging.basicConfig(
-    filename='ki_assistant.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def _import_transformers():
+    """Imports torch and transformers into the module namespace on first use."""
+    global torch, AutoModelForCausalLM, AutoTokenizer
+    if torch is not None:
+        return
+    start = time.perf_counter()
+    import torch as torch_module
+    from transformers import AutoModelForCausalLM as model_class, AutoTokenizer as tokenizer_class
+    AutoModelForCausalLM, AutoTokenizer = model_class, tokenizer_class
+    torch = torch_module
+    logging.info("Imported torch and transformers in %.2fs", time.perf_counter() - start)
+
+
+# NumPy is only needed by the intent classifier; without it the keyword
+# matcher picks the rule-based answers alone
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+
+def _import_numpy():
+    """Imports numpy into the module namespace on first use."""
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+# Inference precision for the CPU path: "float32", "bfloat16" or "int8"
+CPU_PRECISION = os.environ.get("KI_ASSISTENT_PRECISION", "float32")
+CPU_PRECISIONS = ("float32", "bfloat16", "int8")
+
+# Optional draft model for assisted (speculative) decoding; it must use the
+# main model's tokenizer, e.g. "EleutherAI/pythia-70m" for pythia-410m.
+# Empty disables assisted decoding.
+DRAFT_MODEL_NAME = os.environ.get("KI_ASSISTENT_DRAFT_MODEL", "")
+# Below this share of accepted draft tokens plain decoding is faster, so the
+# draft is switched off and only tried again after this many requests
+DRAFT_MIN_ACCEPTANCE = float(os.environ.get("KI_ASSISTENT_DRAFT_MIN_ACCEPTANCE", "0.5"))
+DRAFT_RETRY_AFTER = int(os.environ.get("KI_ASSISTENT_DRAFT_RETRY", "20"))
+
+# Micro-batching: largest batch and how long to wait for more requests
+BATCH_MAX_SIZE = int(os.environ.get("KI_ASSISTENT_BATCH_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("KI_ASSISTENT_BATCH_WAIT_MS", "20"))
+
+# Process pool: model replicas, each in its own process on its own CPUs
+# (1 runs the model in this process), and torch intra-op threads per model
+# (0: one per CPU of the replica, or torch's default in a single process)
+MODEL_REPLICAS = int(os.environ.get("KI_ASSISTENT_REPLICAS", "1"))
+MODEL_THREADS = int(os.environ.get("KI_ASSISTENT_THREADS", "0"))
+
+# Response cache: number of entries and their lifetime in seconds
+RESPONSE_CACHE_SIZE = int(os.environ.get("KI_ASSISTENT_CACHE_SIZE", "256"))
+RESPONSE_CACHE_TTL = float(os.environ.get("KI_ASSISTENT_CACHE_TTL", "3600"))
+
+# Tokens of conversation (history plus current turn) sent after the system prompt
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("KI_ASSISTENT_CONTEXT_TOKENS", "256"))
+
+# Latency budget of one generation in milliseconds; 0 disables it
+GENERATION_DEADLINE_MS = float(os.environ.get("KI_ASSISTENT_DEADLINE_MS", "20000"))
+
+# Per-stage timing of the response pipeline; the summary is logged at most
+# once per interval (seconds)
+METRICS_ENABLED = os.environ.get("KI_ASSISTENT_METRICS", "1") != "0"
+METRICS_LOG_INTERVAL = float(os.environ.get("KI_ASSISTENT_METRICS_INTERVAL", "300"))
+
+# GUI scrollback: messages kept in the chat display and in the history list;
+# older messages live in the on-disk scrollback log and page back on demand
+GUI_MAX_MESSAGES = int(os.environ.get("KI_ASSISTENT_MAX_MESSAGES", "500"))
+GUI_MAX_HISTORY = int(os.environ.get("KI_ASSISTENT_MAX_HISTORY", "200"))
+SCROLLBACK_PAGE_SIZE = 50
+
+# Per-user directory for data files: %APPDATA% on Windows, otherwise
+# $XDG_DATA_HOME or ~/.local/share
+DATA_DIR = os.environ.get("KI_ASSISTENT_DATA_DIR") or os.path.join(
+    os.environ.get("APPDATA") or os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"),
+    "ki-assistent"
 )
 
+# Knowledge base for extended answers (built with --build-knowledge) and the
+# BM25 score a snippet needs to be used as the answer
+KNOWLEDGE_INDEX_PATH = os.environ.get("KI_ASSISTENT_KNOWLEDGE", os.path.join(DATA_DIR, "knowledge.idx"))
+KNOWLEDGE_MIN_SCORE = float(os.environ.get("KI_ASSISTENT_KNOWLEDGE_MIN_SCORE", "1.0"))
+# Below this many snippets IDF can't tell a topic word from a common one, so
+# a snippet has to share two terms with the query
+KNOWLEDGE_SMALL_INDEX = 1000
+
+# Cosine similarity the intent classifier needs before a rule answer is used
+INTENT_MIN_SCORE = float(os.environ.get("KI_ASSISTENT_INTENT_MIN_SCORE", "0.3"))
+
+# Intent confidence at which a rule answer is used instead of asking the
+# transformer model (see CascadeRouter)
+CASCADE_MIN_CONFIDENCE = float(os.environ.get("KI_ASSISTENT_CASCADE_MIN_CONFIDENCE", "0.6"))
+
+# Comma-separated modules that add commands (see load_command_plugins)
+COMMAND_PLUGINS = os.environ.get("KI_ASSISTENT_PLUGINS", "")
+
+# SQLite file with the transcripts of all conversations
+TRANSCRIPT_DB_PATH = os.environ.get("KI_ASSISTENT_TRANSCRIPT_DB", os.path.join(DATA_DIR, "transcripts.db"))
+
+# Log file, rotated by size; KI_ASSISTENT_LOG_JSON=1 writes JSON lines
+LOG_PATH = os.environ.get("KI_ASSISTENT_LOG", "ki_assistant.log")
+LOG_MAX_BYTES = int(os.environ.get("KI_ASSISTENT_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("KI_ASSISTENT_LOG_BACKUPS", "3"))
+LOG_JSON = os.environ.get("KI_ASSISTENT_LOG_JSON", "0") == "1"
+
+# Id of the request being answered in the current thread or task
+REQUEST_ID = contextvars.ContextVar("request_id", default=None)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps every log record with the current request id."""
+    
+    def filter(self, record):
+        # Records from replica processes arrive already stamped
+        if not hasattr(record, "request_id"):
+            record.request_id = REQUEST_ID.get()
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line.
+    
+    The request id and a "timings" dict passed via extra= become fields of
+    their own, so the log can be filtered and aggregated by request.
+    """
+    
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None) is not None:
+            entry["request_id"] = record.request_id
+        if getattr(record, "timings", None):
+            entry["timings"] = record.timings
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that keeps the traceback out of the message.
+    
+    The stock prepare() appends the formatted traceback to msg and clears
+    exc_info and exc_text, so JsonLinesFormatter could never emit its
+    "exception" field. Here the traceback is formatted into exc_text, which
+    the file formatters pick up; exc_info itself can't be pickled for the
+    replica queues and is dropped.
+    """
+    
+    _exception_formatter = logging.Formatter()
+    
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def configure_logging():
+    """
+    Route all logging through a queue to a background writer.
+    
+    Callers only format the record and put it on the queue; the file
+    writes and rotation happen on the listener thread, so a slow disk
+    never blocks the GUI or a generation thread.
+    
+    Returns:
+        logging.handlers.QueueListener: The running writer
+    """
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+    )
+    if LOG_JSON:
+        file_handler.setFormatter(JsonLinesFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = TracebackQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+    
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def log_request_timing(start, answered_by):
+    """Log the end of a request with its total time as a structured field."""
+    total_ms = (time.perf_counter() - start) * 1000
+    logging.info(
+        "Request answered by %s in %.1f ms", answered_by, total_ms, extra={"timings": {"total_ms": round(total_ms, 3)}}
+    )
+
+
+# Configure logging
+LOG_LISTENER = configure_logging()
+
 # ASCII Art for CLI version
 ASCII_LOGO = """
  ██ ▄█▀ ██▓    ▄▄▄        ██████   ██████  ██▓  ██████ ▄▄▄█████▓ ▄▄▄       ███▄    █ ▄▄▄█████▓
@@ -66,11 +297,717 @@ ASCII_LOGO = """
 ██████  ███████ ███████  ██████  ██   ██ ███████                                               
 """
 
+KeywordMatch = namedtuple("KeywordMatch", ["start", "pattern", "payload", "priority"])
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton that finds all keywords in a text in a single pass.
+    
+    Every pattern carries a payload (e.g. its category) and a priority given by
+    its insertion order, so callers can keep a "first table entry wins" rule
+    without rescanning the text once per keyword.
+    """
+    
+    def __init__(self, patterns=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._terminal = [[]]
+        self._output = [[]]
+        self._patterns = []
+        self._built = False
+        for pattern, payload in patterns:
+            self.add(pattern, payload)
+    
+    def __len__(self):
+        return len(self._patterns)
+    
+    def add(self, pattern, payload=None):
+        """
+        Adds a pattern to the automaton.
+        
+        Args:
+            pattern (str): The keyword to match (matched case-sensitively)
+            payload: Arbitrary data returned with every hit of this pattern
+        """
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append([])
+                self._output.append([])
+            node = next_node
+        self._terminal[node].append(len(self._patterns))
+        self._patterns.append((pattern, payload))
+        self._built = False
+    
+    def build(self):
+        """Computes the failure links; called lazily before the first search."""
+        self._fail = [0] * len(self._goto)
+        self._output = [list(indices) for indices in self._terminal]
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child].extend(self._output[self._fail[child]])
+        self._built = True
+    
+    def find_all(self, text):
+        """
+        Finds every pattern occurrence in the text.
+        
+        Args:
+            text (str): The text to scan
+        
+        Returns:
+            list: KeywordMatch tuples ordered by end position
+        """
+        if not self._built:
+            self.build()
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self._patterns
+        matches = []
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in output[node]:
+                pattern, payload = patterns[index]
+                matches.append(KeywordMatch(position - len(pattern) + 1, pattern, payload, index))
+        return matches
+    
+    def best_match(self, text):
+        """
+        Returns the hit with the highest priority (lowest insertion index).
+        
+        Args:
+            text (str): The text to scan
+        
+        Returns:
+            KeywordMatch: The winning hit, or None if nothing matched
+        """
+        matches = self.find_all(text)
+        if not matches:
+            return None
+        return min(matches, key=lambda match: match.priority)
+    
+    def word_matches(self, text):
+        """
+        Finds the pattern occurrences that start and end at word boundaries.
+        
+        Args:
+            text (str): The text to scan
+        
+        Returns:
+            list: KeywordMatch tuples ordered by end position
+        """
+        matches = []
+        for match in self.find_all(text):
+            end = match.start + len(match.pattern)
+            if match.start > 0 and text[match.start - 1].isalnum():
+                continue
+            if end < len(text) and text[end].isalnum():
+                continue
+            matches.append(match)
+        return matches
+
+
+WEEKDAY_NAMES = ("Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag")
+MONTH_NAMES = (
+    "Januar", "Februar", "März", "April", "Mai", "Juni",
+    "Juli", "August", "September", "Oktober", "November", "Dezember"
+)
+
+# Built-in template placeholders; each is evaluated at render time, and only
+# by templates that use it
+TEMPLATE_PLACEHOLDERS = {
+    "now": datetime.datetime.now,
+    "weekday": lambda: WEEKDAY_NAMES[datetime.date.today().weekday()],
+    "month": lambda: MONTH_NAMES[datetime.date.today().month - 1],
+}
+
+
+class ResponseTemplate:
+    """
+    A response text with {placeholders}, parsed once.
+    
+    Placeholders are filled in by render(): the built-in ones from
+    TEMPLATE_PLACEHOLDERS, anything else from the slots passed in. Format
+    specs work as in str.format, e.g. {now:%H:%M}. Templates without
+    placeholders render to their source text at no cost.
+    """
+    
+    __slots__ = ("source", "fields", "dynamic", "_parts")
+    
+    _formatter = string.Formatter()
+    
+    def __init__(self, source):
+        self.source = source
+        self._parts = []
+        fields = []
+        for literal, field, spec, conversion in self._formatter.parse(source):
+            if field is not None:
+                if not field.isidentifier():
+                    raise ValueError(f"Unsupported placeholder '{{{field}}}' in template: {source}")
+                if field not in fields:
+                    fields.append(field)
+            self._parts.append((literal, field, spec or "", conversion))
+        self.fields = tuple(fields)
+        # Answers with built-in placeholders change over time
+        self.dynamic = any(field in TEMPLATE_PLACEHOLDERS for field in fields)
+        if not fields:
+            self._parts = None
+    
+    def render(self, slots=None):
+        """
+        Fills in the placeholders.
+        
+        Args:
+            slots (dict): Values for placeholders; they take precedence over
+                the built-in ones
+            
+        Returns:
+            str: The response text
+            
+        Raises:
+            KeyError: If a placeholder has no value
+        """
+        if self._parts is None:
+            return self.source
+        values = {}
+        for field in self.fields:
+            if slots and field in slots:
+                values[field] = slots[field]
+            else:
+                values[field] = TEMPLATE_PLACEHOLDERS[field]()
+        pieces = []
+        for literal, field, spec, conversion in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                value = self._formatter.convert_field(values[field], conversion)
+                pieces.append(format(value, spec))
+        return "".join(pieces)
+    
+    def __str__(self):
+        return self.source
+    
+    def __repr__(self):
+        return f"ResponseTemplate({self.source!r})"
+
+
+class ResponseTable(MutableMapping):
+    """
+    Response templates by category, compiled on first use.
+    
+    A category maps to a list of template strings or to a loader function
+    returning one, e.g. reading a large table from disk. Neither is touched
+    until the category is looked up for the first time.
+    """
+    
+    def __init__(self, sources=None):
+        self._sources = dict(sources or {})
+        self._compiled = {}
+    
+    def __getitem__(self, category):
+        templates = self._compiled.get(category)
+        if templates is None:
+            source = self._sources[category]
+            if callable(source):
+                source = source()
+            templates = self._compiled[category] = [ResponseTemplate(text) for text in source]
+        return templates
+    
+    def __setitem__(self, category, source):
+        self._sources[category] = source
+        self._compiled.pop(category, None)
+    
+    def __delitem__(self, category):
+        del self._sources[category]
+        self._compiled.pop(category, None)
+    
+    def __iter__(self):
+        return iter(self._sources)
+    
+    def __len__(self):
+        return len(self._sources)
+    
+    def __contains__(self, category):
+        return category in self._sources
+    
+    def is_compiled(self, category):
+        """Whether a category has been looked up already."""
+        return category in self._compiled
+    
+    def raw_texts(self):
+        """
+        Returns the template strings of the categories given as lists,
+        without compiling them; loader functions are not called.
+        
+        Returns:
+            list: Template strings
+        """
+        return [text for source in self._sources.values() if not callable(source) for text in source]
+
+
+GERMAN_STOPWORDS = frozenset("""
+    aber alle allem allen aller alles als also am an ander andere anderen auch auf aus bei bin bis bist
+    da damit dann das dass dein deine dem den denn der des dich die dies diese diesem diesen dieser dieses
+    dir doch dort du durch ein eine einem einen einer eines er es etwas euch euer fuer gibt hab habe haben
+    hat hatte ich ihm ihn ihr ihre im in ist ja jede jedem jeden jeder jedes kann kannst kein keine koennen
+    man mein meine mich mir mit muss nach nicht nichts noch nun nur ob oder ohne sehr sein seine sich sie
+    sind so soll sollte sondern ueber um und uns unser unter viel vom von vor war waren warum was weil
+    welche welcher wenn wer werden wie wieder will wir wird wo wurde zu zum zur
+""".split())
+
+GERMAN_WORD_PATTERN = re.compile(r"\w+")
+
+
+def stem_german(word):
+    """
+    Light German stemmer in the style of CISTEM: strips inflection suffixes
+    so "Pythons"/"Python" or "Computern"/"Computer" share a stem.
+    
+    Args:
+        word (str): Lowercase word with folded umlauts
+        
+    Returns:
+        str: The stem
+    """
+    while len(word) > 3:
+        if len(word) > 5 and word[-2:] in ("em", "er", "nd"):
+            word = word[:-2]
+        elif word[-1] in "esn":
+            word = word[:-1]
+        else:
+            break
+    return word
+
+
+def tokenize_german(text):
+    """
+    Splits German text into index terms: lowercase, umlauts folded,
+    stopwords removed, stemmed.
+    
+    Args:
+        text (str): Any text
+        
+    Returns:
+        list: Terms in text order
+    """
+    words = GERMAN_WORD_PATTERN.findall(text.lower().translate(UMLAUT_FOLDING))
+    return [stem_german(word) for word in words if word not in GERMAN_STOPWORDS]
+
+
+class KnowledgeIndex:
+    """
+    Read-only on-disk inverted index over German text snippets, ranked
+    with BM25.
+    
+    The file is memory-mapped and read in place: terms are found by binary
+    search over the sorted vocabulary and postings are read straight from
+    the mapping, so opening costs nothing and only touched pages count
+    towards RSS. Each posting stores its precomputed BM25 weight, and the
+    postings of a term are sorted by weight, so a query only reads the best
+    max_postings entries of each term.
+    
+    Layout (little endian, sections 8-byte aligned): header, document
+    offsets (u64), document blob, term offsets (u64), term blob (sorted
+    UTF-8), postings start per term (u64), posting documents (u32),
+    posting weights (f32).
+    """
+    
+    MAGIC = b"KIKB0001"
+    HEADER = struct.Struct("<8sIIQ8Q")
+    K1 = 1.2
+    B = 0.75
+    
+    def __init__(self, data, max_postings=2000):
+        """
+        Args:
+            data: The index as bytes or a memory mapping
+            max_postings (int): Postings read per query term
+        """
+        self._data = data
+        self.max_postings = max_postings
+        view = memoryview(data)
+        magic, _, self.document_count, self.term_count, *offsets = self.HEADER.unpack_from(view, 0)
+        if magic != self.MAGIC:
+            raise ValueError("Not a knowledge index file")
+        (doc_offsets, doc_blob, term_offsets, term_blob,
+         term_postings, posting_docs, posting_weights, end) = offsets
+        self._doc_offsets = view[doc_offsets:doc_blob].cast("Q")
+        self._doc_blob = view[doc_blob:term_offsets]
+        self._term_offsets = view[term_offsets:term_blob].cast("Q")
+        self._term_blob = view[term_blob:term_postings]
+        self._term_postings = view[term_postings:posting_docs].cast("Q")
+        self._posting_docs = view[posting_docs:posting_weights].cast("I")
+        self._posting_weights = view[posting_weights:end].cast("f")
+    
+    @classmethod
+    def open(cls, path, **kwargs):
+        """Memory-maps an index file."""
+        with open(path, "rb") as index_file:
+            data = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(data, **kwargs)
+    
+    @classmethod
+    def build(cls, documents, path=None):
+        """
+        Builds an index.
+        
+        Args:
+            documents (iterable): (title, text) pairs
+            path (str): Write the index here (atomically); if None the
+                index is returned from memory
+            
+        Returns:
+            KnowledgeIndex: The new index
+        """
+        doc_blob = bytearray()
+        doc_offsets = array("Q", [0])
+        doc_lengths = []
+        postings = {}  # term -> {doc id: term frequency}
+        for doc_id, (title, text) in enumerate(documents):
+            doc_blob += f"{title}\x00{text}".encode("utf-8")
+            doc_offsets.append(len(doc_blob))
+            terms = tokenize_german(f"{title} {text}")
+            doc_lengths.append(len(terms))
+            for term in terms:
+                counts = postings.setdefault(term, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+        
+        document_count = len(doc_lengths)
+        average_length = sum(doc_lengths) / document_count if document_count else 0.0
+        terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+        term_blob = bytearray()
+        term_offsets = array("Q", [0])
+        term_postings = array("Q", [0])
+        posting_docs = array("I")
+        posting_weights = array("f")
+        for term in terms:
+            term_blob += term.encode("utf-8")
+            term_offsets.append(len(term_blob))
+            counts = postings[term]
+            idf = math.log(1 + (document_count - len(counts) + 0.5) / (len(counts) + 0.5))
+            weighted = []
+            for doc_id, frequency in counts.items():
+                norm = cls.K1 * (1 - cls.B + cls.B * doc_lengths[doc_id] / average_length)
+                weighted.append((idf * frequency * (cls.K1 + 1) / (frequency + norm), doc_id))
+            weighted.sort(reverse=True)
+            posting_docs.extend(doc_id for _, doc_id in weighted)
+            posting_weights.extend(weight for weight, _ in weighted)
+            term_postings.append(len(posting_docs))
+        
+        sections = [doc_offsets, doc_blob, term_offsets, term_blob, term_postings, posting_docs, posting_weights]
+        if sys.byteorder != "little":
+            for section in sections:
+                if isinstance(section, array) and section.itemsize > 1:
+                    section.byteswap()
+        body = bytearray()
+        offsets = []
+        position = cls.HEADER.size
+        for section in sections:
+            padding = -position % 8
+            body += b"\x00" * padding
+            position += padding
+            offsets.append(position)
+            raw = section.tobytes() if isinstance(section, array) else bytes(section)
+            body += raw
+            position += len(raw)
+        offsets.append(position)
+        data = cls.HEADER.pack(cls.MAGIC, 1, document_count, len(terms), *offsets) + bytes(body)
+        
+        if path is None:
+            return cls(data)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as index_file:
+            index_file.write(data)
+        os.replace(temp_path, path)
+        return cls.open(path)
+    
+    def _find_term(self, term):
+        """Binary search in the sorted vocabulary; returns the term index or -1."""
+        key = term.encode("utf-8")
+        offsets, blob = self._term_offsets, self._term_blob
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            current = blob[offsets[middle]:offsets[middle + 1]].tobytes()
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return -1
+    
+    def search(self, query, limit=3, min_terms=1):
+        """
+        Ranks snippets for a query with BM25.
+        
+        Args:
+            query (str): The user's text
+            limit (int): Maximum number of results
+            min_terms (int): Distinct query terms a snippet must contain;
+                capped at the number of terms in the query
+            
+        Returns:
+            list: (score, document id) pairs, best first
+        """
+        terms = set(tokenize_german(query))
+        min_terms = min(min_terms, len(terms))
+        scores = {}
+        matched = {}
+        for term in terms:
+            index = self._find_term(term)
+            if index < 0:
+                continue
+            start = self._term_postings[index]
+            end = min(self._term_postings[index + 1], start + self.max_postings)
+            for doc_id, weight in zip(self._posting_docs[start:end], self._posting_weights[start:end]):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+                matched[doc_id] = matched.get(doc_id, 0) + 1
+        if min_terms > 1:
+            scores = {doc_id: score for doc_id, score in scores.items() if matched[doc_id] >= min_terms}
+        if not scores:
+            return []
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(score, doc_id) for doc_id, score in best]
+    
+    def document(self, doc_id):
+        """
+        Returns:
+            tuple: (title, text) of a snippet
+        """
+        raw = self._doc_blob[self._doc_offsets[doc_id]:self._doc_offsets[doc_id + 1]].tobytes()
+        title, _, text = raw.decode("utf-8").partition("\x00")
+        return title, text
+    
+    def close(self):
+        """Release the memory mapping."""
+        for name in ("_doc_offsets", "_doc_blob", "_term_offsets", "_term_blob",
+                     "_term_postings", "_posting_docs", "_posting_weights"):
+            getattr(self, name).release()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+
+class IntentClassifier:
+    """
+    Character n-gram TF-IDF classifier over example phrases (needs numpy).
+    
+    Every example phrase becomes one L2-normalized row of a matrix, so an
+    input is scored against all of them with one matrix-vector product; an
+    intent's score is the cosine similarity of its best example. N-grams are
+    taken per word with the word boundaries included, so "hi" does not hit
+    inside "hilf", while typos still share most n-grams with the keyword.
+    
+    Per-word n-grams can't tell "besten dank" from "am besten", so an example
+    of several words only scores if every one of its words has a similar
+    word (at least word_match_score) in the input.
+    
+    IDF weights come from the examples plus a background corpus (the answer
+    texts), so function words like "du" or "heute" count for little.
+    """
+    
+    def __init__(self, examples, background=(), ngram_range=(3, 5), word_match_score=0.25):
+        """
+        Args:
+            examples (iterable): (phrase, intent) pairs; intents are any
+                hashable labels and ties go to the intent seen first
+            background (iterable): Extra texts used only for the IDF weights
+            ngram_range (tuple): Smallest and largest n-gram length
+            word_match_score (float): Cosine similarity at which an input
+                word counts as a (misspelled) word of an example
+        """
+        _import_numpy()
+        self.ngram_range = ngram_range
+        self.word_match_score = word_match_score
+        phrases = {}
+        for phrase, intent in examples:
+            phrases.setdefault(intent, []).append(phrase)
+        self.intents = list(phrases)
+        
+        example_grams = []
+        example_words = []
+        self._starts = []
+        for intent in self.intents:
+            self._starts.append(len(example_grams))
+            example_grams.extend(self.ngrams(phrase) for phrase in phrases[intent])
+            example_words.extend(self.words(phrase) for phrase in phrases[intent])
+        self._starts = np.array(self._starts, dtype=np.intp)
+        
+        self.vocabulary = {}
+        for grams in example_grams:
+            for gram in grams:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+        document_frequency = np.zeros(len(self.vocabulary), dtype=np.float32)
+        documents = example_grams + [self.ngrams(text) for text in background]
+        for grams in documents:
+            columns = [self.vocabulary[gram] for gram in grams if gram in self.vocabulary]
+            document_frequency[columns] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+        self.unseen_idf = math.log(1 + len(documents)) + 1
+        self.examples = self._vectorize(example_grams)
+        
+        # Words of the multi-word examples, and which example needs which word
+        self.required_words = sorted({word for words in example_words if len(words) > 1 for word in words})
+        columns = {word: column for column, word in enumerate(self.required_words)}
+        self._required = np.zeros((len(example_words), len(self.required_words)), dtype=np.float32)
+        for row, words in enumerate(example_words):
+            if len(words) > 1:
+                self._required[row, [columns[word] for word in words]] = 1
+        self._word_vectors = self._vectorize([self.ngrams(word) for word in self.required_words])
+    
+    @staticmethod
+    def words(text):
+        """Returns the lower-cased, umlaut-folded words of a text."""
+        return GERMAN_WORD_PATTERN.findall(text.lower().translate(UMLAUT_FOLDING))
+    
+    def ngrams(self, text):
+        """
+        Counts the character n-grams of the words in a text.
+        
+        Returns:
+            dict: n-gram -> count
+        """
+        low, high = self.ngram_range
+        counts = {}
+        for word in self.words(text):
+            padded = f" {word} "
+            for size in range(low, min(high, len(padded)) + 1):
+                for start in range(len(padded) - size + 1):
+                    gram = padded[start:start + size]
+                    counts[gram] = counts.get(gram, 0) + 1
+        return counts
+    
+    def _vectorize(self, grams_list):
+        """
+        Turns n-gram counts into L2-normalized TF-IDF rows.
+        
+        N-grams outside the vocabulary have no column but still count towards
+        the norm (with the IDF of an unseen term), so a long text that merely
+        contains a common word like "was" does not look like an example.
+        """
+        matrix = np.zeros((len(grams_list), len(self.vocabulary)), dtype=np.float32)
+        unseen = np.zeros((len(grams_list), 1), dtype=np.float32)
+        for row, grams in enumerate(grams_list):
+            for gram, count in grams.items():
+                column = self.vocabulary.get(gram)
+                if column is not None:
+                    matrix[row, column] = 1 + math.log(count)
+                else:
+                    unseen[row, 0] += (1 + math.log(count)) ** 2
+        matrix *= self.idf
+        norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix)[:, None] + unseen * self.unseen_idf ** 2)
+        return np.divide(matrix, norms, out=matrix, where=norms > 0)
+    
+    def scores(self, texts):
+        """
+        Scores texts against every intent.
+        
+        Args:
+            texts (list): Input texts
+            
+        Returns:
+            numpy.ndarray: (len(texts), len(intents)) cosine similarities
+        """
+        vectors = self._vectorize([self.ngrams(text) for text in texts])
+        scores = vectors @ self.examples.T
+        if self.required_words:
+            scores *= self._missing_words(texts) == 0
+        return np.maximum.reduceat(scores, self._starts, axis=1)
+    
+    def _missing_words(self, texts):
+        """
+        Counts the words of each example that have no similar word in a text.
+        
+        Returns:
+            numpy.ndarray: (len(texts), len(examples)) counts; always 0 for
+            single-word examples
+        """
+        text_words = [self.words(text) for text in texts]
+        matched = np.zeros((len(texts), len(self.required_words)), dtype=np.float32)
+        all_words = [word for words in text_words for word in words]
+        if all_words:
+            similar = self._vectorize([self.ngrams(word) for word in all_words]) @ self._word_vectors.T
+            similar = similar >= self.word_match_score
+            start = 0
+            for row, words in enumerate(text_words):
+                if words:
+                    matched[row] = similar[start:start + len(words)].any(axis=0)
+                start += len(words)
+        return (1 - matched) @ self._required.T
+    
+    def classify_batch(self, texts, min_score=0.0):
+        """
+        Classifies several texts with one matrix product.
+        
+        Returns:
+            list: (intent, score) per text; intent is None below min_score
+        """
+        if not texts:
+            return []
+        scores = self.scores(texts)
+        best = scores.argmax(axis=1)
+        results = []
+        for row, column in enumerate(best.tolist()):
+            score = float(scores[row, column])
+            results.append((self.intents[column] if score >= min_score else None, score))
+        return results
+    
+    def classify(self, text, min_score=0.0):
+        """
+        Returns:
+            tuple: (intent, score) of the best intent; intent is None below min_score
+        """
+        return self.classify_batch([text], min_score)[0]
+
+
+class AnswerInfo(threading.local):
+    """
+    Describes the last answer produced in the current thread.
+    
+    Generators fill it in before returning, so wrappers such as
+    CachedResponseGenerator can tell rule answers from model answers
+    without racing other threads on instance attributes.
+    """
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        """Forgets the previous answer."""
+        # "rules", "model" or "cache"
+        self.tier = None
+        # GenerationStopper.end_reason() of a model answer
+        self.end_reason = None
+
+
+LAST_ANSWER = AnswerInfo()
+
+
 class SimpleResponseGenerator:
     """Simple response generator that doesn't require external dependencies."""
     
+    TIME_OF_DAY_WORDS = ("morgen", "tag", "abend", "nacht")
+    
     def __init__(self):
-        self.responses = {
+        # Templates are compiled per category on first use; placeholders are
+        # filled in when an answer is picked
+        self.responses = ResponseTable({
             "greeting": [
                 "Hallo! Wie kann ich dir heute helfen?",
                 "Guten Tag! Wobei kann ich behilflich sein?",
@@ -95,14 +1032,14 @@ class SimpleResponseGenerator:
                 "Wetterdaten kann ich nicht direkt anzeigen, aber ich kann dir helfen, eine Wetterseite zu öffnen."
             ],
             "time": [
-                f"Die aktuelle Systemzeit ist {datetime.datetime.now().strftime('%H:%M:%S')}.",
-                f"Es ist jetzt {datetime.datetime.now().strftime('%H:%M')} Uhr.",
-                f"Die Uhrzeit beträgt {datetime.datetime.now().strftime('%H:%M')} Uhr."
+                "Die aktuelle Systemzeit ist {now:%H:%M:%S}.",
+                "Es ist jetzt {now:%H:%M} Uhr.",
+                "Die Uhrzeit beträgt {now:%H:%M} Uhr."
             ],
             "date": [
-                f"Heute ist der {datetime.datetime.now().strftime('%d.%m.%Y')}.",
-                f"Das heutige Datum ist {datetime.datetime.now().strftime('%d. %B %Y')}.",
-                f"Wir haben den {datetime.datetime.now().strftime('%d.%m.%Y')}."
+                "Heute ist {weekday}, der {now:%d.%m.%Y}.",
+                "Das heutige Datum ist {now:%d}. {month} {now:%Y}.",
+                "Wir haben den {now:%d.%m.%Y}."
             ],
             "capabilities": [
                 "Ich kann dir mit grundlegenden Informationen helfen, Programme öffnen, Webseiten aufrufen und einfache Fragen beantworten.",
@@ -115,7 +1052,10 @@ class SimpleResponseGenerator:
                 "Ich verstehe deine Anfrage leider nicht vollständig. Magst du es anders ausdrücken?",
                 "Darauf habe ich leider keine passende Antwort. Gibt es etwas anderes, womit ich dir helfen kann?"
             ]
-        }
+        })
+        
+        # Values for user-defined template placeholders, e.g. {"name": "Anna"}
+        self.slots = {}
         
         # Keyword mapping for responses
         self.keywords = {
@@ -142,30 +1082,173 @@ class SimpleResponseGenerator:
             
             "musik": "Musik ist eine Kunstform, die Töne und Klänge in einer strukturierten und bewussten Weise organisiert. Sie kann verschiedene Emotionen ausdrücken und ist in allen Kulturen weltweit zu finden. Es gibt zahlreiche Musikgenres wie Klassik, Rock, Pop, Jazz, Hip-Hop und elektronische Musik."
         }
+        
+        # Snippet index for everything the tables don't cover; opened on first use
+        self.knowledge_path = KNOWLEDGE_INDEX_PATH
+        self._knowledge = None
+        self.intent_min_score = INTENT_MIN_SCORE
+        
+        self.build_matcher()
+    
+    @property
+    def knowledge(self):
+        """
+        The knowledge index: the --build-knowledge file if there is one,
+        otherwise an in-memory index of the extended responses.
+        """
+        if self._knowledge is None:
+            try:
+                self._knowledge = KnowledgeIndex.open(self.knowledge_path)
+            except (OSError, ValueError):
+                self._knowledge = KnowledgeIndex.build(self.extended_responses.items())
+        return self._knowledge
+    
+    def lookup_knowledge(self, user_text):
+        """
+        Finds the best knowledge snippet for the text.
+        
+        Returns:
+            str: Snippet text, or None if nothing scores high enough
+        """
+        min_terms = 2 if self.knowledge.document_count < KNOWLEDGE_SMALL_INDEX else 1
+        results = self.knowledge.search(user_text, limit=1, min_terms=min_terms)
+        if results and results[0][0] >= KNOWLEDGE_MIN_SCORE:
+            return self.knowledge.document(results[0][1])[1]
+        return None
+    
+    def build_matcher(self):
+        """
+        Compiles the keyword and topic tables into a single KeywordMatcher.
+        
+        Call this again after changing self.keywords or self.extended_responses.
+        """
+        self.matcher = KeywordMatcher()
+        for category, keywords in self.keywords.items():
+            for keyword in keywords:
+                self.matcher.add(keyword, ("keyword", category))
+        for topic in self.extended_responses:
+            self.matcher.add(topic, ("topic", topic))
+        self.matcher.build()
+        self._classifier = None
+    
+    @property
+    def classifier(self):
+        """The intent classifier over the same tables, built on first use; None without numpy."""
+        if self._classifier is None and NUMPY_AVAILABLE:
+            examples = [
+                (keyword, ("keyword", category))
+                for category, keywords in self.keywords.items() for keyword in keywords
+            ]
+            examples += [(topic, ("topic", topic)) for topic in self.extended_responses]
+            # Raw answer texts only: compiling the tables or calling their
+            # loaders here would load every category on the first message
+            self._classifier = IntentClassifier(
+                examples, background=self.responses.raw_texts() + list(self.extended_responses.values())
+            )
+        return self._classifier
+    
+    def exact_intent(self, user_text):
+        """
+        Returns:
+            tuple: The intent every whole-word keyword or topic in the text
+            names, or None if there is none or they disagree
+        """
+        intents = {match.payload for match in self.matcher.word_matches(user_text.lower())}
+        return intents.pop() if len(intents) == 1 else None
+    
+    def classify_intent(self, user_text):
+        """
+        Finds the keyword category or topic the text is most likely about.
+        
+        A text whose whole-word hits in the matcher all name one intent is
+        decided in a single pass. Everything else, including misspellings
+        and keywords inside longer words, goes to the intent classifier when
+        numpy is installed, otherwise to the substring matcher. Matcher hits
+        count as fully confident.
+        
+        Returns:
+            tuple: (intent, confidence); intent is ("keyword", category),
+            ("topic", topic) or None
+        """
+        intent = self.exact_intent(user_text)
+        if intent is not None:
+            return intent, 1.0
+        if self.classifier is not None:
+            return self.classifier.classify(user_text)
+        match = self.matcher.best_match(user_text.lower())
+        return (match.payload, 1.0) if match else (None, 0.0)
+    
+    def match_intent(self, user_text):
+        """
+        Returns:
+            tuple: The intent of classify_intent(), or None if it is not
+            confident enough for a rule answer
+        """
+        intent, confidence = self.classify_intent(user_text)
+        return intent if confidence >= self.intent_min_score else None
+    
+    def answer_intent(self, intent):
+        """
+        Returns:
+            str: The rule answer for an intent from classify_intent()
+        """
+        kind, key = intent
+        if kind == "keyword":
+            return random.choice(self.responses[key]).render(self.slots)
+        return self.extended_responses[key]
     
-    def generate_response(self, user_text, chat_history=None):
+    def generate_response(self, user_text, chat_history=None, on_chunk=None, cancel_event=None):
         """
         Generates a contextual response based on user input and chat history.
         
         Args:
             user_text (str): The user's input text
             chat_history (list): Previous chat messages
+            on_chunk (callable): Optional callback; receives the whole answer
+                as a single chunk, matching the transformer streaming API
+            cancel_event (threading.Event): Unused; rule answers are instant
             
         Returns:
             str: A generated response
         """
-        user_text_lower = user_text.lower()
+        with METRICS.stage("SimpleResponseGenerator", "generate"):
+            response = self._select_response(user_text)
+        LAST_ANSWER.tier = "rules"
+        if on_chunk:
+            on_chunk(response)
+        return response
+    
+    def context_turns(self, user_text, chat_history=None):
+        """Rule answers never look at the history."""
+        return []
+    
+    def is_time_dependent(self, user_text):
+        """
+        Checks whether the answer to this text depends on the current time.
         
-        # Check for keyword matches
-        for category, keywords in self.keywords.items():
-            for keyword in keywords:
-                if keyword in user_text_lower:
-                    return random.choice(self.responses[category])
+        Args:
+            user_text (str): The user's input text
+            
+        Returns:
+            bool: True for categories with time placeholders and for
+            time-of-day greetings
+        """
+        # Same decision as _select_response(), so a clock answer is never cached
+        intent = self.match_intent(user_text)
+        if intent:
+            kind, key = intent
+            return kind == "keyword" and any(template.dynamic for template in self.responses[key])
+        user_text_lower = user_text.lower()
+        return any(word in user_text_lower for word in self.TIME_OF_DAY_WORDS)
+    
+    def _select_response(self, user_text):
+        """Picks the rule-based answer for the given user text."""
+        user_text_lower = user_text.lower()
         
-        # Check for extended response topics
-        for topic, response in self.extended_responses.items():
-            if topic in user_text_lower:
-                return response
+        # Keyword categories and extended topics
+        intent = self.match_intent(user_text)
+        if intent:
+            return self.answer_intent(intent)
         
         # Time-based greeting
         hour = datetime.datetime.now().hour
@@ -176,169 +1259,2344 @@ class SimpleResponseGenerator:
         elif hour >= 18 and ("abend" in user_text_lower or "nacht" in user_text_lower):
             return "Guten Abend! Wie kann ich dir an diesem Abend helfen?"
         
+        # Knowledge snippets, ranked by BM25
+        snippet = self.lookup_knowledge(user_text)
+        if snippet:
+            return snippet
+        
         # Generate question response
         if "?" in user_text:
             if any(word in user_text_lower for word in ["wie", "was", "warum", "weshalb", "wo", "wann", "wer"]):
                 return "Das ist eine interessante Frage. Ich habe zwar keine Verbindung zum Internet, kann dir aber mit grundlegenden Informationen helfen. Könntest du deine Frage konkretisieren oder nach einem bestimmten Thema fragen?"
         
         # If no specific response is found, return a general one
-        return random.choice(self.responses["unknown"])
+        return random.choice(self.responses["unknown"]).render(self.slots)
 
 
-class TransformerResponseGenerator:
-    """Response generator using HuggingFace Transformers library."""
+def _bfloat16_supported():
+    """Checks whether the CPU runs bfloat16 matmuls natively."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        get_capability = getattr(torch.backends.cpu, "get_cpu_capability", None)
+        return get_capability is not None and get_capability() == "AVX512"
+
+
+def resolve_cpu_precision(requested):
+    """
+    Maps a requested CPU precision to one this machine can run.
     
-    def __init__(self):
-        self.model = None
-        self.tokenizer = None
-        self.model_name = "EleutherAI/pythia-410m"  # Smaller model to save resources
-        self.max_length = 100
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+    Args:
+        requested (str): One of CPU_PRECISIONS
+        
+    Returns:
+        str: The precision that will actually be used
+    """
+    if requested not in CPU_PRECISIONS:
+        logging.warning(f"Unknown CPU precision '{requested}', using float32.")
+        return "float32"
+    if requested == "bfloat16" and not _bfloat16_supported():
+        logging.warning("bfloat16 is not supported on this CPU, using float32.")
+        return "float32"
+    return requested
+
+
+def quantize_linear_layers(model):
+    """
+    Applies dynamic int8 quantization to all linear layers of a CPU model.
+    
+    Args:
+        model: A float32 torch model
         
-        # Initialize model during class initialization
-        self._initialize_model()
+    Returns:
+        The quantized model
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class ConversationContext:
+    """
+    Packs the most recent chat turns into a fixed token budget.
     
-    def _initialize_model(self):
-        """Initialize the model and tokenizer."""
-        try:
-            logging.info(f"Loading model {self.model_name} on {self.device}...")
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name, 
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
-            ).to(self.device)
-            logging.info("Model loaded successfully.")
-            return True
-        except Exception as e:
-            logging.error(f"Error loading model: {str(e)}", exc_info=True)
-            return False
+    Works on the "Du: ..."/"Assistent: ..." strings kept by the GUI and CLI.
+    Token ids are cached per turn, so old turns are never tokenized twice.
+    The cache is locked, so other threads can ask for packed_turns() while
+    a generation builds its prompt.
+    """
     
-    def is_model_loaded(self):
-        """Check if the model is loaded."""
-        return self.model is not None and self.tokenizer is not None
+    def __init__(self, tokenizer, token_budget=None, cache_size=2048):
+        self.tokenizer = tokenizer
+        self.token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+        self.cache_size = cache_size
+        self.last_context_turns = 0
+        self._token_cache = OrderedDict()
+        self._lock = threading.Lock()
     
-    def generate_response(self, user_text, chat_history=None):
+    def turn_ids(self, text):
         """
-        Generate a response using the transformer model.
+        Returns the token ids of a prompt fragment, tokenizing it only once.
         
         Args:
-            user_text (str): The user's input text
-            chat_history (list): Previous chat messages
+            text (str): Prompt text of one turn
             
         Returns:
-            str: A generated response
+            list: Token ids
         """
-        if not self.is_model_loaded():
-            if not self._initialize_model():
-                return "Entschuldigung, ich konnte das Sprachmodell nicht laden. Ich verwende stattdessen einfache Antworten."
+        with self._lock:
+            ids = self._token_cache.get(text)
+            if ids is None:
+                ids = self.tokenizer(text, add_special_tokens=False).input_ids
+                self._token_cache[text] = ids
+                if len(self._token_cache) > self.cache_size:
+                    self._token_cache.popitem(last=False)
+            else:
+                self._token_cache.move_to_end(text)
+            return ids
+    
+    @staticmethod
+    def format_turn(entry):
+        """Maps a chat history entry to its prompt text, or None to skip it."""
+        if entry.startswith("Du: "):
+            return f"Benutzer: {entry[len('Du: '):]}\n"
+        if entry.startswith("Assistent: "):
+            return f"{entry}\n"
+        return None
+    
+    @classmethod
+    def earlier_turns(cls, user_text, chat_history=None):
+        """
+        Returns the history entries that can reach the prompt, oldest first.
         
-        # Prepare the prompt with strict instructions for clear, coherent German responses
-        prompt = (
-            "Du bist ein intelligenter deutscher Assistent. "
-            "Deine Antworten sind immer klar, präzise und bleiben strikt beim Thema. "
-            "Du antwortest ausschließlich auf Deutsch, ohne Sprachmischung. "
-            "Deine Antworten sind kurz, direkt und hilfreich. "
-            "Du wiederholst dich nicht und sprichst nicht über Themen, die nicht angefragt wurden. "
-            "\n\n"
-            f"Benutzer: {user_text}\n"
-            "Assistent:"
-        )
+        A trailing entry for the current message and entries without a
+        prompt text (system messages) are left out.
+        """
+        history = list(chat_history or [])
+        if history and history[-1] == f"Du: {user_text}":
+            history.pop()
+        return [entry for entry in history if cls.format_turn(entry) is not None]
+    
+    def packed_turns(self, user_text, chat_history=None):
+        """
+        Returns the history entries build() puts into the prompt, oldest first.
         
-        try:
-            # Generate response with more conservative settings
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages, oldest first
             
-            # Create attention mask
-            attention_mask = torch.ones_like(inputs.input_ids)
+        Returns:
+            list: History entries
+        """
+        current = self.turn_ids(f"Benutzer: {user_text}\nAssistent:")
+        return [entry for entry, _ in self._pack(user_text, chat_history, self.token_budget - len(current))]
+    
+    def _pack(self, user_text, chat_history, remaining):
+        """Returns (entry, token ids) of the newest turns that fit, oldest first."""
+        packed = []
+        for entry in reversed(self.earlier_turns(user_text, chat_history)):
+            ids = self.turn_ids(self.format_turn(entry))
+            if len(ids) > remaining:
+                break
+            packed.append((entry, ids))
+            remaining -= len(ids)
+        packed.reverse()
+        return packed
+    
+    def build(self, user_text, chat_history=None):
+        """
+        Builds the token ids that follow the system prompt.
+        
+        The current turn is always included; older turns are added newest
+        first until the budget is used up.
+        
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages, oldest first; a
+                trailing entry for the current message is ignored
             
-            output = self.model.generate(
-                inputs.input_ids,
-                attention_mask=attention_mask,
-                max_length=len(inputs.input_ids[0]) + self.max_length,
-                num_return_sequences=1,
-                temperature=0.6,        # Lower temperature for more focused responses
-                top_p=0.85,             # More conservative sampling
-                repetition_penalty=1.5,  # Stronger penalty for repetition
-                no_repeat_ngram_size=3,  # Prevent repeating 3-grams
-                do_sample=True,
-                early_stopping=True
+        Returns:
+            list: Token ids of the packed history and the current turn
+        """
+        current = self.turn_ids(f"Benutzer: {user_text}\nAssistent:")
+        packed = self._pack(user_text, chat_history, self.token_budget - len(current))
+        self.last_context_turns = len(packed)
+        return [token for _, ids in packed for token in ids] + current
+
+
+class StageMetrics:
+    """
+    Latency histograms of the response pipeline per generator and stage.
+    
+    Keeps the most recent samples of every (generator, stage) pair and
+    reports p50/p95/p99 from them. When disabled, stage() hands out a shared
+    no-op timer, so instrumented code pays only for one attribute check.
+    """
+    
+    QUANTILES = (0.5, 0.95, 0.99)
+    
+    def __init__(self, enabled=True, log_interval=None, window=1024):
+        self.enabled = enabled
+        self.log_interval = METRICS_LOG_INTERVAL if log_interval is None else log_interval
+        self.window = window
+        self._samples = {}   # (generator, stage) -> deque of recent seconds
+        self._totals = {}    # (generator, stage) -> [count, sum of seconds]
+        self._lock = threading.Lock()
+        self._last_log = time.perf_counter()
+    
+    def stage(self, generator, stage):
+        """
+        Context manager timing one stage.
+        
+        Args:
+            generator (str): Generator type, e.g. "TransformerResponseGenerator"
+            stage (str): Pipeline stage, e.g. "generate"
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, generator, stage)
+    
+    def record(self, generator, stage, seconds):
+        """Add one sample; logs the summary when the interval has passed."""
+        if not self.enabled:
+            return
+        key = (generator, stage)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+                self._totals[key] = [0, 0.0]
+            samples.append(seconds)
+            totals = self._totals[key]
+            totals[0] += 1
+            totals[1] += seconds
+            due = self.log_interval and time.perf_counter() - self._last_log >= self.log_interval
+            if due:
+                self._last_log = time.perf_counter()
+        if due:
+            self.log_summary()
+    
+    def summary(self):
+        """
+        Returns:
+            dict: (generator, stage) -> {"count", "sum", 0.5, 0.95, 0.99}
+        """
+        with self._lock:
+            snapshot = {key: (sorted(samples), list(self._totals[key])) for key, samples in self._samples.items()}
+        result = {}
+        for key, (ordered, (count, total)) in snapshot.items():
+            entry = {"count": count, "sum": total}
+            for quantile in self.QUANTILES:
+                entry[quantile] = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+            result[key] = entry
+        return result
+    
+    def log_summary(self):
+        """Write one log line per generator and stage."""
+        for (generator, stage), entry in sorted(self.summary().items()):
+            logging.info(
+                "Timing %s/%s: n=%d p50=%.1f ms p95=%.1f ms p99=%.1f ms",
+                generator, stage, entry["count"], entry[0.5] * 1000, entry[0.95] * 1000, entry[0.99] * 1000
             )
+    
+    def prometheus_text(self):
+        """Returns the histograms in the Prometheus text exposition format."""
+        name = "ki_assistant_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent per response pipeline stage.",
+            f"# TYPE {name} summary",
+        ]
+        for (generator, stage), entry in sorted(self.summary().items()):
+            labels = f'generator="{generator}",stage="{stage}"'
+            for quantile in self.QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{quantile}"}} {entry[quantile]:.6f}')
+            lines.append(f"{name}_sum{{{labels}}} {entry['sum']:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {entry['count']}")
+        return "\n".join(lines) + "\n"
+    
+    def reset(self):
+        """Drop all samples."""
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+
+class _StageTimer:
+    """Times a with-block and records it in StageMetrics."""
+    
+    __slots__ = ("metrics", "generator", "stage", "start")
+    
+    def __init__(self, metrics, generator, stage):
+        self.metrics = metrics
+        self.generator = generator
+        self.stage = stage
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.generator, self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    """Shared stand-in for _StageTimer while metrics are disabled."""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+METRICS = StageMetrics(enabled=METRICS_ENABLED)
+
+
+def generator_label(generator, tier=None):
+    """
+    Names the generator that actually answers, looking through wrappers.
+    
+    Args:
+        generator: The generator a request was sent to
+        tier (str): LAST_ANSWER.tier of the answer; picks the rule engine
+            or the model of a CascadeRouter, and names cache hits
             
-            # Decode the response
-            response = self.tokenizer.decode(output[0], skip_special_tokens=True)
-            
-            # Clean up the response
-            response = response.replace(prompt, "").strip()
-            
-            # Post-process to ensure quality
-            response = self._post_process_response(response)
-            
-            # Ensure response is in German and relevant
-            if not response or len(response) < 5:
-                return "Entschuldigung, ich konnte keine passende Antwort generieren."
-            
-            return response
-        except Exception as e:
-            logging.error(f"Error generating response: {str(e)}", exc_info=True)
-            return "Entschuldigung, bei der Generierung der Antwort ist ein Fehler aufgetreten."
-            
-    def _post_process_response(self, response):
+    Returns:
+        str: Class name of the answering generator
+    """
+    while True:
+        if isinstance(generator, CachedResponseGenerator) and tier == "cache":
+            return type(generator).__name__
+        if isinstance(generator, CascadeRouter) and tier == "rules":
+            generator = generator.rules
+        elif isinstance(generator, (CachedResponseGenerator, BatchScheduler, CascadeRouter)):
+            generator = generator.generator
+        else:
+            return type(generator).__name__
+
+
+class TimedStreamer:
+    """
+    Wraps a PostProcessingStreamer and adds up the time spent decoding.
+    
+    generate() calls put() with every new token; the wrapped streamer
+    decodes in there, so that time is the decode stage.
+    """
+    
+    def __init__(self, streamer):
+        self.streamer = streamer
+        self.decode_seconds = 0.0
+    
+    def put(self, value):
+        start = time.perf_counter()
+        self.streamer.put(value)
+        self.decode_seconds += time.perf_counter() - start
+    
+    def end(self):
+        start = time.perf_counter()
+        self.streamer.end()
+        self.decode_seconds += time.perf_counter() - start
+    
+    def __iter__(self):
+        return iter(self.streamer)
+
+
+class PrefillTimer:
+    """
+    Logits processor that only records when the first logits are ready.
+    
+    generate() calls it for the first time right after the prompt forward
+    pass, so the elapsed time up to that call is the prefill latency.
+    """
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.end = None
+    
+    def __call__(self, input_ids, scores):
+        if self.end is None:
+            self.end = time.perf_counter()
+        return scores
+    
+    @property
+    def seconds(self):
+        return None if self.end is None else self.end - self.start
+
+
+class SentenceFilter:
+    """
+    Incremental post-processing of generated text.
+    
+    Text is fed in while it is decoded, and every sentence is checked once,
+    when it ends, against a hash set of the sentences seen so far. A repeated
+    sentence, a non-German marker or a stop string sets stop_reason, so
+    generation can end right there instead of running to max_length; the
+    answer is everything before that point.
+    """
+    
+    NON_GERMAN_MARKERS = ("In English:", "Spanish:", "French:", "Italian:")
+    # A sentence ends at . ! or ? followed by whitespace
+    SENTENCE_END = re.compile(r"[.!?]+(?=\s)")
+    FALLBACK = "Ich verstehe. Wie kann ich weiter helfen?"
+    
+    def __init__(self, stop_strings=()):
         """
-        Post-processes the generated response to ensure it's clear and coherent.
+        Args:
+            stop_strings (tuple): Turn markers that end the answer
+        """
+        self.markers = [(stop, "stop_string") for stop in stop_strings]
+        self.markers += [(marker, "non_german") for marker in self.NON_GERMAN_MARKERS]
+        self._longest_marker = max(len(marker) for marker, _ in self.markers)
+        self.sentences = []
+        self._seen = set()
+        self._pending = ""
+        self.stop_reason = None
+    
+    def feed(self, text):
+        """
+        Adds newly decoded text.
         
         Args:
-            response (str): The raw generated response
+            text (str): The next piece of generated text
             
         Returns:
-            str: Processed response
+            str: "repetition", "non_german" or "stop_string" once the answer
+            is complete, otherwise None
         """
-        # Remove any non-German parts (simplistic but can catch obvious cases)
-        non_german_markers = ["In English:", "Spanish:", "French:", "Italian:"]
-        for marker in non_german_markers:
-            if marker in response:
-                response = response.split(marker)[0].strip()
-        
-        # Remove repetitions of the same sentence
-        lines = response.split('.')
-        processed_lines = []
-        for line in lines:
-            line = line.strip()
-            if line and line not in processed_lines:
-                processed_lines.append(line)
-        
-        # If response became too short after processing, return a default
-        if not processed_lines:
-            return "Ich verstehe. Wie kann ich weiter helfen?"
-            
-        # Rejoin with proper spacing and punctuation
-        response = '. '.join(processed_lines)
-        if not response.endswith('.') and not response.endswith('?') and not response.endswith('!'):
-            response += '.'
-            
+        if self.stop_reason is not None:
+            return self.stop_reason
+        # Only the unfinished sentence is kept, so markers are searched in
+        # the new text plus just enough of the old to catch one split by chunking
+        search_from = max(0, len(self._pending) - self._longest_marker + 1)
+        self._pending += text
+        cut = None
+        for marker, reason in self.markers:
+            index = self._pending.find(marker, search_from)
+            if index >= 0 and (cut is None or index < cut[0]):
+                cut = (index, reason)
+        if cut is not None:
+            self._pending = self._pending[:cut[0]]
+            self.stop_reason = cut[1]
+        self._take_sentences()
+        return self.stop_reason
+    
+    def _take_sentences(self):
+        """Moves finished sentences from the pending text into the answer."""
+        position = 0
+        for match in self.SENTENCE_END.finditer(self._pending):
+            sentence = self._pending[position:match.end()].strip()
+            position = match.end()
+            if not self._accept(sentence):
+                self._pending = ""
+                self.stop_reason = self.stop_reason or "repetition"
+                return
+        self._pending = self._pending[position:]
+    
+    def _accept(self, sentence):
+        """Adds a sentence unless it was seen before; returns False for a repeat."""
+        key = " ".join(sentence.rstrip(".!?").lower().split())
+        if not key:
+            return True
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        self.sentences.append(sentence)
+        return True
+    
+    def finish(self):
+        """
+        Returns:
+            str: The answer: the unique sentences, ending with punctuation
+        """
+        tail = self._pending.strip()
+        self._pending = ""
+        if tail:
+            self._accept(tail)
+        if not self.sentences:
+            return self.FALLBACK
+        response = " ".join(self.sentences)
+        if not response.endswith((".", "?", "!")):
+            response += "."
         return response
 
 
-def clean_response(response, prompt=""):
+class PostProcessingStreamer:
     """
-    Cleans up the response by removing the prompt part and unnecessary whitespace.
+    Streamer for model.generate() that decodes only the new token ids.
     
-    Args:
-        response (str): The response to clean
-        prompt (str): Optional prompt to remove from the beginning
-        
-    Returns:
-        str: Cleaned response
+    Each step decodes the new tokens together with the one before them and
+    keeps the text after that token's, so word-initial spaces survive and a
+    character split across tokens waits for its last byte. The text goes to
+    a SentenceFilter, whose stop_reason a GenerationStopper turns into the
+    end of generation, and to a queue the caller iterates over.
     """
-    if prompt and response.startswith(prompt):
-        response = response[len(prompt):]
+    
+    _END = object()
+    
+    def __init__(self, tokenizer, sentence_filter):
+        self.tokenizer = tokenizer
+        self.sentence_filter = sentence_filter
+        self._ids = []
+        self._prefix_offset = 0
+        self._read_offset = 0
+        self._prompt_skipped = False
+        self._queue = queue.Queue()
+    
+    def put(self, value):
+        """Called by generate() with the prompt first, then every new token."""
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+            return
+        if self.sentence_filter.stop_reason is not None:
+            return
+        self._ids.extend(value.reshape(-1).tolist())
+        self._emit(self._decode_new(final=False))
+    
+    def end(self):
+        """Called by generate() when it is done."""
+        if self.sentence_filter.stop_reason is None:
+            self._emit(self._decode_new(final=True))
+        self._queue.put(self._END)
+    
+    def _decode_new(self, final):
+        """Returns the text of the tokens since the last call."""
+        decode = self.tokenizer.decode
+        prefix = decode(self._ids[self._prefix_offset:self._read_offset], skip_special_tokens=True)
+        text = decode(self._ids[self._prefix_offset:], skip_special_tokens=True)
+        if len(text) <= len(prefix) or (text.endswith("\ufffd") and not final):
+            return ""
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(self._ids)
+        return text[len(prefix):]
+    
+    def _emit(self, text):
+        if text:
+            self.sentence_filter.feed(text)
+            self._queue.put(text)
+    
+    def __iter__(self):
+        while True:
+            text = self._queue.get()
+            if text is self._END:
+                return
+            yield text
+
+
+class SpeculationMonitor:
+    """
+    Decides per request whether assisted decoding is worth it.
+    
+    Keeps a moving average of the share of draft tokens the main model
+    accepts. When it falls below min_acceptance, verifying the drafts costs
+    more than it saves, so plain decoding is used for the next retry_after
+    requests before the draft model gets another chance.
+    """
+    
+    def __init__(self, min_acceptance=None, retry_after=None, smoothing=0.3):
+        self.min_acceptance = DRAFT_MIN_ACCEPTANCE if min_acceptance is None else min_acceptance
+        self.retry_after = DRAFT_RETRY_AFTER if retry_after is None else retry_after
+        self.smoothing = smoothing
+        self.acceptance = None
+        self.drafted = 0
+        self.accepted = 0
+        self.fallbacks = 0
+        self._plain_requests_left = 0
+        self._lock = threading.Lock()
+    
+    def use_draft(self):
+        """Returns True if the next request should use the draft model."""
+        with self._lock:
+            if self._plain_requests_left == 0:
+                return True
+            self._plain_requests_left -= 1
+            if self._plain_requests_left == 0:
+                # Judge the next try on its own numbers
+                self.acceptance = None
+            return False
+    
+    def record(self, drafted, accepted):
+        """
+        Adds the outcome of one assisted generation.
         
-    # Remove any special tokens
-    response = re.sub(r"<.*?>", "", response)
+        Args:
+            drafted (int): Tokens the draft model proposed
+            accepted (int): Tokens the main model kept
+        """
+        if drafted <= 0:
+            return
+        rate = accepted / drafted
+        with self._lock:
+            self.drafted += drafted
+            self.accepted += accepted
+            if self.acceptance is None:
+                self.acceptance = rate
+            else:
+                self.acceptance += self.smoothing * (rate - self.acceptance)
+            if self.acceptance < self.min_acceptance:
+                self._plain_requests_left = self.retry_after
+                self.fallbacks += 1
+                logging.info(
+                    "Draft acceptance %.0f%% is below %.0f%%, decoding without draft for %d requests",
+                    self.acceptance * 100, self.min_acceptance * 100, self.retry_after
+                )
+    
+    def stats(self):
+        """
+        Returns:
+            dict: Acceptance so far and whether the draft model is in use
+        """
+        with self._lock:
+            return {
+                "active": self._plain_requests_left == 0,
+                "acceptance": self.acceptance,
+                "overall_acceptance": self.accepted / self.drafted if self.drafted else 0.0,
+                "drafted": self.drafted,
+                "accepted": self.accepted,
+                "fallbacks": self.fallbacks
+            }
+
+
+class _DraftForwardCounter(threading.local):
+    """Draft model forward passes of the generate() running in this thread."""
+    calls = 0
+
+
+_DRAFT_FORWARDS = _DraftForwardCounter()
+
+
+def _count_draft_forward(module, args):
+    """Forward pre-hook on the draft model; each pass proposes one token."""
+    _DRAFT_FORWARDS.calls += 1
+
+
+class GenerationStopper:
+    """
+    Stopping criterion for one generate() call.
+    
+    Ends generation once the latency budget is spent, the caller cancels,
+    the new text contains a stop string or the SentenceFilter of a streamed
+    generation has the complete answer, and remembers which of these it was.
+    """
+    
+    # Only the end of the new text is decoded to look for stop strings
+    TAIL_TOKENS = 16
+    
+    def __init__(self, tokenizer, prompt_length, stop_strings=(), deadline_ms=None, cancel_event=None,
+                 sentence_filter=None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.stop_strings = tuple(stop_strings)
+        self.deadline = time.perf_counter() + deadline_ms / 1000 if deadline_ms else None
+        self.cancel_event = cancel_event
+        self.sentence_filter = sentence_filter
+        self.reason = None
+        # generate() calls this once per step; an assisted step adds the
+        # accepted draft tokens plus one token of the main model
+        self.steps = 0
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        self.steps += 1
+        if self.reason is None:
+            self.reason = self._check(input_ids)
+        return torch.full((input_ids.shape[0],), self.reason is not None, dtype=torch.bool, device=input_ids.device)
+    
+    def _check(self, input_ids):
+        """Returns the reason to stop now, or None to go on."""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            return "cancelled"
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return "budget"
+        if self.sentence_filter is not None:
+            # The streamer has already decoded this step's token
+            return self.sentence_filter.stop_reason
+        # Stop strings only apply to single sequences; a batch row can't stop alone
+        if self.stop_strings and input_ids.shape[0] == 1:
+            tail = self.tokenizer.decode(input_ids[0, self.prompt_length:][-self.TAIL_TOKENS:], skip_special_tokens=True)
+            if any(stop in tail for stop in self.stop_strings):
+                return "stop_string"
+        return None
+    
+    def end_reason(self, sequence, eos_token_ids):
+        """
+        Why the generation of one output sequence ended.
+        
+        Args:
+            sequence: Output token ids, prompt included
+            eos_token_ids (set): End-of-sequence token ids
+            
+        Returns:
+            str: "eos", "stop_string", "repetition", "non_german", "budget",
+            "cancelled" or "max_tokens"
+        """
+        if any(int(token) in eos_token_ids for token in sequence[self.prompt_length:]):
+            return "eos"
+        return self.reason or "max_tokens"
+
+
+def _serialized(method):
+    """Runs a method while holding the instance's _lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class TransformerResponseGenerator:
+    """
+    Response generator using HuggingFace Transformers library.
+    
+    generate_response() and generate_batch() run one at a time: they share
+    the model, the prefix cache, the context token cache and the last_*
+    attributes, and parallel forward passes on the same CPUs gain nothing.
+    """
+    
+    # Fixed instruction preamble; its tokens and key/value cache are computed
+    # once and reused for every request
+    SYSTEM_PROMPT = (
+        "Du bist ein intelligenter deutscher Assistent. "
+        "Deine Antworten sind immer klar, präzise und bleiben strikt beim Thema. "
+        "Du antwortest ausschließlich auf Deutsch, ohne Sprachmischung. "
+        "Deine Antworten sind kurz, direkt und hilfreich. "
+        "Du wiederholst dich nicht und sprichst nicht über Themen, die nicht angefragt wurden. "
+        "\n\n"
+    )
+    
+    # Turn markers the model writes when it starts inventing the next turn
+    STOP_STRINGS = ("Benutzer:", "\nDu:", "\nAssistent:")
+    
+    def __init__(self, cpu_precision=None, model=None, tokenizer=None, draft_model=None):
+        _import_transformers()
+        
+        self.model = model
+        self.tokenizer = tokenizer
+        self.model_name = "EleutherAI/pythia-410m"  # Smaller model to save resources
+        self.max_length = 100
+        if model is not None:
+            self.device = str(model.device)
+        else:
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.cpu_precision = cpu_precision or CPU_PRECISION
+        self.precision = None
+        self.system_prompt = self.SYSTEM_PROMPT
+        self.stop_strings = self.STOP_STRINGS
+        self.deadline_ms = GENERATION_DEADLINE_MS
+        
+        # Assisted decoding: a small model with the same tokenizer drafts
+        # tokens that the main model verifies in one forward pass
+        self.draft_model_name = DRAFT_MODEL_NAME
+        self.draft_model = None
+        self.speculation = SpeculationMonitor()
+        if draft_model is not None:
+            self.set_draft_model(draft_model)
+        
+        # (key, prefix input ids, past key values) for the system prompt
+        self._prefix_cache = None
+        self._context = None
+        self.last_prefill_seconds = None
+        self.last_prefill_tokens = 0
+        self.last_prompt_tokens = 0
+        self.last_generated_tokens = 0
+        self.last_end_reason = None
+        self.last_end_reasons = []
+        self._lock = threading.Lock()
+        
+        # Initialize model during class initialization unless one was passed in
+        if not self.is_model_loaded():
+            self._initialize_model()
+    
+    def _initialize_model(self):
+        """Initialize the model and tokenizer."""
+        try:
+            # A new model invalidates the cached system prompt keys/values
+            self._prefix_cache = None
+            
+            if self.device == "cuda":
+                self.precision = "float16"
+            else:
+                self.precision = resolve_cpu_precision(self.cpu_precision)
+            logging.info("Loading model %s on %s (%s)...", self.model_name, self.device, self.precision)
+            
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            torch_dtype = {"float16": torch.float16, "bfloat16": torch.bfloat16}.get(self.precision, torch.float32)
+            model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=torch_dtype)
+            if self.precision == "int8":
+                model = quantize_linear_layers(model)
+            self.model = model.to(self.device)
+            self.model.eval()
+            logging.info("Model loaded successfully with %s precision.", self.precision)
+            if self.draft_model_name and self.draft_model is None:
+                self._load_draft_model(torch_dtype)
+            return True
+        except Exception as e:
+            logging.error(f"Error loading model: {str(e)}", exc_info=True)
+            return False
+    
+    def _load_draft_model(self, torch_dtype):
+        """Loads the draft model; without it generation simply isn't assisted."""
+        try:
+            draft_model = AutoModelForCausalLM.from_pretrained(self.draft_model_name, torch_dtype=torch_dtype)
+            if self.precision == "int8":
+                draft_model = quantize_linear_layers(draft_model)
+            self.set_draft_model(draft_model.to(self.device))
+            logging.info("Draft model %s loaded for assisted decoding.", self.draft_model_name)
+        except Exception as e:
+            logging.warning(f"Could not load draft model {self.draft_model_name}: {str(e)}")
+    
+    def set_draft_model(self, draft_model):
+        """
+        Uses a draft model for assisted decoding, or none.
+        
+        Args:
+            draft_model: A causal LM with the main model's tokenizer, or None
+        """
+        if self.draft_model is not None:
+            self._draft_hook.remove()
+        self.draft_model = draft_model
+        self.speculation = SpeculationMonitor(self.speculation.min_acceptance, self.speculation.retry_after)
+        if draft_model is not None:
+            draft_model.eval()
+            self._draft_hook = draft_model.register_forward_pre_hook(_count_draft_forward)
+    
+    def is_model_loaded(self):
+        """Check if the model is loaded."""
+        return self.model is not None and self.tokenizer is not None
+    
+    def context_turns(self, user_text, chat_history=None):
+        """
+        Returns the history entries the prompt for this text would contain.
+        
+        Returns:
+            list: History entries, oldest first; None before the tokenizer
+            is loaded
+        """
+        if self.tokenizer is None:
+            return None
+        return self._get_context().packed_turns(user_text, chat_history)
+    
+    @_serialized
+    def generate_response(self, user_text, chat_history=None, on_chunk=None, cancel_event=None, deadline_ms=None):
+        """
+        Generate a response using the transformer model.
+        
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages
+            on_chunk (callable): Optional callback receiving raw text chunks
+                as soon as the model produces them
+            cancel_event (threading.Event): Stops generation once it is set
+            deadline_ms (float): Latency budget; defaults to self.deadline_ms
+            
+        Returns:
+            str: A generated response
+        """
+        if not self.is_model_loaded():
+            if not self._initialize_model():
+                return "Entschuldigung, ich konnte das Sprachmodell nicht laden. Ich verwende stattdessen einfache Antworten."
+        
+        try:
+            # The filter post-processes while the model generates
+            sentence_filter = SentenceFilter(self.stop_strings)
+            for chunk in self.stream_response(user_text, chat_history, cancel_event, deadline_ms, sentence_filter):
+                if on_chunk:
+                    on_chunk(chunk)
+            return self._finalize_response(sentence_filter=sentence_filter)
+        except Exception as e:
+            logging.error(f"Error generating response: {str(e)}", exc_info=True)
+            return "Entschuldigung, bei der Generierung der Antwort ist ein Fehler aufgetreten."
+    
+    @_serialized
+    def generate_batch(self, user_texts, chat_histories=None):
+        """
+        Generates responses for several inputs in one padded forward pass.
+        
+        The prompts are left-padded, so the shared system prompt cache can't
+        be reused here; batching amortizes the weights over all sequences.
+        
+        Args:
+            user_texts (list): The users' input texts
+            chat_histories (list): Optional chat history per input
+            
+        Returns:
+            list: One post-processed response per input
+        """
+        if not self.is_model_loaded():
+            if not self._initialize_model():
+                raise RuntimeError("Sprachmodell konnte nicht geladen werden.")
+        
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        chat_histories = chat_histories or [None] * len(user_texts)
+        with METRICS.stage(type(self).__name__, "tokenize"):
+            prefix_ids = self._get_context().turn_ids(self.system_prompt)
+            sequences = [
+                prefix_ids + self._get_context().build(text, history)
+                for text, history in zip(user_texts, chat_histories)
+            ]
+        
+        # Left-pad so every sequence ends where generation starts
+        width = max(len(sequence) for sequence in sequences)
+        pad_id = self.tokenizer.pad_token_id
+        input_ids = torch.tensor(
+            [[pad_id] * (width - len(sequence)) + sequence for sequence in sequences], device=self.device
+        )
+        attention_mask = torch.tensor(
+            [[0] * (width - len(sequence)) + [1] * len(sequence) for sequence in sequences], device=self.device
+        )
+        
+        prompt_length = input_ids.shape[-1]
+        stopper = GenerationStopper(self.tokenizer, prompt_length, deadline_ms=self.deadline_ms)
+        with torch.no_grad(), METRICS.stage(type(self).__name__, "generate"):
+            output = self.model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=self.max_length,
+                pad_token_id=pad_id,
+                stopping_criteria=[stopper],
+                **self._sampling_kwargs()
+            )
+        
+        eos_token_ids = self._eos_token_ids()
+        self.last_end_reasons = [stopper.end_reason(row, eos_token_ids) for row in output]
+        with METRICS.stage(type(self).__name__, "decode"):
+            texts = [self.tokenizer.decode(row[prompt_length:], skip_special_tokens=True) for row in output]
+        return [self._finalize_response(text) for text in texts]
+    
+    def _sampling_kwargs(self):
+        """Returns the sampling settings shared by all generate() calls."""
+        return dict(
+            num_return_sequences=1,
+            temperature=0.6,        # Lower temperature for more focused responses
+            top_p=0.85,             # More conservative sampling
+            repetition_penalty=1.5,  # Stronger penalty for repetition
+            no_repeat_ngram_size=3,  # Prevent repeating 3-grams
+            do_sample=True,
+            early_stopping=True
+        )
+    
+    def _eos_token_ids(self):
+        """Returns the model's end-of-sequence token ids as a set."""
+        eos = self.model.generation_config.eos_token_id
+        if eos is None:
+            eos = self.tokenizer.eos_token_id
+        if eos is None:
+            return set()
+        return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+    
+    def _finalize_response(self, response="", sentence_filter=None):
+        """
+        Post-processes generated text into the final answer.
+        
+        Args:
+            response (str): Raw generated text, if it wasn't streamed
+            sentence_filter (SentenceFilter): The filter a stream was fed to
+        """
+        with METRICS.stage(type(self).__name__, "post_process"):
+            if sentence_filter is None:
+                # Stop strings also drop a next turn the model started to invent
+                sentence_filter = SentenceFilter(self.stop_strings)
+                sentence_filter.feed(response)
+            response = sentence_filter.finish()
+        
+        # Ensure response is in German and relevant
+        if not response or len(response) < 5:
+            return "Entschuldigung, ich konnte keine passende Antwort generieren."
+        
+        return response
+    
+    def stream_response(self, user_text, chat_history=None, cancel_event=None, deadline_ms=None,
+                        sentence_filter=None):
+        """
+        Yields raw text chunks while the model is still generating.
+        
+        The chunks are not post-processed; the same text is fed to a
+        SentenceFilter as it is decoded, and generate_response() takes the
+        final answer from there. Generation ends at EOS, a stop string, a
+        repeated sentence, a non-German marker, the latency budget, a cancel
+        or max_length; the reason is kept in last_end_reason.
+        
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages
+            cancel_event (threading.Event): Stops generation once it is set
+            deadline_ms (float): Latency budget; defaults to self.deadline_ms
+            sentence_filter (SentenceFilter): Receives the decoded text
+            
+        Yields:
+            str: Newly decoded text
+        """
+        if sentence_filter is None:
+            sentence_filter = SentenceFilter(self.stop_strings)
+        # Only the packed history and the user turn need a forward pass; the
+        # system prompt comes from the prefix cache
+        with METRICS.stage(type(self).__name__, "tokenize"):
+            prefix_ids, past_key_values = self._get_prefix_cache()
+            turn_ids = torch.tensor([self._get_context().build(user_text, chat_history)], device=self.device)
+            input_ids = torch.cat([prefix_ids, turn_ids], dim=-1)
+        
+        # Create attention mask
+        attention_mask = torch.ones_like(input_ids)
+        
+        prefill_timer = PrefillTimer()
+        stopper = GenerationStopper(
+            self.tokenizer,
+            input_ids.shape[-1],
+            self.stop_strings,
+            deadline_ms=self.deadline_ms if deadline_ms is None else deadline_ms,
+            cancel_event=cancel_event,
+            sentence_filter=sentence_filter
+        )
+        streamer = PostProcessingStreamer(self.tokenizer, sentence_filter)
+        if METRICS.enabled:
+            streamer = TimedStreamer(streamer)
+        # Assisted decoding only works for single sequences, as here
+        draft_model = self.draft_model if self.draft_model is not None and self.speculation.use_draft() else None
+        generation_kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past_key_values,
+            logits_processor=[prefill_timer],
+            stopping_criteria=[stopper],
+            max_length=len(input_ids[0]) + self.max_length,
+            streamer=streamer,
+            **self._sampling_kwargs()
+        )
+        if draft_model is not None:
+            generation_kwargs["assistant_model"] = draft_model
+        
+        # model.generate() feeds the streamer from a worker thread; errors are
+        # handed back so they surface in the caller instead of hanging it
+        errors = []
+        outputs = []
+        draft_forwards = []
+        
+        def run_generate():
+            start = time.perf_counter()
+            try:
+                outputs.append(self.model.generate(**generation_kwargs))
+                draft_forwards.append(_DRAFT_FORWARDS.calls)
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+                return
+            if isinstance(streamer, TimedStreamer):
+                # Decoding happens inside generate(); count it separately
+                elapsed = time.perf_counter() - start
+                METRICS.record(type(self).__name__, "generate", elapsed - streamer.decode_seconds)
+                METRICS.record(type(self).__name__, "decode", streamer.decode_seconds)
+        
+        thread = threading.Thread(target=run_generate, daemon=True)
+        thread.start()
+        for chunk in streamer:
+            yield chunk
+        thread.join()
+        if errors:
+            raise errors[0]
+        
+        self.last_prefill_seconds = prefill_timer.seconds
+        self.last_prefill_tokens = turn_ids.shape[-1]
+        self.last_prompt_tokens = input_ids.shape[-1]
+        self.last_end_reason = stopper.end_reason(outputs[0][0], self._eos_token_ids())
+        LAST_ANSWER.end_reason = self.last_end_reason
+        if self.last_prefill_seconds is not None:
+            logging.info(
+                "Prompt: %d tokens (%d cached, %d history turns); prefill of %d tokens in %.1f ms",
+                self.last_prompt_tokens, prefix_ids.shape[-1], self._context.last_context_turns,
+                self.last_prefill_tokens, self.last_prefill_seconds * 1000,
+                extra={"timings": {"prefill_ms": round(self.last_prefill_seconds * 1000, 3)}}
+            )
+        new_tokens = outputs[0].shape[-1] - self.last_prompt_tokens
+        self.last_generated_tokens = new_tokens
+        timings = {"generated_tokens": new_tokens, "end_reason": self.last_end_reason}
+        if draft_model is not None:
+            # Every step adds the accepted drafts plus one token of the main model
+            drafted, accepted = draft_forwards[0], max(0, new_tokens - stopper.steps)
+            self.speculation.record(drafted, accepted)
+            timings.update(drafted_tokens=drafted, accepted_tokens=accepted)
+        logging.info(
+            "Generated %d tokens, ended by %s", new_tokens, self.last_end_reason,
+            extra={"timings": timings}
+        )
+    
+    def _get_context(self):
+        """Returns the context builder for the current tokenizer."""
+        if self._context is None or self._context.tokenizer is not self.tokenizer:
+            self._context = ConversationContext(self.tokenizer)
+        return self._context
+    
+    def _get_prefix_cache(self):
+        """
+        Returns the tokenized system prompt and a copy of its key/value cache.
+        
+        The cache is rebuilt when the model is reloaded or the system prompt
+        changes. generate() extends the cache in place, so every request gets
+        its own copy.
+        
+        Returns:
+            tuple: (prefix input ids, past key values)
+        """
+        key = (id(self.model), self.system_prompt)
+        if self._prefix_cache is None or self._prefix_cache[0] != key:
+            start = time.perf_counter()
+            prefix_ids = self.tokenizer(self.system_prompt, return_tensors="pt").input_ids.to(self.device)
+            with torch.no_grad():
+                past_key_values = self.model(prefix_ids, use_cache=True).past_key_values
+            self._prefix_cache = (key, prefix_ids, past_key_values)
+            logging.info(
+                "Cached system prompt: %d tokens in %.1f ms",
+                prefix_ids.shape[-1], (time.perf_counter() - start) * 1000
+            )
+        
+        _, prefix_ids, past_key_values = self._prefix_cache
+        return prefix_ids, copy.deepcopy(past_key_values)
+            
+    def _post_process_response(self, response):
+        """
+        Post-processes the generated response to ensure it's clear and coherent.
+        
+        Args:
+            response (str): The raw generated response
+            
+        Returns:
+            str: Processed response
+        """
+        # Cuts at non-German markers and a repeated sentence (see SentenceFilter)
+        sentence_filter = SentenceFilter()
+        sentence_filter.feed(response)
+        return sentence_filter.finish()
+
+
+class BatchScheduler:
+    """
+    Micro-batching front end for a TransformerResponseGenerator.
+    
+    Requests from concurrent callers are collected for up to max_wait_ms and
+    run as one padded batch of at most max_batch_size prompts. Offers the same
+    generate_response() interface as the generators, so it can be used in
+    their place.
+    """
+    
+    # How often a waiting caller checks for a cancel
+    POLL_SECONDS = 0.1
+    
+    def __init__(self, generator, max_batch_size=None, max_wait_ms=None):
+        self.generator = generator
+        self.max_batch_size = max_batch_size or BATCH_MAX_SIZE
+        self.max_wait_ms = BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="BatchScheduler", daemon=True)
+        self._worker.start()
+    
+    def is_model_loaded(self):
+        """Check if the underlying model is loaded."""
+        return self.generator.is_model_loaded()
+    
+    def context_turns(self, user_text, chat_history=None):
+        """Returns the history entries the prompt for this text would contain."""
+        return self.generator.context_turns(user_text, chat_history)
+    
+    def submit(self, user_text, chat_history=None):
+        """
+        Queues a request for the next batch.
+        
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages
+            
+        Returns:
+            Future: Resolves to the response text; its end_reason attribute
+            is set before the result
+        """
+        future = Future()
+        self._queue.put((user_text, chat_history, future))
+        return future
+    
+    def generate_response(self, user_text, chat_history=None, on_chunk=None, cancel_event=None):
+        """
+        Blocking wrapper around submit(); batched responses are not streamed,
+        so on_chunk receives the whole answer once.
+        
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages
+            on_chunk (callable): Optional callback for the answer
+            cancel_event (threading.Event): Drops the request from the queue,
+                or stops waiting for it; a running batch row can't stop on
+                its own, the batch still ends at the latency budget
+            
+        Returns:
+            str: A generated response, or "" once cancelled
+        """
+        future = self.submit(user_text, chat_history)
+        try:
+            while True:
+                try:
+                    response = future.result(timeout=self.POLL_SECONDS)
+                    break
+                except FutureTimeoutError:
+                    if cancel_event is not None and cancel_event.is_set():
+                        future.cancel()
+                        LAST_ANSWER.end_reason = "cancelled"
+                        return ""
+        except Exception as e:
+            logging.error(f"Error generating batched response: {str(e)}", exc_info=True)
+            return "Entschuldigung, bei der Generierung der Antwort ist ein Fehler aufgetreten."
+        LAST_ANSWER.end_reason = future.end_reason
+        if on_chunk:
+            on_chunk(response)
+        return response
+    
+    def close(self):
+        """Stops the worker after the queued requests have been served."""
+        self._queue.put(None)
+        self._worker.join()
+    
+    def _run(self):
+        """Worker loop: wait for a request, gather a batch, run it."""
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is None:
+                break
+            
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            
+            self._run_batch(batch)
+    
+    def _run_batch(self, batch):
+        """Runs one batch and hands every result back to its caller."""
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        
+        try:
+            responses = self.generator.generate_batch(
+                [user_text for user_text, _, _ in batch],
+                [chat_history for _, chat_history, _ in batch]
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        
+        self.batches += 1
+        self.requests += len(batch)
+        end_reasons = self.generator.last_end_reasons
+        for (_, _, future), response, end_reason in zip(batch, responses, end_reasons):
+            future.end_reason = end_reason
+            future.set_result(response)
+
+
+def available_cpus():
+    """Returns the CPUs this process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on Windows and macOS
+        return list(range(os.cpu_count() or 1))
+
+
+def plan_cpu_sets(replicas, cpus=None):
+    """
+    Splits the CPUs into disjoint sets of equal size, one per replica.
+    
+    Args:
+        replicas (int): Number of sets
+        cpus (list): CPUs to split; defaults to available_cpus()
+        
+    Returns:
+        list: One list of CPU numbers per replica; left-over CPUs are unused
+        
+    Raises:
+        ValueError: If there are fewer CPUs than replicas
+    """
+    cpus = available_cpus() if cpus is None else list(cpus)
+    if replicas < 1 or replicas > len(cpus):
+        raise ValueError(f"Cannot run {replicas} replicas on {len(cpus)} CPUs")
+    size = len(cpus) // replicas
+    return [cpus[index * size:(index + 1) * size] for index in range(replicas)]
+
+
+def configure_torch_threads(threads):
+    """
+    Sets torch's intra-op thread count.
+    
+    A model serves one request at a time, so inter-op parallelism only adds
+    threads competing for the same CPUs and is turned off.
+    """
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set before the first parallel operation
+        pass
+
+
+class _ReplicaCancel:
+    """cancel_event for a request running in a replica process."""
+    
+    def __init__(self, cancelled_id, request_id):
+        self.cancelled_id = cancelled_id
+        self.request_id = request_id
+    
+    def is_set(self):
+        return self.cancelled_id.value == self.request_id
+
+
+class _ReplicaLogHandler(logging.Handler):
+    """Hands log records from replica processes to this process's logging."""
+    
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def _replica_main(index, cpu_set, threads, factory, requests, responses, cancelled_id, log_queue):
+    """
+    Entry point of a replica process: load a model, then serve requests
+    from its queue one at a time until it receives None.
+    """
+    # The parent owns the log file; send records there instead
+    LOG_LISTENER.stop()
+    atexit.unregister(LOG_LISTENER.stop)
+    queue_handler = TracebackQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    logging.getLogger().handlers = [queue_handler]
+    
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_set)
+    _import_transformers()
+    configure_torch_threads(threads)
+    try:
+        generator = factory()
+    except Exception as e:
+        logging.error(f"Error loading model in replica {index}: {str(e)}", exc_info=True)
+        generator = None
+    responses.put(("ready", index, generator is not None))
+    if generator is None:
+        return
+    logging.info("Replica %d serving on CPUs %s with %d threads", index, cpu_set, threads)
+    
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        request_id, user_text, chat_history, deadline_ms, stream, request_context = item
+        REQUEST_ID.set(request_context)
+        cancel_event = _ReplicaCancel(cancelled_id, request_id)
+        if cancel_event.is_set():
+            responses.put(("done", request_id, "", None, "cancelled"))
+            continue
+        on_chunk = (lambda chunk: responses.put(("chunk", request_id, chunk))) if stream else None
+        LAST_ANSWER.reset()
+        try:
+            response = generator.generate_response(
+                user_text, chat_history, on_chunk=on_chunk, cancel_event=cancel_event, deadline_ms=deadline_ms
+            )
+            responses.put(("done", request_id, response, None, LAST_ANSWER.end_reason))
+        except Exception as e:
+            responses.put(("done", request_id, None, str(e), None))
+
+
+class ReplicaPool:
+    """
+    Runs model replicas in worker processes and sends every request to the
+    least-loaded one that is still running.
+    
+    Each replica is pinned to its own set of CPUs and runs as many torch
+    intra-op threads as it has CPUs, so replicas never compete for a core
+    and a 32-core host can serve several requests at full speed instead of
+    one request on threads that barely scale. Offers the same
+    generate_response() interface as the generators, so it can be used in
+    their place.
+    """
+    
+    # How often a waiting caller checks for a cancel or a dead replica
+    POLL_SECONDS = 0.1
+    
+    def __init__(self, replicas=None, threads=None, factory=None, cpu_sets=None):
+        """
+        Args:
+            replicas (int): Number of replicas; defaults to MODEL_REPLICAS
+            threads (int): Intra-op threads per replica; defaults to
+                MODEL_THREADS, and 0 means one per CPU of the replica
+            factory (callable): Picklable function returning a loaded
+                generator inside a replica; defaults to loading the model
+            cpu_sets (list): CPU numbers per replica; defaults to
+                plan_cpu_sets(replicas)
+        """
+        self.cpu_sets = cpu_sets or plan_cpu_sets(replicas or MODEL_REPLICAS)
+        threads = MODEL_THREADS if threads is None else threads
+        self.threads = [threads or len(cpu_set) for cpu_set in self.cpu_sets]
+        factory = factory or functools.partial(load_transformer_generator, replicas=1)
+        
+        # Forking a process whose torch thread pool is running is unsafe
+        context = multiprocessing.get_context("spawn")
+        self._responses = context.Queue()
+        self._log_queue = context.Queue()
+        self._log_listener = logging.handlers.QueueListener(self._log_queue, _ReplicaLogHandler())
+        self._log_listener.start()
+        self._requests = [context.Queue() for _ in self.cpu_sets]
+        self._cancelled = [context.Value("q", -1, lock=False) for _ in self.cpu_sets]
+        self._load = [0] * len(self.cpu_sets)
+        self.served = [0] * len(self.cpu_sets)
+        self._pending = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._reported = 0
+        self._failed = False
+        self._dead = set()
+        
+        self.processes = [
+            context.Process(
+                target=_replica_main, name=f"ModelReplica-{index}", daemon=True,
+                args=(index, cpu_set, threads, factory, self._requests[index], self._responses,
+                      self._cancelled[index], self._log_queue)
+            )
+            for index, (cpu_set, threads) in enumerate(zip(self.cpu_sets, self.threads))
+        ]
+        for process in self.processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, name="ReplicaPool", daemon=True)
+        self._collector.start()
+    
+    def wait_ready(self, timeout=None):
+        """
+        Waits until every replica has loaded its model.
+        
+        Returns:
+            bool: True if all replicas are ready to serve
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not self._ready.wait(self.POLL_SECONDS):
+            if not all(process.is_alive() for process in self.processes):
+                self._failed = True
+                return False
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+        return not self._failed
+    
+    def is_model_loaded(self):
+        """Check if every replica has loaded its model and one is still running."""
+        return self._ready.is_set() and not self._failed and bool(self._alive_replicas())
+    
+    def _alive_replicas(self):
+        """Returns the indexes of the running replicas; logs each one that has died."""
+        alive = []
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                alive.append(index)
+            elif index not in self._dead:
+                self._dead.add(index)
+                logging.error("Replica %d has stopped (exit code %s)", index, process.exitcode)
+        return alive
+    
+    def generate_response(self, user_text, chat_history=None, on_chunk=None, cancel_event=None, deadline_ms=None):
+        """
+        Generates the response on the least-loaded replica.
+        
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages
+            on_chunk (callable): Optional callback receiving streamed chunks
+            cancel_event (threading.Event): Stops generation once it is set
+            deadline_ms (float): Latency budget; defaults to the replica's
+            
+        Returns:
+            str: A generated response
+        """
+        request_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            alive = self._alive_replicas()
+            if not alive:
+                logging.error("No model replica is running")
+                return "Entschuldigung, bei der Generierung der Antwort ist ein Fehler aufgetreten."
+            replica = min(alive, key=self._load.__getitem__)
+            self._load[replica] += 1
+            self._pending[request_id] = (future, on_chunk, replica)
+        self._requests[replica].put(
+            (request_id, user_text, list(chat_history or []), deadline_ms, on_chunk is not None, REQUEST_ID.get())
+        )
+        
+        while True:
+            try:
+                response = future.result(timeout=self.POLL_SECONDS)
+                break
+            except FutureTimeoutError:
+                if cancel_event is not None and cancel_event.is_set():
+                    self._cancelled[replica].value = request_id
+                    cancel_event = None
+                if not self.processes[replica].is_alive():
+                    self._finish(request_id, None, f"Replica {replica} has stopped")
+            except Exception as e:
+                logging.error(f"Error generating response on replica {replica}: {str(e)}")
+                return "Entschuldigung, bei der Generierung der Antwort ist ein Fehler aufgetreten."
+        LAST_ANSWER.end_reason = future.end_reason
+        return response
+    
+    def stats(self):
+        """
+        Returns:
+            dict: CPU set, threads, liveness, running requests and served
+            requests per replica, and the indexes of the dead replicas
+        """
+        with self._lock:
+            alive = set(self._alive_replicas())
+            return {
+                "replicas": [
+                    {"cpus": cpu_set, "threads": threads, "alive": index in alive, "in_flight": load,
+                     "served": served}
+                    for index, (cpu_set, threads, load, served)
+                    in enumerate(zip(self.cpu_sets, self.threads, self._load, self.served))
+                ],
+                "dead": sorted(self._dead)
+            }
+    
+    def close(self, timeout=10):
+        """Stops the replicas after the queued requests have been served."""
+        for requests in self._requests:
+            requests.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._responses.put(None)
+        self._collector.join()
+        self._log_listener.stop()
+    
+    def _finish(self, request_id, response, error, end_reason=None):
+        """Hands a result back to the waiting caller."""
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+            if entry is None:
+                return
+            future, _, replica = entry
+            self._load[replica] -= 1
+            self.served[replica] += 1
+        if error is None:
+            future.end_reason = end_reason
+            future.set_result(response)
+        else:
+            future.set_exception(RuntimeError(error))
+    
+    def _collect(self):
+        """Collector loop: readiness, streamed chunks and results from the replicas."""
+        while True:
+            message = self._responses.get()
+            if message is None:
+                break
+            kind = message[0]
+            if kind == "chunk":
+                _, request_id, chunk = message
+                entry = self._pending.get(request_id)
+                if entry is not None and entry[1] is not None:
+                    entry[1](chunk)
+            elif kind == "done":
+                _, request_id, response, error, end_reason = message
+                self._finish(request_id, response, error, end_reason)
+            elif kind == "ready":
+                _, index, loaded = message
+                self._failed = self._failed or not loaded
+                self._reported += 1
+                if self._reported == len(self.processes) or not loaded:
+                    self._ready.set()
+
+
+UMLAUT_FOLDING = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+PUNCTUATION_REMOVAL = str.maketrans({char: " " for char in string.punctuation + "¿¡«»„“”‚‘’–…"})
+
+
+def normalize_query(user_text):
+    """
+    Normalizes a query for cache lookups.
+    
+    Folds case, umlauts and punctuation and collapses whitespace, so
+    "Was kannst du?" and "was  kannst du" share a key.
+    
+    Args:
+        user_text (str): The user's input text
+        
+    Returns:
+        str: The normalized query
+    """
+    text = user_text.lower().translate(UMLAUT_FOLDING).translate(PUNCTUATION_REMOVAL)
+    return " ".join(text.split())
+
+
+def history_fingerprint(turns):
+    """
+    Returns a short digest of the chat turns an answer depends on.
+    
+    Args:
+        turns (list): History entries, oldest first
+        
+    Returns:
+        str: Hex digest, or "" without turns
+    """
+    if not turns:
+        return ""
+    return hashlib.blake2b("\n".join(turns).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters."""
+    
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = RESPONSE_CACHE_SIZE if max_size is None else max_size
+        self.ttl = RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get(self, key):
+        """
+        Looks up a key and marks it as recently used.
+        
+        Returns:
+            str: The cached response, or None on a miss or expired entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, response):
+        """Stores a response, evicting the least recently used entries."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drops all entries; the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Returns size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class CachedResponseGenerator:
+    """
+    Wraps a response generator with a ResponseCache keyed on normalize_query()
+    and the history_fingerprint() of the turns the answer can depend on.
+    
+    Generators with a context_turns() method name those turns, e.g. only
+    the ones the model packs into its prompt, so a question repeated
+    mid-conversation hits as long as that part of the prompt matches. For
+    other generators every earlier turn counts.
+    
+    Time-dependent questions bypass the cache. Error answers, answers cut
+    off by the budget, max_length or a cancel, and rule answers, which pick
+    a random variant on every call, are never stored. Attributes not defined
+    here are forwarded to the wrapped generator.
+    """
+    
+    # End reasons of answers that stopped before they were complete
+    INCOMPLETE_END_REASONS = frozenset({"budget", "max_tokens", "cancelled"})
+    
+    def __init__(self, generator, cache=None, rules=None):
+        self.generator = generator
+        self.cache = cache if cache is not None else ResponseCache()
+        # Rule engine used to spot time-dependent questions
+        self.rules = rules or (generator if isinstance(generator, SimpleResponseGenerator) else SimpleResponseGenerator())
+    
+    def __getattr__(self, name):
+        return getattr(self.generator, name)
+    
+    def generate_response(self, user_text, chat_history=None, on_chunk=None, cancel_event=None):
+        """
+        Returns a cached response or generates and stores a new one.
+        
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages
+            on_chunk (callable): Optional streaming callback; a cache hit is
+                delivered as a single chunk
+            cancel_event (threading.Event): Passed on to the generator
+            
+        Returns:
+            str: A generated response
+        """
+        LAST_ANSWER.reset()
+        if self.rules.is_time_dependent(user_text):
+            self.cache.bypassed += 1
+            return self.generator.generate_response(
+                user_text, chat_history, on_chunk=on_chunk, cancel_event=cancel_event
+            )
+        
+        key = (normalize_query(user_text), history_fingerprint(self._context_turns(user_text, chat_history)))
+        response = self.cache.get(key)
+        if response is not None:
+            LAST_ANSWER.tier = "cache"
+            if on_chunk:
+                on_chunk(response)
+            return response
+        
+        response = self.generator.generate_response(
+            user_text, chat_history, on_chunk=on_chunk, cancel_event=cancel_event
+        )
+        # Don't keep failures or cut-off answers around; the next attempt may succeed
+        if cancel_event is not None and cancel_event.is_set():
+            return response
+        # Rule answers are instant anyway, and caching would freeze their variety
+        if LAST_ANSWER.tier == "rules":
+            return response
+        if LAST_ANSWER.end_reason in self.INCOMPLETE_END_REASONS:
+            return response
+        if not response.startswith("Entschuldigung,"):
+            self.cache.put(key, response)
+        return response
+    
+    def _context_turns(self, user_text, chat_history):
+        """Returns the history entries the answer can depend on."""
+        context_turns = getattr(self.generator, "context_turns", None)
+        turns = context_turns(user_text, chat_history) if context_turns is not None else None
+        if turns is None:
+            turns = ConversationContext.earlier_turns(user_text, chat_history)
+        return turns
+
+
+class CascadeStats:
+    """Thread-safe answer counts and latencies per cascade tier."""
+    
+    TIERS = ("rules", "model")
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.TIERS, 0)
+        self.seconds = dict.fromkeys(self.TIERS, 0.0)
+    
+    def record(self, tier, seconds):
+        """Count one answer of a tier."""
+        with self._lock:
+            self.counts[tier] += 1
+            self.seconds[tier] += seconds
+        METRICS.record("CascadeRouter", tier, seconds)
+    
+    def stats(self):
+        """
+        Returns:
+            dict: Answers, hit rate and mean latency per tier
+        """
+        with self._lock:
+            total = sum(self.counts.values())
+            result = {}
+            for tier in self.TIERS:
+                count = self.counts[tier]
+                result[tier] = {
+                    "answers": count,
+                    "hit_rate": count / total if total else 0.0,
+                    "mean_ms": self.seconds[tier] / count * 1000 if count else 0.0
+                }
+            return result
+
+
+class CascadeRouter:
+    """
+    Answers from the rule engine when it is confident and asks the wrapped
+    model otherwise.
+    
+    "danke" or "wie spät ist es" are answered instantly and correctly by
+    SimpleResponseGenerator, so only messages whose intent confidence is
+    below min_confidence reach the model. Attributes not defined here are
+    forwarded to the wrapped generator.
+    """
+    
+    def __init__(self, generator, rules=None, min_confidence=None, stats=None):
+        self.generator = generator
+        self.rules = rules or SimpleResponseGenerator()
+        self.min_confidence = CASCADE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.stats = stats if stats is not None else CascadeStats()
+    
+    def __getattr__(self, name):
+        return getattr(self.generator, name)
+    
+    def generate_response(self, user_text, chat_history=None, on_chunk=None, cancel_event=None):
+        """
+        Returns the rule answer for confident intents, otherwise the model's.
+        
+        Args:
+            user_text (str): The user's input text
+            chat_history (list): Previous chat messages
+            on_chunk (callable): Optional streaming callback; a rule answer
+                is delivered as a single chunk
+            cancel_event (threading.Event): Passed on to the model
+            
+        Returns:
+            str: A generated response
+        """
+        start = time.perf_counter()
+        intent, confidence = self.rules.classify_intent(user_text)
+        if intent is not None and confidence >= self.min_confidence:
+            response = self.rules.answer_intent(intent)
+            LAST_ANSWER.tier = "rules"
+            if on_chunk:
+                on_chunk(response)
+            self.stats.record("rules", time.perf_counter() - start)
+            return response
+        
+        response = self.generator.generate_response(
+            user_text, chat_history, on_chunk=on_chunk, cancel_event=cancel_event
+        )
+        LAST_ANSWER.tier = "model"
+        self.stats.record("model", time.perf_counter() - start)
+        return response
+
+
+class ScrollbackLog:
+    """
+    Append-only on-disk log of chat messages with random access by index.
+    
+    Only the byte offset of each message stays in memory, so the GUI can drop
+    old messages from the display and page them back in later.
+    """
+    
+    def __init__(self, path=None):
+        # Without a path the log is an anonymous temp file removed on close
+        self._file = open(path, "w+b") if path else tempfile.TemporaryFile(mode="w+b")
+        self._offsets = array("Q")
+        self._end = 0
+    
+    def __len__(self):
+        return len(self._offsets)
+    
+    def append(self, kind, text):
+        """
+        Appends a message.
+        
+        Args:
+            kind (str): Message kind, e.g. "user", "assistant" or "system"
+            text (str): The displayed text
+            
+        Returns:
+            int: Index of the message
+        """
+        line = (json.dumps([kind, text], ensure_ascii=False) + "\n").encode("utf-8")
+        self._file.seek(self._end)
+        self._file.write(line)
+        self._offsets.append(self._end)
+        self._end += len(line)
+        return len(self._offsets) - 1
+    
+    def read(self, start, stop):
+        """
+        Reads messages start..stop-1 with a single seek.
+        
+        Returns:
+            list: (kind, text) tuples in log order
+        """
+        start, stop = max(0, start), min(stop, len(self._offsets))
+        if start >= stop:
+            return []
+        end = self._offsets[stop] if stop < len(self._offsets) else self._end
+        self._file.flush()
+        self._file.seek(self._offsets[start])
+        data = self._file.read(end - self._offsets[start])
+        return [tuple(json.loads(line)) for line in data.decode("utf-8").splitlines()]
+    
+    def clear(self):
+        """Drops all messages."""
+        self._file.seek(0)
+        self._file.truncate()
+        self._offsets = array("Q")
+        self._end = 0
+    
+    def close(self):
+        """Closes the log file."""
+        self._file.close()
+
+
+class TranscriptStore:
+    """
+    SQLite transcript of all conversations with an FTS5 full-text index.
+    
+    record() only puts the message on a queue; a background writer inserts
+    queued messages in batched transactions, so callers never wait on disk.
+    """
+    
+    _FLUSH = object()  # Queue marker: write the current batch right away
+    
+    def __init__(self, path=None, batch_size=500, flush_interval=0.5):
+        self.path = path or TRANSCRIPT_DB_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fts_enabled = True
+        self._queue = queue.Queue()
+        self._closed = False
+        
+        connection = self._connect()
+        self._create_schema(connection)
+        connection.close()
+        
+        self._writer = threading.Thread(target=self._run, name="TranscriptStore", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+    
+    def _connect(self):
+        """Open a connection; WAL lets searches run while the writer inserts."""
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+    
+    def _create_schema(self, connection):
+        """Create the message table and its full-text index."""
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY, session TEXT NOT NULL, role TEXT NOT NULL, "
+                "text TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session, id)")
+            try:
+                # External-content index kept in sync by a trigger; diacritics
+                # are folded so "uber" finds "über"
+                connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                    "text, content='messages', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2')"
+                )
+                connection.execute(
+                    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+                    "INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text); END"
+                )
+            except sqlite3.OperationalError as e:
+                logging.warning(f"FTS5 not available, transcript search falls back to LIKE: {str(e)}")
+                self.fts_enabled = False
+    
+    def record(self, session, role, text):
+        """
+        Queue a message for writing; never blocks.
+        
+        Args:
+            session (str): Conversation id
+            role (str): "user" or "assistant"
+            text (str): Message text
+        """
+        if not self._closed:
+            self._queue.put((session, role, text, time.time()))
+    
+    def flush(self):
+        """Block until every queued message has been written."""
+        if not self._closed:
+            # Cuts the writer's batching wait short
+            self._queue.put(self._FLUSH)
+        self._queue.join()
+    
+    def close(self):
+        """Write the remaining messages and stop the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+    
+    def _run(self):
+        """Writer loop: gather messages and insert them in batches."""
+        connection = self._connect()
+        running = True
+        while running:
+            batch = []
+            taken = 1
+            item = self._queue.get()
+            deadline = time.perf_counter() + self.flush_interval
+            while item is not None and item is not self._FLUSH:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.perf_counter()))
+                    taken += 1
+                except queue.Empty:
+                    break
+            if item is None:
+                running = False
+            
+            if batch:
+                try:
+                    with connection:
+                        connection.executemany(
+                            "INSERT INTO messages (session, role, text, created) VALUES (?, ?, ?, ?)", batch
+                        )
+                except sqlite3.Error as e:
+                    logging.error(f"Error writing transcript: {str(e)}", exc_info=True)
+            for _ in range(taken):
+                self._queue.task_done()
+        connection.close()
+    
+    def search(self, query, limit=20):
+        """
+        Full-text search over all stored messages, best matches first.
+        
+        Args:
+            query (str): Search words; each matches as a prefix
+            limit (int): Maximum number of results
+            
+        Returns:
+            list: (session, role, text, created) tuples
+        """
+        words = query.split()
+        if not words:
+            return []
+        # Include messages still waiting in the write queue
+        self.flush()
+        connection = self._connect()
+        try:
+            if self.fts_enabled:
+                match = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+                return connection.execute(
+                    "SELECT m.session, m.role, m.text, m.created FROM messages_fts "
+                    "JOIN messages m ON m.id = messages_fts.rowid "
+                    "WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+            conditions = " AND ".join("text LIKE ?" for _ in words)
+            return connection.execute(
+                f"SELECT session, role, text, created FROM messages WHERE {conditions} "
+                "ORDER BY id DESC LIMIT ?",
+                [f"%{word}%" for word in words] + [limit]
+            ).fetchall()
+        finally:
+            connection.close()
+
+
+def open_transcript_store():
+    """
+    Opens the transcript store.
+    
+    Returns:
+        TranscriptStore: The store, or None if the database can't be opened
+    """
+    try:
+        return TranscriptStore()
+    except sqlite3.Error as e:
+        logging.error(f"Error opening transcript store: {str(e)}", exc_info=True)
+        return None
+
+
+def format_metrics():
+    """
+    Returns the stage timings in the Prometheus text format for display.
+    
+    Returns:
+        str: Metrics text, or a hint if there is nothing to show
+    """
+    if not METRICS.enabled:
+        return "Die Zeitmessung ist deaktiviert (KI_ASSISTENT_METRICS=0)."
+    text = METRICS.prometheus_text()
+    if "_count" not in text:
+        return "Es wurden noch keine Antwortzeiten gemessen."
+    return text.strip()
+
+
+def search_transcripts(store, query):
+    """
+    Searches the transcript store and formats the hits for display.
+    
+    Args:
+        store (TranscriptStore): The transcript store
+        query (str): Search words
+        
+    Returns:
+        str: Formatted search results
+    """
+    if store is None:
+        return "Der Verlauf ist nicht verfügbar."
+    if not query:
+        return "Bitte gib einen Suchbegriff für den Verlauf an."
+    
+    start = time.perf_counter()
+    results = store.search(query, limit=10)
+    elapsed = (time.perf_counter() - start) * 1000
+    if not results:
+        return f"Im Verlauf wurde nichts zu '{query}' gefunden."
+    
+    lines = [f"{len(results)} Treffer für '{query}' im Verlauf ({elapsed:.1f} ms):"]
+    for _, role, text, created in results:
+        speaker = "Du" if role == "user" else "Assistent"
+        stamp = datetime.datetime.fromtimestamp(created).strftime("%d.%m.%Y %H:%M")
+        lines.append(f"- [{stamp}] {speaker}: {text}")
+    return "\n".join(lines)
+
+
+def build_knowledge_index(source_path, index_path=None):
+    """
+    Builds the knowledge index from a JSON-lines file of snippets.
+    
+    Each line is an object with "title" and "text"; the built-in extended
+    responses are always included.
+    
+    Args:
+        source_path (str): JSON-lines snippets
+        index_path (str): Output file; defaults to KNOWLEDGE_INDEX_PATH
+        
+    Returns:
+        KnowledgeIndex: The new index
+    """
+    def documents():
+        yield from SimpleResponseGenerator().extended_responses.items()
+        with open(source_path, encoding="utf-8") as source:
+            for line in source:
+                if line.strip():
+                    snippet = json.loads(line)
+                    yield snippet.get("title", ""), snippet["text"]
+    
+    index_path = index_path or KNOWLEDGE_INDEX_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    start = time.perf_counter()
+    index = KnowledgeIndex.build(documents(), index_path)
+    logging.info(
+        "Built knowledge index: %d snippets, %d terms in %.2fs",
+        index.document_count, index.term_count, time.perf_counter() - start
+    )
+    return index
+
+
+def load_transformer_generator(replicas=None):
+    """
+    Loads the transformer response generator.
+    
+    Meant to run on a background worker so the front ends stay responsive
+    while the model warms up.
+    
+    Args:
+        replicas (int): Model replicas; more than one starts a ReplicaPool.
+            Defaults to MODEL_REPLICAS
+    
+    Returns:
+        TransformerResponseGenerator or ReplicaPool: The loaded generator,
+        or None on failure
+    """
+    start = time.perf_counter()
+    replicas = MODEL_REPLICAS if replicas is None else replicas
+    if replicas > 1:
+        try:
+            pool = ReplicaPool(replicas)
+        except Exception as e:
+            logging.error(f"Error starting model replicas: {str(e)}", exc_info=True)
+            return None
+        if not pool.wait_ready():
+            logging.error("Model replicas failed to load.")
+            pool.close()
+            return None
+        logging.info("Model warm-up finished in %.2fs (%d replicas)", time.perf_counter() - start, replicas)
+        return pool
+    
+    if MODEL_THREADS:
+        _import_transformers()
+        configure_torch_threads(MODEL_THREADS)
+    try:
+        generator = TransformerResponseGenerator()
+    except Exception as e:
+        logging.error(f"Error during model warm-up: {str(e)}", exc_info=True)
+        return None
+    
+    if not generator.is_model_loaded():
+        return None
+    
+    logging.info("Model warm-up finished in %.2fs", time.perf_counter() - start)
+    return generator
+
+
+def log_startup_timing(frontend):
+    """
+    Logs how long the module import took and how long until the front end
+    accepted input, so startup regressions show up in the log.
+    
+    Args:
+        frontend (str): Name of the front end, e.g. "gui" or "cli"
+        
+    Returns:
+        float: Seconds from process start to interactive
+    """
+    time_to_interactive = time.perf_counter() - STARTUP_TIME
+    logging.info(
+        "Startup (%s): import %.3fs, time to interactive %.3fs", frontend, IMPORT_SECONDS, time_to_interactive
+    )
+    return time_to_interactive
+
+
+def clean_response(response, prompt=""):
+    """
+    Cleans up the response by removing the prompt part and unnecessary whitespace.
+    
+    Args:
+        response (str): The response to clean
+        prompt (str): Optional prompt to remove from the beginning
+        
+    Returns:
+        str: Cleaned response
+    """
+    if prompt and response.startswith(prompt):
+        response = response[len(prompt):]
+        
+    # Remove any special tokens
+    response = re.sub(r"<.*?>", "", response)
+    
+    # Clean up excessive whitespace
+    response = re.sub(r"\s+", " ", response)
+    
+    return response.strip()
+
+
+Command = namedtuple("Command", "name handler usage help exact desktop")
+
+UMLAUT_STRIPPING = str.maketrans({"ä": "a", "ö": "o", "ü": "u"})
+
+
+class CommandRegistry:
+    """
+    Commands shared by the GUI, the CLI and the HTTP API.
+    
+    Aliases are stored in a character trie, so parsing walks the input once
+    no matter how many commands are registered; the longest alias that ends
+    at a word boundary wins. Umlauts are matched in any spelling: "öffne",
+    "oeffne" and "offne" are the same alias.
+    
+    A handler receives the front end and the arguments. Front ends provide
+    show_response(text), show_info(text), clear_chat(), exit() and a
+    transcripts attribute.
+    """
+    
+    _END = ""  # Trie key of the command that ends at a node
+    _FOLDING = {chr(code): folded for code, folded in UMLAUT_FOLDING.items()}
+    
+    def __init__(self):
+        self.commands = OrderedDict()
+        self._trie = {}
+    
+    def register(self, name, aliases, handler, usage=None, help=None, exact=False, desktop=False):
+        """
+        Adds a command.
+        
+        Args:
+            name (str): Command name returned by parse()
+            aliases (list): Words that start the command
+            handler (callable): handler(frontend, args)
+            usage (str): How to call it, for the help text; hidden if None
+            help (str): What it does, for the help text
+            exact (bool): The alias must be the whole input; args are None
+            desktop (bool): Acts on the local desktop (not run by the API)
+            
+        Raises:
+            ValueError: If an alias is already taken by another command
+        """
+        command = Command(name, handler, usage, help, exact, desktop)
+        for alias in aliases:
+            for spelling in {alias.lower(), alias.lower().translate(UMLAUT_STRIPPING)}:
+                node = self._trie
+                for char in spelling.translate(UMLAUT_FOLDING):
+                    node = node.setdefault(char, {})
+                existing = node.get(self._END)
+                if existing is not None and existing.name != name:
+                    raise ValueError(f"Alias '{alias}' is already used by command '{existing.name}'")
+                node[self._END] = command
+        self.commands[name] = command
+        return command
+    
+    def command(self, name, aliases, **options):
+        """Decorator form of register() for handler functions."""
+        def decorator(handler):
+            self.register(name, aliases, handler, **options)
+            return handler
+        return decorator
+    
+    def get(self, name):
+        """Returns the command registered under name, or None."""
+        return self.commands.get(name)
+    
+    def parse(self, user_text):
+        """
+        Finds the command at the start of user_text.
+        
+        Args:
+            user_text (str): The user's input text
+            
+        Returns:
+            tuple: (command name, args) or (None, None) if no command is detected
+        """
+        text = user_text.strip().lower()
+        node = self._trie
+        match = None
+        for index, char in enumerate(text):
+            folded = self._FOLDING.get(char)
+            if folded is None:
+                node = node.get(char)
+            else:
+                for part in folded:
+                    node = node.get(part)
+                    if node is None:
+                        break
+            if node is None:
+                break
+            command = node.get(self._END)
+            if command is None:
+                continue
+            rest = text[index + 1:]
+            if not rest:
+                match = (command, "")
+            elif not command.exact and rest[0].isspace():
+                match = (command, rest)
+        
+        if match is None:
+            return None, None
+        command, rest = match
+        return command.name, None if command.exact else rest.strip()
     
-    # Clean up excessive whitespace
-    response = re.sub(r"\s+", " ", response)
+    def dispatch(self, frontend, name, args):
+        """Runs the handler of a parsed command."""
+        self.commands[name].handler(frontend, args)
     
-    return response.strip()
+    def help_text(self):
+        """Builds the help text from the registered commands."""
+        lines = ["", "Verfügbare Befehle:"]
+        lines += [f"- {command.usage}: {command.help}" for command in self.commands.values() if command.usage]
+        lines += ["", "Für alle anderen Anfragen stehe ich als KI-Assistent zur Verfügung!", ""]
+        return "\n".join(lines)
+
+
+COMMANDS = CommandRegistry()
 
 
 def parse_command(user_text):
@@ -351,22 +3609,7 @@ def parse_command(user_text):
     Returns:
         tuple: (command_type, command_args) or (None, None) if no command is detected
     """
-    user_text = user_text.strip().lower()
-    
-    if user_text.startswith("öffne url") or user_text.startswith("offne url"):
-        return "open_url", user_text.replace("öffne url", "").replace("offne url", "").strip()
-    elif user_text.startswith("öffne") or user_text.startswith("offne"):
-        return "open_program", user_text.replace("öffne", "").replace("offne", "").strip()
-    elif user_text.startswith("suche"):
-        return "search", user_text.replace("suche", "").strip()
-    elif user_text == "hilfe" or user_text == "help":
-        return "help", None
-    elif user_text == "lösche chat" or user_text == "losche chat" or user_text == "clear":
-        return "clear_chat", None
-    elif user_text == "exit" or user_text == "quit" or user_text == "beenden":
-        return "exit", None
-    
-    return None, None
+    return COMMANDS.parse(user_text)
 
 
 def get_help_text():
@@ -376,18 +3619,26 @@ def get_help_text():
     Returns:
         str: Formatted help text
     """
-    help_text = """
-    Verfügbare Befehle:
-    - öffne [programm]: Öffnet ein Programm (z.B. notepad, calc, explorer)
-    - öffne url [webadresse]: Öffnet eine Webseite
-    - suche [suchbegriff]: Sucht nach Informationen
-    - hilfe: Zeigt diese Hilfe an
-    - lösche chat: Löscht den Chat-Verlauf
-    - exit/quit/beenden: Beendet den Assistenten
+    return COMMANDS.help_text()
+
+
+def load_command_plugins(modules=None):
+    """
+    Imports command plugins and lets them register their commands.
     
-    Für alle anderen Anfragen stehe ich als KI-Assistent zur Verfügung!
+    A plugin is a module with a register_commands(registry) function.
+    
+    Args:
+        modules (list): Module names; defaults to KI_ASSISTENT_PLUGINS
     """
-    return help_text
+    if modules is None:
+        modules = [name.strip() for name in COMMAND_PLUGINS.split(",") if name.strip()]
+    for module_name in modules:
+        try:
+            importlib.import_module(module_name).register_commands(COMMANDS)
+            logging.info("Loaded command plugin %s", module_name)
+        except Exception as e:
+            logging.error(f"Error loading command plugin {module_name}: {str(e)}", exc_info=True)
 
 
 def open_program(program_name):
@@ -449,30 +3700,589 @@ def web_search(query):
         return f"Es gab einen Fehler bei der Suche nach '{query}': {str(e)}"
 
 
+# Built-in commands, in the order of the help text
+@COMMANDS.command("open_program", ["öffne"], usage="öffne [programm]",
+                  help="Öffnet ein Programm (z.B. notepad, calc, explorer)", desktop=True)
+def _open_program_command(frontend, args):
+    frontend.show_response(open_program(args))
+
+
+@COMMANDS.command("open_url", ["öffne url"], usage="öffne url [webadresse]",
+                  help="Öffnet eine Webseite", desktop=True)
+def _open_url_command(frontend, args):
+    frontend.show_response(open_url(args))
+
+
+@COMMANDS.command("search", ["suche"], usage="suche [suchbegriff]",
+                  help="Sucht nach Informationen", desktop=True)
+def _search_command(frontend, args):
+    frontend.show_response(web_search(args))
+
+
+@COMMANDS.command("search_history", ["verlauf"], usage="verlauf [suchbegriff]",
+                  help="Durchsucht frühere Unterhaltungen")
+def _search_history_command(frontend, args):
+    frontend.search_history(args)
+
+
+@COMMANDS.command("metrics", ["metriken", "metrics"], usage="metriken",
+                  help="Zeigt die Antwortzeiten je Verarbeitungsschritt", exact=True)
+def _metrics_command(frontend, args):
+    frontend.show_info(format_metrics())
+
+
+@COMMANDS.command("help", ["hilfe", "help"], usage="hilfe", help="Zeigt diese Hilfe an", exact=True)
+def _help_command(frontend, args):
+    frontend.show_info(get_help_text())
+
+
+@COMMANDS.command("clear_chat", ["lösche chat", "clear"], usage="lösche chat",
+                  help="Löscht den Chat-Verlauf", exact=True)
+def _clear_chat_command(frontend, args):
+    frontend.clear_chat()
+    frontend.show_info("Der Chat wurde gelöscht.")
+
+
+@COMMANDS.command("exit", ["exit", "quit", "beenden"], usage="exit/quit/beenden",
+                  help="Beendet den Assistenten", exact=True)
+def _exit_command(frontend, args):
+    frontend.exit()
+
+
+# Headless HTTP service
+HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 503: "Service Unavailable"
+}
+
+
+class AssistantServer:
+    """
+    Local asyncio HTTP/1.1 API around parse_command and the response generators.
+    
+    Endpoints:
+        GET  /health       -> {"status": "ok", "model_loaded": bool, "cache": {...},
+                               "cascade": {...} once the model is loaded,
+                               "replicas": [...] and "dead_replicas": [...]
+                               with replicas; "degraded" if one has died}
+        GET  /metrics      -> stage timings in the Prometheus text format
+        POST /chat         -> {"response": str}
+        POST /chat/stream  -> chunked application/x-ndjson, one {"chunk": str}
+                              line per chunk and a final {"response": str, "done": true}
+    
+    POST bodies are JSON objects with a "message" field. Each keep-alive
+    connection is its own session with its own chat history. Desktop commands
+    (öffne, suche) are reported back to the client instead of being run on
+    the server. Model work runs in a thread pool so the event loop never blocks.
+    """
+    
+    MAX_BODY_SIZE = 64 * 1024
+    
+    def __init__(self, host="127.0.0.1", port=8765, max_workers=8):
+        self.host = host
+        self.port = port
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="AssistantServer")
+        self.response_generator = CachedResponseGenerator(SimpleResponseGenerator())
+        self.stream_generator = self.response_generator
+        self.model_loaded = False
+        self.scheduler = None
+        self.replica_pool = None
+        self.cascade_stats = None
+        self.transcripts = open_transcript_store()
+        self._server = None
+        self._connections = set()
+        self._in_flight = 0
+        self._closing = False
+    
+    async def start(self):
+        """Start listening and warm up the transformer model in the background."""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info("Assistant server listening on http://%s:%d", self.host, self.port)
+        
+        if TRANSFORMERS_AVAILABLE:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(self.executor, self._warm_up)
+    
+    def _warm_up(self):
+        """Swap in the transformer model once it has loaded."""
+        generator = load_transformer_generator()
+        if generator is None:
+            return
+        # Plain requests are micro-batched; streams need the generator itself,
+        # which runs them one at a time with the batches.
+        # Replicas already serve requests in parallel, so a pool is used as is.
+        # Both paths share one cache since they answer with the same model.
+        # Confident rule answers never reach the model (see CascadeRouter)
+        cache = ResponseCache()
+        rules = SimpleResponseGenerator()
+        self.cascade_stats = CascadeStats()
+        if isinstance(generator, ReplicaPool):
+            self.replica_pool = generator
+            batch_generator = generator
+        else:
+            self.scheduler = BatchScheduler(generator)
+            batch_generator = self.scheduler
+        self.response_generator = CachedResponseGenerator(
+            CascadeRouter(batch_generator, rules, stats=self.cascade_stats), cache, rules
+        )
+        self.stream_generator = CachedResponseGenerator(
+            CascadeRouter(generator, rules, stats=self.cascade_stats), cache, rules
+        )
+        self.model_loaded = True
+    
+    async def serve_until_stopped(self):
+        """Serve until SIGINT/SIGTERM, then shut down gracefully."""
+        await self.start()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C arrives as KeyboardInterrupt instead
+                pass
+        try:
+            await stop.wait()
+        finally:
+            await self.shutdown()
+    
+    async def shutdown(self, timeout=30):
+        """
+        Stop accepting connections, let running requests finish and close
+        idle keep-alive connections.
+        
+        Args:
+            timeout (float): Seconds to wait for running requests
+        """
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        
+        deadline = time.perf_counter() + timeout
+        while self._in_flight and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        
+        for task in list(self._connections):
+            task.cancel()
+        if self._connections:
+            await asyncio.gather(*self._connections, return_exceptions=True)
+        
+        if self.scheduler is not None:
+            self.scheduler.close()
+        if self.replica_pool is not None:
+            self.replica_pool.close()
+        if self.transcripts:
+            self.transcripts.close()
+        self.executor.shutdown(wait=False)
+        logging.info("Assistant server stopped.")
+    
+    async def _handle_connection(self, reader, writer):
+        """Serve HTTP requests on one connection until it is closed."""
+        task = asyncio.current_task()
+        self._connections.add(task)
+        history = deque(maxlen=20)  # Per-connection session history
+        session_id = uuid.uuid4().hex
+        try:
+            while not self._closing:
+                request = await self._read_request(reader, writer)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                
+                self._in_flight += 1
+                try:
+                    keep_alive = await self._dispatch(method, path, body, history, session_id, writer, keep_alive)
+                finally:
+                    self._in_flight -= 1
+                if not keep_alive:
+                    break
+        except (asyncio.CancelledError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.error(f"Error in server connection: {str(e)}", exc_info=True)
+        finally:
+            self._connections.discard(task)
+            writer.close()
+    
+    async def _read_request(self, reader, writer):
+        """
+        Read one HTTP request.
+        
+        Returns:
+            tuple: (method, path, headers, body) or None if the connection closed
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            await self._send_json(writer, 400, {"error": "Ungültige Anfrage."}, False)
+            return None
+        
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            await self._send_json(writer, 400, {"error": "Ungültige Content-Length."}, False)
+            return None
+        if length > self.MAX_BODY_SIZE:
+            await self._send_json(writer, 413, {"error": "Anfrage ist zu groß."}, False)
+            return None
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], headers, body
+    
+    async def _dispatch(self, method, path, body, history, session_id, writer, keep_alive):
+        """Route a request; returns whether the connection stays open."""
+        if path == "/health":
+            payload = {
+                "status": "ok",
+                "model_loaded": self.model_loaded,
+                "cache": self.response_generator.cache.stats()
+            }
+            if self.cascade_stats is not None:
+                payload["cascade"] = self.cascade_stats.stats()
+            if self.replica_pool is not None:
+                replica_stats = self.replica_pool.stats()
+                payload["replicas"] = replica_stats["replicas"]
+                payload["dead_replicas"] = replica_stats["dead"]
+                if replica_stats["dead"]:
+                    payload["status"] = "degraded"
+            await self._send_json(writer, 200, payload, keep_alive)
+            return keep_alive
+        if path == "/metrics":
+            # Prometheus scrape endpoint
+            data = METRICS.prometheus_text().encode("utf-8")
+            writer.write(self._status_head(200, "text/plain; version=0.0.4", keep_alive, length=len(data)) + data)
+            await writer.drain()
+            return keep_alive
+        if path not in ("/chat", "/chat/stream"):
+            await self._send_json(writer, 404, {"error": "Unbekannter Pfad."}, keep_alive)
+            return keep_alive
+        if method != "POST":
+            await self._send_json(writer, 405, {"error": "Nur POST wird unterstützt."}, keep_alive)
+            return keep_alive
+        
+        try:
+            message = str(json.loads(body.decode("utf-8"))["message"]).strip()
+        except (ValueError, KeyError, TypeError):
+            await self._send_json(writer, 400, {"error": "Erwartet JSON mit dem Feld 'message'."}, keep_alive)
+            return keep_alive
+        if not message:
+            await self._send_json(writer, 400, {"error": "Die Nachricht ist leer."}, keep_alive)
+            return keep_alive
+        
+        history.append(f"Du: {message}")
+        if self.transcripts:
+            self.transcripts.record(session_id, "user", message)
+        
+        command, args = parse_command(message)
+        if command:
+            payload = self._handle_command(command, args, history)
+            await self._send_json(writer, 200, payload, keep_alive and command != "exit")
+            return keep_alive and command != "exit"
+        
+        # Executor threads don't inherit the task's context; the calls below
+        # run in a copy so their log records carry the request id
+        REQUEST_ID.set(f"http-{uuid.uuid4().hex[:12]}")
+        start = time.perf_counter()
+        if path == "/chat/stream":
+            response = await self._stream_chat(message, history, writer, keep_alive)
+        else:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self.executor, contextvars.copy_context().run,
+                self.response_generator.generate_response, message, list(history)
+            )
+            await self._send_json(writer, 200, {"response": response}, keep_alive)
+        log_request_timing(start, path)
+        history.append(f"Assistent: {response}")
+        if self.transcripts:
+            self.transcripts.record(session_id, "assistant", response)
+        return keep_alive
+    
+    def _handle_command(self, command, args, history):
+        """Answer a parsed command without touching the server's desktop."""
+        if COMMANDS.get(command).desktop:
+            return {"command": command, "args": args}
+        frontend = ServerCommandContext(history, self.transcripts)
+        COMMANDS.dispatch(frontend, command, args)
+        return {"command": command, "response": "\n".join(frontend.responses)}
+    
+    async def _stream_chat(self, message, history, writer, keep_alive):
+        """Send the response as chunked NDJSON while it is being generated."""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        
+        cancel_event = threading.Event()
+        
+        def on_chunk(chunk):
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        
+        future = loop.run_in_executor(
+            self.executor,
+            contextvars.copy_context().run,
+            functools.partial(
+                self.stream_generator.generate_response, message, list(history),
+                on_chunk=on_chunk, cancel_event=cancel_event
+            )
+        )
+        future.add_done_callback(lambda _: chunks.put_nowait(None))
+        
+        writer.write(self._status_head(200, "application/x-ndjson", keep_alive, chunked=True))
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                self._write_chunk(writer, {"chunk": chunk})
+                await writer.drain()
+            response = await future
+            self._write_chunk(writer, {"response": response, "done": True})
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            # Client went away: stop generating; the partial answer still
+            # goes into the history
+            cancel_event.set()
+            response = await future
+        return response
+    
+    @staticmethod
+    def _status_head(status, content_type, keep_alive, length=None, chunked=False):
+        """Build the status line and headers."""
+        lines = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            f"Content-Type: {content_type}; charset=utf-8",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if chunked:
+            lines.append("Transfer-Encoding: chunked")
+        else:
+            lines.append(f"Content-Length: {length}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    
+    @staticmethod
+    def _write_chunk(writer, payload):
+        """Write one NDJSON line as an HTTP chunk."""
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+    
+    async def _send_json(self, writer, status, payload, keep_alive):
+        """Send a complete JSON response."""
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(self._status_head(status, "application/json", keep_alive, length=len(data)) + data)
+        await writer.drain()
+
+
+class ServerCommandContext:
+    """Front end of one API command; collects the output for the reply."""
+    
+    def __init__(self, history, transcripts):
+        self.history = history
+        self.transcripts = transcripts
+        self.responses = []
+    
+    def show_response(self, text):
+        self.responses.append(text.strip())
+    
+    def show_info(self, text):
+        self.responses.append(text.strip())
+    
+    def search_history(self, query):
+        self.show_info(search_transcripts(self.transcripts, query))
+    
+    def clear_chat(self):
+        self.history.clear()
+    
+    def exit(self):
+        self.responses.append("Auf Wiedersehen! Bis zum nächsten Mal.")
+
+
+def run_server(host="127.0.0.1", port=8765):
+    """
+    Run the headless HTTP API until interrupted.
+    
+    Args:
+        host (str): Interface to bind; localhost by default
+        port (int): TCP port
+    """
+    server = AssistantServer(host, port)
+    print(f"KI-Assistent API läuft auf http://{host}:{port} (Beenden mit Strg+C)")
+    try:
+        asyncio.run(server.serve_until_stopped())
+    except KeyboardInterrupt:
+        pass
+
+
 # GUI version if PyQt5 is available
 if GUI_AVAILABLE:
-    class GenerateResponseThread(QThread):
-        """Thread for generating responses without blocking the UI."""
+    class ResponseWorker(QThread):
+        """
+        Long-lived worker that answers queued requests one at a time.
+        
+        Requests are served in the order they were submitted, so answers
+        arrive in message order and the model is never used by two threads
+        at once. Every signal carries the id returned by submit().
+        """
         
-        response_ready = pyqtSignal(str)
-        error_occurred = pyqtSignal(str)
+        chunk_ready = pyqtSignal(int, str)
+        response_ready = pyqtSignal(int, str)
+        error_occurred = pyqtSignal(int, str)
+        queue_changed = pyqtSignal(int)
         
-        def __init__(self, response_generator, user_text, chat_history):
-            super().__init__()
-            self.response_generator = response_generator
-            self.user_text = user_text
-            self.chat_history = chat_history
+        def __init__(self, parent=None):
+            super().__init__(parent)
+            self._requests = queue.Queue()
+            self._request_ids = itertools.count(1)
+            self._lock = threading.Lock()
+            self._live = set()        # Queued or running request ids
+            self._cancelled = set()
+            self._running = None
+            self._cancel_event = threading.Event()
+        
+        def submit(self, response_generator, user_text, chat_history):
+            """
+            Queue a request.
+            
+            Args:
+                response_generator: Generator to answer with
+                user_text (str): The user's message
+                chat_history (list): Snapshot of the conversation
+                
+            Returns:
+                int: Request id
+            """
+            request_id = next(self._request_ids)
+            with self._lock:
+                self._live.add(request_id)
+                depth = len(self._live)
+            self._requests.put((request_id, response_generator, user_text, chat_history))
+            self.queue_changed.emit(depth)
+            return request_id
+        
+        def cancel(self, request_id=None):
+            """
+            Cancel a queued or running request, or all of them.
+            
+            Queued requests are skipped; a running one stops generating and
+            its answer is dropped.
+            
+            Returns:
+                list: Ids of the cancelled requests
+            """
+            with self._lock:
+                targets = set(self._live) if request_id is None else self._live & {request_id}
+                self._cancelled |= targets
+                if self._running in targets:
+                    self._cancel_event.set()
+            return sorted(targets)
+        
+        def is_cancelled(self, request_id):
+            """Check whether a request has been cancelled."""
+            with self._lock:
+                return request_id in self._cancelled
+        
+        def pending(self):
+            """Number of queued and running requests."""
+            with self._lock:
+                return len(self._live)
+        
+        def stop(self):
+            """Cancel everything and wait for the worker to finish."""
+            self.cancel()
+            self._requests.put(None)
+            self.wait()
         
         def run(self):
-            """Generate a response in a separate thread."""
+            """Serve queued requests until stop() is called."""
+            while True:
+                item = self._requests.get()
+                if item is None:
+                    break
+                request_id = item[0]
+                with self._lock:
+                    self._running = request_id
+                    self._cancel_event.clear()
+                    skip = request_id in self._cancelled
+                if not skip:
+                    self._serve(*item)
+                with self._lock:
+                    self._running = None
+                    self._live.discard(request_id)
+                    self._cancelled.discard(request_id)
+                    depth = len(self._live)
+                self.queue_changed.emit(depth)
+        
+        def _serve(self, request_id, response_generator, user_text, chat_history):
+            """Generate the answer to one request."""
+            def on_chunk(chunk):
+                if not self.is_cancelled(request_id):
+                    self.chunk_ready.emit(request_id, chunk)
+            
+            token = REQUEST_ID.set(f"gui-{request_id}")
+            start = time.perf_counter()
             try:
-                # Add a short delay to simulate "thinking"
-                time.sleep(0.5 + random.random() * 1.5)
-                response = self.response_generator.generate_response(self.user_text, self.chat_history)
-                self.response_ready.emit(response)
+                # Add a short delay to simulate "thinking"; a cancel cuts it short
+                with METRICS.stage(generator_label(response_generator), "sleep"):
+                    cancelled = self._cancel_event.wait(0.5 + random.random() * 1.5)
+                if cancelled:
+                    return
+                response = response_generator.generate_response(
+                    user_text, chat_history, on_chunk=on_chunk, cancel_event=self._cancel_event
+                )
+                if not self.is_cancelled(request_id):
+                    self.response_ready.emit(request_id, response)
+                    log_request_timing(start, generator_label(response_generator, LAST_ANSWER.tier))
             except Exception as e:
-                logging.error("Error in response generation thread:", exc_info=True)
-                self.error_occurred.emit(f"Entschuldigung, ich konnte keine Antwort generieren. Fehler: {str(e)}")
+                logging.error("Error in response worker:", exc_info=True)
+                if not self.is_cancelled(request_id):
+                    self.error_occurred.emit(
+                        request_id, f"Entschuldigung, ich konnte keine Antwort generieren. Fehler: {str(e)}"
+                    )
+            finally:
+                REQUEST_ID.reset(token)
+    
+    
+    class ModelLoaderThread(QThread):
+        """Thread for loading the transformer model without blocking the UI."""
+        
+        model_ready = pyqtSignal(object)
+        load_failed = pyqtSignal()
+        
+        def run(self):
+            """Load the model in a separate thread."""
+            generator = load_transformer_generator()
+            if generator is not None:
+                self.model_ready.emit(generator)
+            else:
+                self.load_failed.emit()
+    
+    
+    class TranscriptSearchThread(QThread):
+        """Thread for searching the transcripts without blocking the UI."""
+        
+        results_ready = pyqtSignal(str)
+        
+        def __init__(self, store, query, parent=None):
+            super().__init__(parent)
+            self.store = store
+            self.query = query
+        
+        def run(self):
+            """Flush pending messages and search in a separate thread."""
+            self.results_ready.emit(search_transcripts(self.store, self.query))
     
     
     class SettingsDialog(QDialog):
@@ -557,17 +4367,44 @@ if GUI_AVAILABLE:
             self.setWindowTitle("✨ KI-Assistent Deluxe 2.0 ✨")
             self.setGeometry(200, 100, 1000, 800)
             
-            # Initialize response generator
-            if TRANSFORMERS_AVAILABLE:
-                self.response_generator = TransformerResponseGenerator()
-            else:
-                self.response_generator = SimpleResponseGenerator()
+            # Serve simple responses until the transformer model has warmed up
+            self.response_generator = CachedResponseGenerator(SimpleResponseGenerator())
             
             # Setup UI
             self.setup_ui()
             
-            # Initialize chat history
-            self.chat_history = []
+            # Initialize chat history; only recent turns are kept in memory
+            self.chat_history = deque(maxlen=GUI_MAX_HISTORY)
+            
+            # Conversations are kept in the transcript store across sessions
+            self.transcripts = open_transcript_store()
+            self.session_id = uuid.uuid4().hex
+            # Transcript searches running in the background
+            self.search_threads = set()
+            
+            # Every displayed message goes to the scrollback log in display
+            # order; the display holds log entries first_loaded_index..end,
+            # then the messages from the first pending answer on, which are
+            # kept as [request_id, (kind, text) or None] until it arrives
+            self.scrollback = ScrollbackLog()
+            self.first_loaded_index = 0
+            self.unlogged_messages = []
+            self.loading_scrollback = False
+            self.chat_display.verticalScrollBar().valueChanged.connect(self.on_chat_scrolled)
+            
+            # Anchors of the "thinking" placeholders by request id, and of
+            # the bubble of the request that is streaming
+            self.temp_anchors = OrderedDict()
+            self.stream_anchor = None
+            self.stream_request = None
+            
+            # One worker answers all messages in order
+            self.response_worker = ResponseWorker(self)
+            self.response_worker.chunk_ready.connect(self.on_response_chunk)
+            self.response_worker.response_ready.connect(self.on_response_ready)
+            self.response_worker.error_occurred.connect(self.on_response_error)
+            self.response_worker.queue_changed.connect(self.on_queue_changed)
+            self.response_worker.start()
             
             # Add initial system message
             self.add_system_message("Willkommen beim KI-Assistent Deluxe!")
@@ -579,8 +4416,16 @@ if GUI_AVAILABLE:
             self.activation_timer.timeout.connect(self.activate_assistant)
             self.activation_timer.start(300000)  # Every 5 minutes
             
-            # Set status
-            self.status_label.setText("Status: Bereit")
+            # Load the transformer model in the background
+            self.model_loader = None
+            if TRANSFORMERS_AVAILABLE:
+                self.status_label.setText("Status: Bereit – KI-Modell wird geladen...")
+                self.model_loader = ModelLoaderThread()
+                self.model_loader.model_ready.connect(self.on_model_ready)
+                self.model_loader.load_failed.connect(self.on_model_failed)
+                self.model_loader.start()
+            else:
+                self.status_label.setText("Status: Bereit")
         
         def setup_ui(self):
             """Set up the main application UI."""
@@ -682,6 +4527,12 @@ if GUI_AVAILABLE:
             clear_action.triggered.connect(self.clear_chat)
             toolbar.addAction(clear_action)
             
+            # Cancel action
+            cancel_action = QAction("Abbrechen", self)
+            cancel_action.setShortcut("Esc")
+            cancel_action.triggered.connect(self.cancel_requests)
+            toolbar.addAction(cancel_action)
+            
             toolbar.addSeparator()
             
             # Settings action
@@ -699,6 +4550,8 @@ if GUI_AVAILABLE:
             # Chat display area - Larger text and better styling
             self.chat_display = QTextEdit()
             self.chat_display.setReadOnly(True)
+            # Programmatic edits would otherwise pile up on the undo stack
+            self.chat_display.setUndoRedoEnabled(False)
             self.chat_display.setStyleSheet("""
                 background-color: #252526;
                 color: #E0E0E0;
@@ -709,6 +4562,7 @@ if GUI_AVAILABLE:
                 line-height: 1.5;
             """)
             self.main_layout.addWidget(self.chat_display, 1)
+            self.message_formats = self.build_message_formats()
             
             # Input area - Modern styling
             input_widget = QWidget()
@@ -756,6 +4610,10 @@ if GUI_AVAILABLE:
             # Add status label
             self.status_label = QLabel("Status: Initialisierung...")
             self.status_bar.addPermanentWidget(self.status_label)
+            
+            # Add queue depth label
+            self.queue_label = QLabel("Warteschlange: 0")
+            self.status_bar.addPermanentWidget(self.queue_label)
         
         def send_message(self):
             """Process user input and send a message."""
@@ -771,156 +4629,360 @@ if GUI_AVAILABLE:
             if command:
                 self.handle_command(command, args)
             else:
-                # Show thinking indicator
-                self.add_system_message("Ich denke nach...", temp=True)
-                
-                # Generate response in a separate thread
-                self.response_thread = GenerateResponseThread(
-                    self.response_generator, user_text, self.chat_history
+                # Queue the request and show its thinking indicator
+                request_id = self.response_worker.submit(
+                    self.response_generator, user_text, list(self.chat_history)
                 )
-                self.response_thread.response_ready.connect(self.on_response_ready)
-                self.response_thread.error_occurred.connect(self.on_response_error)
-                self.response_thread.start()
+                self.add_system_message("Ich denke nach...", temp=True, request_id=request_id)
             
             # Clear the input field
             self.user_input.clear()
         
         def handle_command(self, command, args):
             """Handle various commands from user input."""
-            if command == "open_program":
-                response = open_program(args)
-                self.add_assistant_message(response)
-            elif command == "open_url":
-                response = open_url(args)
-                self.add_assistant_message(response)
-            elif command == "search":
-                response = web_search(args)
-                self.add_assistant_message(response)
-            elif command == "help":
-                self.show_help()
-            elif command == "clear_chat":
-                self.clear_chat()
-                self.add_system_message("Der Chat wurde gelöscht.")
-            elif command == "exit":
-                self.close()
-        
-        def on_response_ready(self, response):
+            COMMANDS.dispatch(self, command, args)
+        
+        def show_response(self, message):
+            """Command output that belongs to the conversation."""
+            self.add_assistant_message(message)
+        
+        def show_info(self, message):
+            """Command output that is only information."""
+            self.add_system_message(message)
+        
+        def search_history(self, query):
+            """Search the transcripts in the background; the hits arrive as information."""
+            thread = TranscriptSearchThread(self.transcripts, query, self)
+            thread.results_ready.connect(self.show_info)
+            thread.finished.connect(lambda: self.search_threads.discard(thread))
+            self.search_threads.add(thread)
+            thread.start()
+        
+        def exit(self):
+            """Close the window (exit command)."""
+            self.close()
+        
+        def on_model_ready(self, generator):
+            """Switch to the transformer generator once it has loaded."""
+            self.response_generator = CachedResponseGenerator(CascadeRouter(generator))
+            self.status_label.setText("Status: Bereit – KI-Modell geladen")
+        
+        def on_model_failed(self):
+            """Keep the simple generator if the model could not be loaded."""
+            self.status_label.setText("Status: Bereit – einfache Antworten (KI-Modell nicht verfügbar)")
+        
+        def closeEvent(self, event):
+            """Stop the worker threads so they aren't destroyed mid-request."""
+            self.response_worker.stop()
+            for thread in list(self.search_threads):
+                thread.wait()
+            if self.model_loader is not None and self.model_loader.isRunning():
+                self.status_label.setText("Status: Warte auf das KI-Modell...")
+                self.model_loader.wait()
+            if self.transcripts:
+                self.transcripts.close()
+            self.scrollback.close()
+            super().closeEvent(event)
+        
+        def on_response_chunk(self, request_id, chunk):
+            """Grow the assistant bubble with a streamed chunk."""
+            if request_id != self.stream_request:
+                if request_id not in self.temp_anchors:
+                    return  # Cancelled
+                # First chunk: turn the "thinking" message into the bubble
+                self.stream_anchor = self.replace_temp_message("assistant", "Assistent: ", request_id)
+                self.stream_request = request_id
+            
+            cursor = QTextCursor(self.stream_anchor.block())
+            cursor.movePosition(QTextCursor.EndOfBlock)
+            cursor.insertText(self._display_text(chunk), self.message_formats["assistant"][1])
+            self.scroll_to_bottom()
+        
+        def on_response_ready(self, request_id, response):
             """Handle response when it's ready from the generator."""
-            # Remove the "thinking" message if it exists
-            self.remove_temp_messages()
+            if request_id != self.stream_request and request_id not in self.temp_anchors:
+                return  # Cancelled
+            formatted = f"Assistent: {response}"
+            self.chat_history.append(formatted)
             
-            # Add the assistant response to the chat
-            self.add_assistant_message(response)
+            if request_id == self.stream_request:
+                # Replace the streamed raw text with the post-processed answer
+                self._set_message(self.stream_anchor, "assistant", formatted)
+                self.stream_anchor = None
+                self.stream_request = None
+            else:
+                # Replace the "thinking" message with the answer
+                self.replace_temp_message("assistant", formatted, request_id)
+            self.resolve_log_entry(request_id, ("assistant", formatted))
+            self.record_transcript("assistant", response)
+            self.scroll_to_bottom()
         
-        def on_response_error(self, error_message):
+        def on_response_error(self, request_id, error_message):
             """Handle error during response generation."""
+            if request_id == self.stream_request:
+                self._remove_message(self.stream_anchor)
+                self.stream_anchor = None
+                self.stream_request = None
+            
             # Remove the "thinking" message if it exists
-            self.remove_temp_messages()
+            self.remove_temp_messages(request_id)
+            self.resolve_log_entry(request_id)
             
             # Add the error message to the chat
             self.add_system_message(f"Fehler: {error_message}")
         
+        def on_queue_changed(self, depth):
+            """Show how many requests are queued or running."""
+            self.queue_label.setText(f"Warteschlange: {depth}")
+        
+        def cancel_requests(self):
+            """Cancel all queued and running requests."""
+            cancelled = self.response_worker.cancel()
+            if not cancelled:
+                return
+            if self.stream_request in cancelled:
+                self._remove_message(self.stream_anchor)
+                self.stream_anchor = None
+                self.stream_request = None
+            self.remove_temp_messages()
+            for request_id in cancelled:
+                self.resolve_log_entry(request_id)
+            if len(cancelled) == 1:
+                self.add_system_message("Die Anfrage wurde abgebrochen.")
+            else:
+                self.add_system_message(f"{len(cancelled)} Anfragen wurden abgebrochen.")
+        
+        def build_message_formats(self):
+            """
+            Build the block and character formats for each message kind once,
+            so appending a message doesn't parse any HTML or CSS.
+            
+            Returns:
+                dict: kind -> (QTextBlockFormat, QTextCharFormat)
+            """
+            def make(alignment, background, color, margins, pixel_size, italic=False):
+                block_format = QTextBlockFormat()
+                block_format.setAlignment(alignment)
+                block_format.setBackground(QColor(background))
+                top, right, bottom, left = margins
+                block_format.setTopMargin(top)
+                block_format.setRightMargin(right)
+                block_format.setBottomMargin(bottom)
+                block_format.setLeftMargin(left)
+                
+                char_format = QTextCharFormat()
+                char_format.setForeground(QColor(color))
+                char_format.setFontItalic(italic)
+                char_format.setProperty(QTextFormat.FontPixelSize, pixel_size)
+                return block_format, char_format
+            
+            return {
+                "user": make(Qt.AlignRight, "#0078D7", "#FFFFFF", (15, 5, 15, 120), 18),
+                "assistant": make(Qt.AlignLeft, "#252526", "#FFFFFF", (15, 120, 15, 5), 18),
+                "system": make(Qt.AlignCenter, "#2D2D30", "#A0A0A0", (10, 80, 10, 80), 16, italic=True)
+            }
+        
+        @staticmethod
+        def _display_text(text):
+            """Keep a message in one block by turning newlines into line breaks."""
+            return text.replace("\r\n", "\n").replace("\n", "\u2028")
+        
+        def _append_message(self, kind, text):
+            """
+            Append a message block at the end of the chat display.
+            
+            Returns:
+                QTextCursor: Anchor at the start of the new block. Appends
+                happen after it, so it follows the block through later edits.
+            """
+            block_format, char_format = self.message_formats[kind]
+            document = self.chat_display.document()
+            cursor = QTextCursor(document)
+            cursor.movePosition(QTextCursor.End)
+            if document.isEmpty():
+                cursor.setBlockFormat(block_format)
+            else:
+                cursor.insertBlock(block_format, char_format)
+            cursor.insertText(self._display_text(text), char_format)
+            anchor = QTextCursor(cursor.block())
+            self.trim_scrollback()
+            self.scroll_to_bottom()
+            return anchor
+        
+        def _prepend_message(self, kind, text):
+            """Insert a message block at the top of the chat display."""
+            block_format, char_format = self.message_formats[kind]
+            cursor = QTextCursor(self.chat_display.document())
+            # Split off the current first block with its own format, then
+            # fill the new empty block above it
+            cursor.insertBlock(cursor.blockFormat())
+            cursor.movePosition(QTextCursor.PreviousBlock)
+            cursor.setBlockFormat(block_format)
+            cursor.insertText(self._display_text(text), char_format)
+        
+        def trim_scrollback(self):
+            """Drop the oldest blocks once the display holds too many messages."""
+            document = self.chat_display.document()
+            # Trim in pages so the cost is amortized over many appends; only
+            # logged blocks can be paged back in, so pending ones stay
+            excess = min(
+                document.blockCount() - GUI_MAX_MESSAGES,
+                document.blockCount() - len(self.unlogged_messages)
+            )
+            if excess < SCROLLBACK_PAGE_SIZE:
+                return
+            cursor = QTextCursor(document)
+            cursor.setPosition(document.findBlockByNumber(excess).position(), QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+            self.first_loaded_index += excess
+        
+        def load_older_messages(self):
+            """Page older messages back in from the scrollback log."""
+            if self.first_loaded_index <= 0:
+                return
+            start = max(0, self.first_loaded_index - SCROLLBACK_PAGE_SIZE)
+            entries = self.scrollback.read(start, self.first_loaded_index)
+            
+            # Keep the visible messages in place while content grows above them
+            scroll_bar = self.chat_display.verticalScrollBar()
+            old_maximum, old_value = scroll_bar.maximum(), scroll_bar.value()
+            for kind, text in reversed(entries):
+                self._prepend_message(kind, text)
+            self.first_loaded_index = start
+            scroll_bar.setValue(old_value + scroll_bar.maximum() - old_maximum)
+        
+        def on_chat_scrolled(self, value):
+            """Load older messages when the user scrolls to the top."""
+            if self.loading_scrollback or value != self.chat_display.verticalScrollBar().minimum():
+                return
+            self.loading_scrollback = True
+            try:
+                self.load_older_messages()
+            finally:
+                self.loading_scrollback = False
+        
+        def _set_message(self, anchor, kind, text):
+            """Replace the text and style of an existing message block in place."""
+            block_format, char_format = self.message_formats[kind]
+            block = anchor.block()
+            cursor = QTextCursor(block)
+            cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+            cursor.setBlockFormat(block_format)
+            cursor.insertText(self._display_text(text), char_format)
+            
+            # The insert pushed the anchor to the block end; move it back
+            anchor.setPosition(block.position())
+        
+        def _remove_message(self, anchor):
+            """Remove a message block together with its block separator."""
+            block = anchor.block()
+            cursor = QTextCursor(self.chat_display.document())
+            if block.previous().isValid():
+                cursor.setPosition(block.position() - 1)
+                cursor.setPosition(block.position() + block.length() - 1, QTextCursor.KeepAnchor)
+            elif block.next().isValid():
+                cursor.setPosition(block.position())
+                cursor.setPosition(block.next().position(), QTextCursor.KeepAnchor)
+            else:
+                cursor.setPosition(block.position())
+                cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+        
         def add_user_message(self, message):
             """Add a user message to the chat display."""
             formatted = f"Du: {message}"
             self.chat_history.append(formatted)
-            
-            # Create styled message with modern Copilot-like styling
-            self.chat_display.append(f'''
-                <div style="
-                    margin: 15px 5px; 
-                    display: block; 
-                    text-align: right;
-                ">
-                    <div style="
-                        display: inline-block; 
-                        background-color: #0078D7; 
-                        color: #FFFFFF; 
-                        border-radius: 18px; 
-                        padding: 15px 20px; 
-                        max-width: 85%; 
-                        text-align: left;
-                        font-size: 18px;
-                        box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-                    ">
-                        {formatted}
-                    </div>
-                </div>
-            ''')
-            self.scroll_to_bottom()
+            self.log_message("user", formatted)
+            self.record_transcript("user", message)
+            self._append_message("user", formatted)
         
         def add_assistant_message(self, message):
             """Add an assistant message to the chat display."""
             formatted = f"Assistent: {message}"
             self.chat_history.append(formatted)
-            
-            # Create styled message with modern Copilot-like styling
-            self.chat_display.append(f'''
-                <div style="
-                    margin: 15px 5px; 
-                    display: block;
-                ">
-                    <div style="
-                        display: inline-block; 
-                        background-color: #252526; 
-                        color: #FFFFFF; 
-                        border-radius: 18px; 
-                        padding: 15px 20px; 
-                        max-width: 85%; 
-                        border-left: 4px solid #0078D7;
-                        font-size: 18px;
-                        box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-                    ">
-                        {formatted}
-                    </div>
-                </div>
-            ''')
-            self.scroll_to_bottom()
+            self.log_message("assistant", formatted)
+            self.record_transcript("assistant", message)
+            self._append_message("assistant", formatted)
         
-        def add_system_message(self, message, temp=False):
-            """Add a system message to the chat display."""
-            # System messages are not added to chat history
-            
-            # Create styled message with a system indicator and modern styling
-            temp_class = 'class="temp-message"' if temp else ''
-            self.chat_display.append(f'''
-                <div {temp_class} style="
-                    margin: 10px auto;
-                    text-align: center;
-                ">
-                    <div style="
-                        display: inline-block;
-                        background-color: #2D2D30;
-                        color: #A0A0A0;
-                        border-radius: 15px;
-                        padding: 8px 15px;
-                        font-style: italic;
-                        font-size: 16px;
-                        max-width: 80%;
-                    ">
-                        System: {message}
-                    </div>
-                </div>
-            ''')
-            self.scroll_to_bottom()
+        def record_transcript(self, role, message):
+            """Queue a message for the transcript store (write-behind)."""
+            if self.transcripts:
+                self.transcripts.record(self.session_id, role, message)
         
-        def remove_temp_messages(self):
-            """Remove temporary messages from the display."""
-            # Get current HTML
-            html = self.chat_display.toHtml()
+        def add_system_message(self, message, temp=False, request_id=None):
+            """
+            Add a system message to the chat display.
             
-            # Remove divs with class="temp-message"
-            html = re.sub(r'<div[^>]*class="temp-message"[^>]*>.*?</div>', '', html, flags=re.DOTALL)
+            Temporary messages are kept under the request they belong to.
+            """
+            # System messages are not added to chat history; temporary ones
+            # hold the log position of their answer instead
+            formatted = f"System: {message.strip()}"
+            if temp:
+                self.unlogged_messages.append([request_id, None])
+            else:
+                self.log_message("system", formatted)
+            anchor = self._append_message("system", formatted)
+            if temp:
+                self.temp_anchors[request_id] = anchor
+        
+        def log_message(self, kind, text):
+            """Write a displayed message to the scrollback log, after any pending answer above it."""
+            if self.unlogged_messages:
+                self.unlogged_messages.append([None, (kind, text)])
+            else:
+                self.scrollback.append(kind, text)
+        
+        def resolve_log_entry(self, request_id, entry=None):
+            """
+            Fill in the log position a request's "thinking" message held, or
+            drop it without an entry, and write out the messages that no
+            longer wait for an earlier answer.
+            """
+            for index, (pending_id, pending_entry) in enumerate(self.unlogged_messages):
+                if pending_id == request_id and pending_entry is None:
+                    if entry is None:
+                        del self.unlogged_messages[index]
+                    else:
+                        self.unlogged_messages[index][1] = entry
+                    break
+            else:
+                # The answer was appended at the end, not in a placeholder
+                if entry is not None:
+                    self.log_message(*entry)
+                return
+            while self.unlogged_messages and self.unlogged_messages[0][1] is not None:
+                self.scrollback.append(*self.unlogged_messages.pop(0)[1])
+        
+        def replace_temp_message(self, kind, text, request_id=None):
+            """
+            Turn the temporary message of a request into a regular message in
+            place, or append one if the request has no temporary message.
             
-            # Set the modified HTML back
-            self.chat_display.setHtml(html)
-            self.scroll_to_bottom()
+            Returns:
+                QTextCursor: Anchor of the message block
+            """
+            anchor = self.temp_anchors.pop(request_id, None)
+            if anchor is None:
+                return self._append_message(kind, text)
+            self._set_message(anchor, kind, text)
+            return anchor
+        
+        def remove_temp_messages(self, request_id=None):
+            """Remove the temporary message of a request, or all of them."""
+            if request_id is not None:
+                anchor = self.temp_anchors.pop(request_id, None)
+                if anchor is not None:
+                    self._remove_message(anchor)
+                return
+            for anchor in self.temp_anchors.values():
+                self._remove_message(anchor)
+            self.temp_anchors.clear()
         
         def scroll_to_bottom(self):
             """Scroll chat display to the bottom to show latest messages."""
-            cursor = self.chat_display.textCursor()
-            cursor.movePosition(QTextCursor.End)
-            self.chat_display.setTextCursor(cursor)
+            scroll_bar = self.chat_display.verticalScrollBar()
+            scroll_bar.setValue(scroll_bar.maximum())
         
         def show_help(self):
             """Show help information."""
@@ -928,7 +4990,16 @@ if GUI_AVAILABLE:
         
         def clear_chat(self):
             """Clear the chat history and display."""
-            self.chat_history = []
+            self.chat_history.clear()
+            self.session_id = uuid.uuid4().hex
+            self.scrollback.clear()
+            self.first_loaded_index = 0
+            self.unlogged_messages = []
+            # Answers to the old conversation would land in the new one
+            self.response_worker.cancel()
+            self.temp_anchors.clear()
+            self.stream_anchor = None
+            self.stream_request = None
             self.chat_display.clear()
             self.add_system_message("Chat gelöscht. Wie kann ich dir helfen?")
         
@@ -981,36 +5052,126 @@ if GUI_AVAILABLE:
 
 
 # CLI version for systems without PyQt5
-def cli_main():
-    """Main function to run the CLI assistant."""
-    # Print welcome message with ASCII art
+def print_cli_banner():
+    """Print the ASCII art banner of the CLI."""
     print(ASCII_LOGO)
     print("\n" + "=" * 80)
     print("✨  KI-Assistent Deluxe - CLI Version  ✨".center(80))
     print("=" * 80 + "\n")
+
+
+class CliFrontend:
+    """Chat state of the CLI and the front end its commands act on."""
+    
+    def __init__(self, transcripts):
+        self.chat_history = deque(maxlen=20)  # Only keep the last 20 messages
+        self.transcripts = transcripts
+        self.session_id = uuid.uuid4().hex
+        self.running = True
+    
+    def remember(self, prefix, role, message):
+        """Add a message to the chat history and the transcript store."""
+        self.chat_history.append(f"{prefix}: {message}")
+        if self.transcripts:
+            self.transcripts.record(self.session_id, role, message)
+    
+    def show_response(self, text):
+        print(f"Assistent: {text}")
+        self.remember("Assistent", "assistant", text)
+    
+    def show_info(self, text):
+        print("\n" + text)
+    
+    def search_history(self, query):
+        self.show_info(search_transcripts(self.transcripts, query))
+    
+    def clear_chat(self):
+        self.chat_history.clear()
+        self.session_id = uuid.uuid4().hex
+        os.system('cls' if os.name == 'nt' else 'clear')
+        print_cli_banner()
+    
+    def exit(self):
+        print("\nAuf Wiedersehen! Bis zum nächsten Mal.")
+        if self.transcripts:
+            self.transcripts.close()
+        self.running = False
+
+
+class StreamPrinter:
+    """
+    Prints a streamed answer to the terminal once it is post-processed.
+    
+    The chunks go through the same SentenceFilter as the model's answer, so
+    only finished sentences are shown and a repeat or an invented next turn
+    never is; finish() adds what the final answer has beyond that.
+    """
+    
+    def __init__(self, prefix="Assistent: "):
+        self.prefix = prefix
+        self.sentence_filter = SentenceFilter(TransformerResponseGenerator.STOP_STRINGS)
+        self.shown = ""
+    
+    def feed(self, chunk):
+        """Shows the sentences the chunk finished."""
+        self.sentence_filter.feed(chunk)
+        text = " ".join(self.sentence_filter.sentences)
+        if len(text) > len(self.shown):
+            self._show(text)
+    
+    def finish(self, response):
+        """Completes the shown text to the final answer."""
+        if self.shown and not response.startswith(self.shown):
+            # The answer changed after it was shown, e.g. to an error message
+            print()
+            self.shown = ""
+        self._show(response)
+        print()
+    
+    def _show(self, text):
+        if not self.shown:
+            print(self.prefix, end="")
+        print(text[len(self.shown):], end="", flush=True)
+        self.shown = text
+
+
+def cli_main():
+    """Main function to run the CLI assistant."""
+    # Print welcome message with ASCII art
+    print_cli_banner()
     
     print("Willkommen beim KI-Assistent Deluxe!")
     print("Ich bin dein persönlicher Assistent und stehe dir mit Rat und Tat zur Seite.")
     print("Tippe 'hilfe' um zu sehen, was ich alles kann.")
     print("Zum Beenden tippe 'exit', 'quit' oder 'beenden'.\n")
     
-    # Initialize the appropriate response generator
+    # Serve simple responses until the transformer model has warmed up
+    response_generator = CachedResponseGenerator(SimpleResponseGenerator())
+    warmup_result = {}
     if TRANSFORMERS_AVAILABLE:
-        print("Lade KI-Modell, bitte warten...")
-        response_generator = TransformerResponseGenerator()
-        if response_generator.is_model_loaded():
-            print("KI-Modell erfolgreich geladen!\n")
-        else:
-            print("Konnte KI-Modell nicht laden, verwende einfache Antworten.\n")
-            response_generator = SimpleResponseGenerator()
-    else:
-        response_generator = SimpleResponseGenerator()
+        print("Lade KI-Modell im Hintergrund, bis dahin antworte ich mit einfachen Antworten.\n")
+        
+        def warm_up():
+            warmup_result["generator"] = load_transformer_generator()
+        
+        threading.Thread(target=warm_up, daemon=True).start()
+    
+    # Chat history; every message is also written to the transcript store
+    frontend = CliFrontend(open_transcript_store())
     
-    # Initialize chat history
-    chat_history = deque(maxlen=20)  # Only keep the last 20 messages
+    log_startup_timing("cli")
     
     # Main interaction loop
     while True:
+        # Switch to the transformer model once the warm-up has finished
+        if "generator" in warmup_result:
+            generator = warmup_result.pop("generator")
+            if generator is not None:
+                response_generator = CachedResponseGenerator(CascadeRouter(generator))
+                print("KI-Modell erfolgreich geladen!\n")
+            else:
+                print("Konnte KI-Modell nicht laden, verwende einfache Antworten.\n")
+        
         # Get user input
         user_text = input("Du: ").strip()
         
@@ -1019,48 +5180,34 @@ def cli_main():
             continue
         
         # Add user input to chat history
-        chat_history.append(f"Du: {user_text}")
+        frontend.remember("Du", "user", user_text)
         
-        # Parse commands
+        # Parse and handle commands
         command, args = parse_command(user_text)
-        
-        # Handle commands
-        if command == "exit":
-            print("\nAuf Wiedersehen! Bis zum nächsten Mal.")
-            break
-        elif command == "help":
-            print("\n" + get_help_text())
-        elif command == "clear_chat":
-            chat_history.clear()
-            print("\nDer Chat wurde gelöscht.")
-            os.system('cls' if os.name == 'nt' else 'clear')
-            print(ASCII_LOGO)
-            print("\n" + "=" * 80)
-            print("✨  KI-Assistent Deluxe - CLI Version  ✨".center(80))
-            print("=" * 80 + "\n")
-        elif command == "open_program":
-            response = open_program(args)
-            print(f"Assistent: {response}")
-            chat_history.append(f"Assistent: {response}")
-        elif command == "open_url":
-            response = open_url(args)
-            print(f"Assistent: {response}")
-            chat_history.append(f"Assistent: {response}")
-        elif command == "search":
-            response = web_search(args)
-            print(f"Assistent: {response}")
-            chat_history.append(f"Assistent: {response}")
+        if command:
+            COMMANDS.dispatch(frontend, command, args)
+            if not frontend.running:
+                break
         else:
             # Generate a response
             print("Assistent: Ich denke nach...")
             
             # Use a separate thread for generating responses to keep the CLI responsive
             def generate_in_thread():
+                REQUEST_ID.set(f"cli-{uuid.uuid4().hex[:12]}")
+                start = time.perf_counter()
+                
                 # Simulate thinking time
                 time.sleep(0.5 + random.random() * 1.5)
-                response = response_generator.generate_response(user_text, list(chat_history))
-                print(f"Assistent: {response}")
-                chat_history.append(f"Assistent: {response}")
+                
+                # Print sentences as they are finished
+                printer = StreamPrinter()
+                response = response_generator.generate_response(
+                    user_text, list(frontend.chat_history), on_chunk=printer.feed
+                )
+                printer.finish(response)
+                frontend.remember("Assistent", "assistant", response)
+                log_request_timing(start, generator_label(response_generator, LAST_ANSWER.tier))
             
             # Start thread and wait for it to complete
             thread = threading.Thread(target=generate_in_thread)
@@ -1070,14 +5217,33 @@ def cli_main():
         print()  # Add an empty line for better readability
 
 
+IMPORT_SECONDS = time.perf_counter() - STARTUP_TIME
+
+
 # Main entry point
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KI-Assistent Deluxe")
+    parser.add_argument("--serve", action="store_true", help="Startet die lokale HTTP-API statt GUI/CLI")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse der HTTP-API")
+    parser.add_argument("--port", type=int, default=8765, help="Port der HTTP-API")
+    parser.add_argument("--build-knowledge", metavar="JSONL",
+                        help="Baut die Wissensdatenbank aus einer JSON-Lines-Datei mit Textausschnitten")
+    options = parser.parse_args()
+    
+    load_command_plugins()
     try:
-        if GUI_AVAILABLE:
+        if options.build_knowledge:
+            index = build_knowledge_index(options.build_knowledge)
+            print(f"Wissensdatenbank mit {index.document_count} Einträgen gespeichert: {KNOWLEDGE_INDEX_PATH}")
+        elif options.serve:
+            # Start the headless HTTP API
+            run_server(options.host, options.port)
+        elif GUI_AVAILABLE:
             # Start the GUI version
             app = QApplication(sys.argv)
             window = KI_Assistent()
             window.show()
+            QTimer.singleShot(0, lambda: log_startup_timing("gui"))
             sys.exit(app.exec_())
         else:
             # Start the CLI version
@@ -0,0 +1,36 @@
+"""StreamPrinter output of a streamed answer in the CLI."""
+
+import main
+
+
+def stream(capsys, chunks, response):
+    printer = main.StreamPrinter()
+    for chunk in chunks:
+        printer.feed(chunk)
+    shown = capsys.readouterr().out
+    printer.finish(response)
+    return shown, shown + capsys.readouterr().out
+
+
+def test_only_finished_sentences_are_streamed(capsys):
+    shown, output = stream(
+        capsys, ["Python ist eine ", "Sprache. Sie ist ", "einfach"], "Python ist eine Sprache. Sie ist einfach."
+    )
+
+    assert shown == "Assistent: Python ist eine Sprache."
+    assert output == "Assistent: Python ist eine Sprache. Sie ist einfach.\n"
+
+
+def test_invented_turn_is_never_printed(capsys):
+    _, output = stream(
+        capsys, ["Gern geschehen! ", "Gern geschehen! Benu", "tzer: Danke"], "Gern geschehen!"
+    )
+
+    assert output == "Assistent: Gern geschehen!\n"
+
+
+def test_changed_answer_is_printed_again(capsys):
+    error = "Entschuldigung, bei der Generierung der Antwort ist ein Fehler aufgetreten."
+    _, output = stream(capsys, ["Das ist so. ", "Und"], error)
+
+    assert output == f"Assistent: Das ist so.\nAssistent: {error}\n"
@@ -0,0 +1,63 @@
+"""IntentClassifier on the keyword and topic tables."""
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(not main.NUMPY_AVAILABLE, reason="numpy not installed")
+
+
+@pytest.fixture(scope="module")
+def generator():
+    return main.SimpleResponseGenerator()
+
+
+@pytest.mark.parametrize("text", ["am besten", "Wie lernen Kinder am besten?", "Was ist der beste Tag?"])
+def test_one_word_of_a_multi_word_example_is_not_enough(generator, text):
+    intent, score = generator.classifier.classify(text, generator.intent_min_score)
+    assert intent is None, (intent, score)
+
+
+@pytest.mark.parametrize("text, category", [
+    ("besten dank", "thanks"), ("vielen dank dafür", "thanks"), ("was kanst du", "capabilities"),
+    ("wie spaet", "time"), ("welcher tag ist heute", "date"),
+])
+def test_multi_word_examples_tolerate_typos_and_extra_words(generator, text, category):
+    intent, _ = generator.classifier.classify(text, generator.intent_min_score)
+    assert intent == ("keyword", category)
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("Hallo!", ("keyword", "greeting")), ("Dankeschön", ("keyword", "thanks")), ("Ich mag Musik", ("topic", "musik")),
+])
+def test_whole_word_hits_skip_the_classifier(text, intent):
+    generator = main.SimpleResponseGenerator()
+    assert generator.classify_intent(text) == (intent, 1.0)
+    assert generator._classifier is None
+
+
+@pytest.mark.parametrize("text", ["nichts", "schifffahrt", "hilf mir bei python"])
+def test_hits_inside_words_or_disagreeing_go_to_the_classifier(generator, text):
+    assert generator.exact_intent(text) is None
+
+
+def test_classifier_does_not_load_answer_tables():
+    generator = main.SimpleResponseGenerator()
+    calls = []
+    generator.responses["extra"] = lambda: calls.append("extra") or ["Extra-Antwort"]
+
+    # Misspelt, so the classifier decides
+    generator.generate_response("halo")
+
+    assert calls == []
+    assert [category for category in generator.responses if generator.responses.is_compiled(category)] == ["greeting"]
+
+
+@pytest.mark.parametrize("text", ["uhrzet bitte", "Wie spät ist es?", "welcher tag ist heute"])
+def test_time_answers_are_time_dependent(generator, text):
+    assert generator.match_intent(text)[1] in ("time", "date")
+    assert generator.is_time_dependent(text)
+
+
+def test_other_answers_are_not_time_dependent(generator):
+    assert not generator.is_time_dependent("Danke!")
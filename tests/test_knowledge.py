@@ -0,0 +1,40 @@
+"""Knowledge snippet lookup with the BM25 index."""
+
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def generator():
+    generator = main.SimpleResponseGenerator()
+    # The in-memory index of the built-in topics, whatever is on disk
+    generator._knowledge = main.KnowledgeIndex.build(generator.extended_responses.items())
+    return generator
+
+
+@pytest.mark.parametrize("text, topic", [
+    ("Was ist Hardware?", "computer"), ("Was bedeutet maschinelles Lernen?", "künstliche intelligenz"),
+    ("Was sind soziale Medien", "internet"),
+])
+def test_matching_snippets_are_found(generator, text, topic):
+    assert generator.lookup_knowledge(text) == generator.extended_responses[topic]
+
+
+@pytest.mark.parametrize("text", ["Wie lernen Kinder am besten?", "Ich lerne gerne"])
+def test_one_shared_word_is_not_enough_on_a_small_index(generator, text):
+    assert generator.lookup_knowledge(text) is None
+
+
+def test_build_creates_the_index_directory(tmp_path):
+    source = tmp_path / "snippets.jsonl"
+    source.write_text(json.dumps({"title": "Jazz", "text": "Jazz entstand in New Orleans."}) + "\n", encoding="utf-8")
+
+    index = main.build_knowledge_index(str(source), str(tmp_path / "data" / "knowledge.idx"))
+    try:
+        assert index.document_count == len(main.SimpleResponseGenerator().extended_responses) + 1
+        assert index.search("Jazz New Orleans", limit=1, min_terms=2)
+    finally:
+        index.close()
@@ -0,0 +1,23 @@
+"""Structured log records passing through the logging queue."""
+
+import json
+import logging
+import queue
+
+import main
+
+
+def test_json_lines_keep_the_exception_field():
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger("test_json_lines")
+    logger.propagate = False
+    logger.addHandler(main.TracebackQueueHandler(log_queue))
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.error("Fehler bei %s", "Anfrage", exc_info=True)
+
+    entry = json.loads(main.JsonLinesFormatter().format(log_queue.get_nowait()))
+
+    assert entry["message"] == "Fehler bei Anfrage"
+    assert entry["exception"].endswith("ZeroDivisionError: division by zero")
@@ -0,0 +1,144 @@
+"""CachedResponseGenerator in front of the cascade."""
+
+import threading
+import types
+
+import main
+
+
+class CountingModel:
+    """Stands in for the model tier and numbers its answers."""
+
+    def __init__(self, end_reason="eos"):
+        self.calls = 0
+        self.end_reason = end_reason
+
+    def generate_response(self, user_text, chat_history=None, on_chunk=None, cancel_event=None):
+        self.calls += 1
+        response = f"Antwort {self.calls}"
+        main.LAST_ANSWER.end_reason = self.end_reason
+        if on_chunk:
+            on_chunk(response)
+        return response
+
+
+class WordTokenizer:
+    """One token per word, enough for ConversationContext."""
+
+    def __call__(self, text, add_special_tokens=False):
+        return types.SimpleNamespace(input_ids=list(range(len(text.split()))))
+
+
+class PackingModel(CountingModel):
+    """Model tier whose prompt holds the newest turns that fit a small token budget."""
+
+    def __init__(self, token_budget):
+        super().__init__()
+        self.context = main.ConversationContext(WordTokenizer(), token_budget)
+
+    def context_turns(self, user_text, chat_history=None):
+        return self.context.packed_turns(user_text, chat_history)
+
+
+def make_cached(model):
+    rules = main.SimpleResponseGenerator()
+    return main.CachedResponseGenerator(main.CascadeRouter(model, rules), main.ResponseCache(), rules)
+
+
+def test_model_answers_are_cached_per_history():
+    model = CountingModel()
+    cached = make_cached(model)
+    history = ["Du: Erzähl mir von Python", "Assistent: Python ist eine Programmiersprache."]
+
+    first = cached.generate_response("Was ist daran besonders?")
+    assert cached.generate_response("was ist daran besonders") == first
+    assert cached.generate_response("Was ist daran besonders?", history) != first
+    assert cached.generate_response("Was ist daran besonders?", history + ["Du: Was ist daran besonders?"]) == "Antwort 2"
+    assert model.calls == 2
+
+
+def test_repeated_question_hits_mid_conversation():
+    model = PackingModel(token_budget=12)
+    cached = make_cached(model)
+    first = cached.generate_response("Was ist daran besonders?")
+
+    # The long last answer doesn't fit the budget, so the prompt holds no history
+    history = [
+        "Du: Was ist daran besonders?", f"Assistent: {first}",
+        "Du: Erzähl mir etwas", "Assistent: " + "sehr lang " * 10,
+    ]
+    assert cached.generate_response("was ist daran besonders", history + ["Du: was ist daran besonders"]) == first
+    assert model.calls == 1
+
+    # Short turns fit and change the prompt
+    history += ["Du: Und?", "Assistent: Kurz."]
+    assert cached.generate_response("Was ist daran besonders?", history) == "Antwort 2"
+
+
+def test_rule_answers_are_not_cached():
+    model = CountingModel()
+    cached = make_cached(model)
+
+    for _ in range(3):
+        cached.generate_response("Danke!")
+
+    assert model.calls == 0
+    assert cached.cache.stats()["size"] == 0
+
+
+def test_cut_off_answers_are_not_cached():
+    for end_reason in ("budget", "max_tokens", "cancelled"):
+        model = CountingModel(end_reason)
+        cached = make_cached(model)
+
+        cached.generate_response("Was ist daran besonders?")
+        cached.generate_response("Was ist daran besonders?")
+
+        assert model.calls == 2
+
+
+class BlockingBatchModel:
+    """Stands in for a TransformerResponseGenerator whose batch waits for a release."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.last_end_reasons = []
+
+    def generate_batch(self, user_texts, chat_histories=None):
+        self.started.set()
+        self.release.wait(5)
+        self.last_end_reasons = ["eos"] * len(user_texts)
+        return [f"Antwort auf {text}" for text in user_texts]
+
+
+def test_batch_scheduler_honors_cancel_event():
+    model = BlockingBatchModel()
+    scheduler = main.BatchScheduler(model, max_wait_ms=0)
+    running = threading.Thread(target=scheduler.generate_response, args=("Erste Frage",))
+    running.start()
+    assert model.started.wait(5)
+
+    # Queued behind the running batch, so it is dropped without being generated
+    cancel_event = threading.Event()
+    cancel_event.set()
+    assert scheduler.generate_response("Zweite Frage", cancel_event=cancel_event) == ""
+    assert main.LAST_ANSWER.end_reason == "cancelled"
+
+    model.release.set()
+    running.join(5)
+    assert scheduler.generate_response("Dritte Frage") == "Antwort auf Dritte Frage"
+    assert main.LAST_ANSWER.end_reason == "eos"
+    scheduler.close()
+    assert scheduler.requests == 2
+
+
+def test_generator_label_names_the_answering_tier():
+    cached = make_cached(CountingModel())
+
+    cached.generate_response("Danke!")
+    assert main.generator_label(cached, main.LAST_ANSWER.tier) == "SimpleResponseGenerator"
+    cached.generate_response("Was ist daran besonders?")
+    assert main.generator_label(cached, main.LAST_ANSWER.tier) == "CountingModel"
+    cached.generate_response("Was ist daran besonders?")
+    assert main.generator_label(cached, main.LAST_ANSWER.tier) == "CachedResponseGenerator"
@@ -0,0 +1,96 @@
+"""Assisted decoding with tiny locally built main/draft model pairs."""
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(not main.TRANSFORMERS_AVAILABLE, reason="torch/transformers not installed")
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    from benchmarks import build_tiny_tokenizer
+    return build_tiny_tokenizer()
+
+
+@pytest.fixture
+def model_pair():
+    from benchmarks import build_tiny_model_pair
+    return build_tiny_model_pair(matched=True, num_layers=4, hidden_size=128)
+
+
+def make_generator(model, tokenizer, draft_model=None):
+    generator = main.TransformerResponseGenerator(model=model, tokenizer=tokenizer, draft_model=draft_model)
+    generator.max_length = 24
+    generator.deadline_ms = 0
+    generator.stop_strings = ()
+    # Greedy decoding, so assisted and plain generation must agree token for token
+    generator._sampling_kwargs = lambda: dict(num_return_sequences=1, do_sample=False)
+    return generator
+
+
+def test_greedy_assisted_output_equals_plain_output(model_pair, tokenizer):
+    main_model, draft_model = model_pair
+    generator = make_generator(main_model, tokenizer)
+    plain = [generator.generate_response(text) for text in ("Hallo, wie geht es dir?", "Was ist Python?")]
+
+    generator.set_draft_model(draft_model)
+    assisted = [generator.generate_response(text) for text in ("Hallo, wie geht es dir?", "Was ist Python?")]
+
+    assert assisted == plain
+    assert generator.speculation.drafted > 0
+
+
+def test_monitor_falls_back_below_min_acceptance_and_retries():
+    monitor = main.SpeculationMonitor(min_acceptance=0.5, retry_after=3)
+    assert monitor.use_draft()
+    monitor.record(drafted=10, accepted=8)
+    assert monitor.use_draft()
+    assert monitor.fallbacks == 0
+
+    # One bad request only pulls the moving average to 0.56
+    monitor.record(drafted=10, accepted=0)
+    assert monitor.fallbacks == 0
+    assert monitor.use_draft()
+
+    # A second one drops it below 0.5: plain decoding for 3 requests
+    monitor.record(drafted=10, accepted=0)
+    assert monitor.fallbacks == 1
+    assert monitor.stats()["active"] is False
+    assert [monitor.use_draft() for _ in range(3)] == [False, False, False]
+
+    # Then the draft gets another try, judged on its own numbers
+    assert monitor.use_draft()
+    assert monitor.acceptance is None
+    monitor.record(drafted=10, accepted=7)
+    assert monitor.use_draft()
+    assert monitor.stats()["drafted"] == 40
+    assert monitor.stats()["accepted"] == 15
+
+
+def test_monitor_ignores_requests_without_drafts():
+    monitor = main.SpeculationMonitor(min_acceptance=0.5, retry_after=3)
+    monitor.record(drafted=0, accepted=0)
+    assert monitor.acceptance is None
+    assert monitor.use_draft()
+
+
+def test_set_draft_model_none_removes_forward_pre_hook(model_pair, tokenizer):
+    main_model, draft_model = model_pair
+    generator = make_generator(main_model, tokenizer, draft_model=draft_model)
+    assert len(draft_model._forward_pre_hooks) == 1
+
+    generator.set_draft_model(None)
+
+    assert generator.draft_model is None
+    assert len(draft_model._forward_pre_hooks) == 0
+
+
+def test_draft_forwards_are_counted_per_generation(model_pair, tokenizer):
+    main_model, draft_model = model_pair
+    generator = make_generator(main_model, tokenizer, draft_model=draft_model)
+    generator.generate_response("Hallo")
+    first = generator.speculation.drafted
+    generator.generate_response("Hallo")
+    # Each generation runs in its own thread, so its count starts at zero
+    assert 0 < generator.speculation.drafted - first <= 2 * first